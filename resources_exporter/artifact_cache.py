@@ -0,0 +1,257 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import typing
+
+from . import utils
+
+_code_fingerprints:typing.Dict[type, str] = {}
+
+def get_code_fingerprint(cls:type) -> str:
+    """hash of source files of *cls* and its base classes"""
+    if cls not in _code_fingerprints:
+        module_files = set()
+        for base in cls.__mro__:
+            module_file = getattr(sys.modules.get(base.__module__, None), "__file__", None)
+            if module_file: module_files.add(module_file)
+        hasher = hashlib.blake2b(digest_size=16)
+        for module_file in sorted(module_files):
+            hasher.update(Path(module_file).read_bytes())
+        _code_fingerprints[cls] = hasher.hexdigest()
+    return _code_fingerprints[cls]
+
+class ArtifactCache():
+    """
+    Content addressed cache of export outputs, stored in *root*:
+
+        objects/<hash[:2]>/<hash>      contents of output files
+        entries/<key[:2]>/<key>.json   {"outputs": [[output path, object hash, size], ...]}
+
+    Key of an entry is made by `make_key` from everything the export depends on.
+    Output paths are relative to the output folder. Same output of many entries is stored once.
+    Entry mtime is the time it was last used, the least recently used entries are removed
+    when the cache grows over *max_size_mb*.
+    Files are published with a rename, so other processes never see them half-written,
+    and objects are published before the entry using them.
+    With *shared* cache, like a team folder on a network drive, entries are read through it
+    into this cache, and are published into it on `put`. *max_size_mb* 0 - no size limit.
+    """
+    VERSION = "1"
+
+    def __init__(self, root:Path, max_size_mb:float=10240, shared:"ArtifactCache"=None) -> None:
+        self.root = Path(root)
+        self.max_size_mb:float = max_size_mb
+        self.shared:ArtifactCache = shared
+        self._lock = threading.Lock()
+        # size of objects, is counted on first `put`
+        self._size:int = None
+
+    @property
+    def max_size(self) -> int:
+        return int(self.max_size_mb*1024*1024)
+
+    @staticmethod
+    def make_key(parts:typing.Iterable[typing.Union[str, bytes]]) -> str:
+        hasher = hashlib.blake2b(digest_size=20)
+        hasher.update(ArtifactCache.VERSION.encode())
+        for part in parts:
+            part = part.encode() if isinstance(part, str) else bytes(part)
+            # length prefix, so ("ab", "c") and ("a", "bc") are different keys
+            hasher.update(len(part).to_bytes(8, "little"))
+            hasher.update(part)
+        return hasher.hexdigest()
+
+    def _entry_path(self, key:str) -> Path:
+        return self.root/"entries"/key[:2]/(key+".json")
+
+    def _object_path(self, object_hash:str) -> Path:
+        return self.root/"objects"/object_hash[:2]/object_hash
+
+    def _publish(self, filepath:Path, write:typing.Callable[[str], None]):
+        """*write* makes a temporary file by its path, then it is renamed into *filepath*"""
+        utils.make_dirs_to_file(filepath)
+        fd, tmp_path = tempfile.mkstemp(prefix="."+filepath.name+".", suffix=".tmp", dir=filepath.parent)
+        os.close(fd)
+        try:
+            write(tmp_path)
+            # mode of a hardlink is mode of the cache object
+            if os.stat(tmp_path).st_nlink == 1: utils.set_replacing_file_mode(tmp_path, filepath)
+            try:
+                os.replace(tmp_path, filepath)
+            except PermissionError:
+                # on windows a file being read can not be replaced, it was published by another writer
+                if not filepath.exists(): raise
+                os.remove(tmp_path)
+        except:
+            if os.path.exists(tmp_path): os.remove(tmp_path)
+            raise
+
+    def _has_object(self, object_hash:str, size:int) -> bool:
+        object_stat = utils.file_fingerprint(self._object_path(object_hash))
+        return object_stat is not None and object_stat[0] == size
+
+    def get(self, key:str) -> dict:
+        """
+        entry of *key* if all its objects are there, else `None`. marks the entry as used.
+        entry missing here is copied from shared cache
+        """
+        entry_path = self._entry_path(key)
+        try:
+            entry = json.loads(entry_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            entry = None
+        if entry is not None and all(self._has_object(object_hash, size) for _, object_hash, size in entry["outputs"]):
+            try: os.utime(entry_path)
+            except OSError: pass
+            return entry
+        if self.shared is None: return None
+        entry = self.shared.get(key)
+        if entry is not None: self.import_entry(key, entry, self.shared)
+        return entry
+
+    def import_entry(self, key:str, entry:dict, source:"ArtifactCache"):
+        """copies *entry* of *source* cache with objects it does not have here"""
+        added_size = 0
+        for _, object_hash, size in entry["outputs"]:
+            if self._has_object(object_hash, size): continue
+            source_path = source._object_path(object_hash)
+            self._publish(self._object_path(object_hash), lambda tmp_path: shutil.copyfile(source_path, tmp_path))
+            added_size += size
+        self._write_entry(key, entry)
+        self._add_size(added_size)
+
+    def _write_entry(self, key:str, entry:dict):
+        entry_text = json.dumps(entry, indent=1)
+        self._publish(self._entry_path(key), lambda tmp_path: Path(tmp_path).write_text(entry_text, encoding="utf-8"))
+
+    def _add_size(self, added_size:int):
+        """prunes the cache when it grows over max size"""
+        if self.max_size_mb <= 0: return
+        with self._lock:
+            if self._size is None: self._size = self.stats()["size"]
+            else: self._size += added_size
+            over_size = self._size > self.max_size
+        if over_size: self.prune()
+
+    def restore(self, entry:dict, output_folder:Path) -> typing.List[Path]:
+        """
+        writes outputs of *entry* into *output_folder* by hardlinks, or by copies where links can not be made.
+        returns written files
+        """
+        restored = []
+        for rel_path, object_hash, _ in entry["outputs"]:
+            dst_filepath = Path(output_folder)/rel_path
+            utils.make_dirs_to_file(dst_filepath)
+            object_path = self._object_path(object_hash)
+            self._publish(dst_filepath, lambda tmp_path: self._link_or_copy(object_path, tmp_path))
+            restored.append(dst_filepath)
+        return restored
+
+    @staticmethod
+    def _link_or_copy(src:Path, dst:str):
+        os.remove(dst)
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copyfile(src, dst)
+
+    @staticmethod
+    def unlink_shared(filepaths:typing.Iterable[Path]):
+        """
+        removes *filepaths* which are hardlinks to cache objects,
+        so programs writing them in place do not change the cache
+        """
+        for filepath in filepaths:
+            try:
+                if os.stat(filepath).st_nlink > 1: os.remove(filepath)
+            except OSError:
+                pass
+
+    def put(self, key:str, files:typing.Iterable[Path], output_folder:Path):
+        """stores *files*, which are in *output_folder*, as outputs of *key*, and publishes them into shared cache"""
+        outputs = []
+        added_size = 0
+        for filepath in files:
+            filepath = Path(filepath)
+            object_hash = utils.file_hash(filepath)
+            object_path = self._object_path(object_hash)
+            size = filepath.stat().st_size
+            if not object_path.exists():
+                self._publish(object_path, lambda tmp_path: shutil.copyfile(filepath, tmp_path))
+                added_size += size
+            outputs.append([filepath.relative_to(output_folder).as_posix(), object_hash, size])
+
+        entry = {"outputs": outputs}
+        self._write_entry(key, entry)
+        self._add_size(added_size)
+        if self.shared is not None:
+            self.shared.import_entry(key, entry, self)
+
+    def _iterate_entries(self) -> typing.Generator[typing.Tuple[Path, dict], None, None]:
+        for entry_path in (self.root/"entries").glob("*/*.json"):
+            try:
+                yield entry_path, json.loads(entry_path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue
+
+    def _iterate_objects(self) -> typing.Generator[Path, None, None]:
+        for object_path in (self.root/"objects").glob("*/*"):
+            if not object_path.name.endswith(".tmp"): yield object_path
+
+    def stats(self) -> dict:
+        """{"entries":, "objects":, "size": bytes of objects, "max_size":}"""
+        entries = sum(1 for _ in (self.root/"entries").glob("*/*.json"))
+        objects, size = 0, 0
+        for object_path in self._iterate_objects():
+            objects += 1
+            size += object_path.stat().st_size
+        return {"entries": entries, "objects": objects, "size": size, "max_size": self.max_size}
+
+    def prune(self, max_size:int=None) -> dict:
+        """
+        removes least recently used entries until their objects fit *max_size* bytes, then unused objects.
+        returns {"entries":, "objects":, "size":} of removed
+        """
+        max_size = self.max_size if max_size is None else max_size
+        with self._lock:
+            entries = []
+            for entry_path, entry in self._iterate_entries():
+                try: entries.append((entry_path.stat().st_mtime, entry_path, entry))
+                except OSError: continue
+            # newest entries are kept first
+            entries.sort(key=lambda item: item[0], reverse=True)
+
+            kept_objects:typing.Set[str] = set()
+            kept_size = 0
+            removed = {"entries": 0, "objects": 0, "size": 0}
+            for _, entry_path, entry in entries:
+                new_objects = {object_hash: size for _, object_hash, size in entry["outputs"] if object_hash not in kept_objects}
+                new_size = sum(new_objects.values())
+                if kept_size + new_size <= max_size:
+                    kept_objects.update(new_objects)
+                    kept_size += new_size
+                    continue
+                try: entry_path.unlink()
+                except OSError: continue
+                removed["entries"] += 1
+
+            # objects written in the last minute can belong to entries other processes wrote after the scan
+            scan_time = time.time()
+            for object_path in self._iterate_objects():
+                if object_path.name in kept_objects: continue
+                try:
+                    stat = object_path.stat()
+                    if stat.st_mtime > scan_time - 60: continue
+                    object_path.unlink()
+                except OSError:
+                    continue
+                removed["objects"] += 1
+                removed["size"] += stat.st_size
+            self._size = None
+        return removed
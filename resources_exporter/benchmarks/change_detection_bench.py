@@ -0,0 +1,68 @@
+"""
+Compares "mtime" and "hash" change detection of `FilesRegistry` on a generated tree.
+All files are touched after registration, like after `git checkout` or archive extract,
+bytes stay the same.
+
+    python -m resources_exporter.benchmarks.change_detection_bench --files 20000
+"""
+import argparse
+import os
+from pathlib import Path
+import tempfile
+import time
+
+from ..file_system import FilesInDirIterator
+
+def make_tree(directory:Path, files_count:int, file_size:int):
+    payload = os.urandom(file_size)
+    for i in range(files_count):
+        filepath = directory/f"dir_{i%100}"/f"file_{i}.png"
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        filepath.write_bytes(payload[i%file_size:] + payload[:i%file_size])
+
+def touch_tree(directory:Path):
+    now = time.time() + 10
+    for filepath in directory.rglob("*.png"):
+        os.utime(filepath, (now, now))
+
+def bench_mode(root:Path, mode:str):
+    raw_dir = root/"raw"
+    storage_dir = root/mode
+    storage_dir.mkdir()
+    iterator = FilesInDirIterator(raw_dir, storage_dir, mode)
+
+    start = time.perf_counter()
+    for filepath in iterator.iterate_files(ext="png"):
+        iterator.files_registry.update_file_info(filepath)
+    iterator.files_registry.save()
+    register_time = time.perf_counter() - start
+
+    touch_tree(raw_dir)
+
+    start = time.perf_counter()
+    changed = sum(1 for _ in iterator.iterate_changed_files(ext="png"))
+    first_scan_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    changed_again = sum(1 for _ in iterator.iterate_changed_files(ext="png"))
+    second_scan_time = time.perf_counter() - start
+
+    print(f"{mode:>6} | register {register_time:8.3f}s | "
+        f"scan after touch {first_scan_time:8.3f}s, {changed:>7} changed | "
+        f"next scan {second_scan_time:8.3f}s, {changed_again:>7} changed")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=10000)
+    parser.add_argument("--file-size", type=int, default=64*1024)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        make_tree(root/"raw", args.files, args.file_size)
+        print(f"{args.files} files, {args.file_size} bytes each")
+        for mode in ["mtime", "hash"]:
+            bench_mode(root, mode)
+
+if __name__ == '__main__':
+    main()
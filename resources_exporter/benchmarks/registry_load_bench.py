@@ -0,0 +1,55 @@
+"""
+Measures loading time of a json `FilesRegistry` with many entries,
+which is the exporter startup cost before any export.
+
+    python -m resources_exporter.benchmarks.registry_load_bench --entries 100000
+"""
+import argparse
+import itertools
+import json
+import os
+from pathlib import Path
+import tempfile
+import time
+
+from ..file_system import FilesRegistry
+
+def make_registry_file(root:Path, entries:int):
+    raw_dir = root/"raw"
+    registry = {}
+    for i in range(entries):
+        filepath = raw_dir/f"dir_{i%100}"/f"file_{i}.png"
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        filepath.touch()
+        registry[filepath.resolve().as_posix()] = {
+            "mtime": filepath.stat().st_mtime,
+            "filepath": filepath.relative_to(root).as_posix(),
+            "size": 0,
+        }
+    storage_file = root/"files_registry.json"
+    storage_file.write_text(json.dumps({"registry": registry}, indent=2))
+    return storage_file
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage_file = make_registry_file(Path(tmp).resolve(), args.entries)
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            registry = FilesRegistry(_storage_file=storage_file).load()
+            times.append(time.perf_counter() - start)
+        print(f"{args.entries} entries, load: best {min(times):.3f}s, mean {sum(times)/len(times):.3f}s")
+
+        # paths are used by the exporter only for changed files
+        start = time.perf_counter()
+        for _, info in itertools.islice(registry.iterate_file_infos(), 1000):
+            info.filepath.name
+        print(f"first use of 1000 paths: {time.perf_counter() - start:.3f}s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Compares memory used by files registry entries,
+a dict of `FileInfo` objects against `FileInfoTable`.
+
+    python -m resources_exporter.benchmarks.registry_memory_bench --entries 1000000
+"""
+import argparse
+from pathlib import Path
+import time
+import tracemalloc
+
+from ..file_system import FileInfo, FileInfoTable
+
+def iterate_entries(entries:int):
+    for i in range(entries):
+        key = f"/projects/game/raw/models/dir_{i%1000}/file_{i}.png"
+        yield key, 1700000000.0+i, 1024+i, "%032x" % i if i%2 else None
+
+def fill_dict(entries:int):
+    registry = {}
+    for key, mtime, size, hash in iterate_entries(entries):
+        registry[key] = FileInfo(mtime, Path(key), size, hash)
+    return registry
+
+def fill_table(entries:int):
+    table = FileInfoTable()
+    for key, mtime, size, hash in iterate_entries(entries):
+        table.set(key, mtime, size, hash)
+    return table
+
+def measure(name:str, fill, entries:int):
+    tracemalloc.start()
+    start = time.perf_counter()
+    storage = fill(entries)
+    fill_time = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:>14} | {current/2**20:9.1f} MiB | {current/entries:7.1f} bytes/entry | fill {fill_time:7.2f}s")
+    del storage
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=1000000)
+    args = parser.parse_args()
+
+    print(f"{args.entries} entries")
+    measure("dict[FileInfo]", fill_dict, args.entries)
+    measure("FileInfoTable", fill_table, args.entries)
+
+if __name__ == '__main__':
+    main()
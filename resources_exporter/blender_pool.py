@@ -0,0 +1,204 @@
+import atexit
+from multiprocessing.connection import Listener
+from pathlib import Path
+import secrets
+import subprocess
+import tempfile
+import threading
+import time
+import typing
+
+from .process_runner import current_cancel_token, kill_process_tree, new_session_kwargs
+
+CFD = Path(__file__).parent.resolve()
+WORKER_SCRIPT = CFD/"resource_types/core/blender_export/blend_worker.py"
+
+class BlenderWorkerError(Exception):
+    pass
+
+class BlenderWorker():
+    """one background blender process running `blend_worker.py`"""
+    START_TIMEOUT = 120.0
+    # how often the starting process is checked for exit
+    START_POLL_INTERVAL = 0.1
+    # bytes of the worker output shown when it fails to start
+    LOG_TAIL_SIZE = 4000
+
+    def __init__(self, blender_executable:str="blender") -> None:
+        self.blender_executable = blender_executable
+        self.process:subprocess.Popen = None
+        self.connection = None
+        self.jobs_done = 0
+        self.memory = 0
+        # output blender prints outside of jobs, like startup errors
+        self.log = None
+
+    def start(self):
+        authkey = secrets.token_bytes(16)
+        with Listener(("127.0.0.1", 0), authkey=authkey) as listener:
+            port = listener.address[1]
+            args = [self.blender_executable, "-b", "--python", str(WORKER_SCRIPT), "--", str(port), authkey.hex()]
+            # a file, not a pipe, nobody reads it while the worker runs
+            self.log = tempfile.TemporaryFile()
+            self.process = subprocess.Popen(args, stdin=subprocess.DEVNULL,
+                stdout=self.log, stderr=subprocess.STDOUT, **new_session_kwargs())
+
+            # accept blocks, so it waits in a thread while the process is alive
+            accepted = {}
+            def accept():
+                try: accepted["connection"] = listener.accept()
+                except Exception: pass
+            thread = threading.Thread(target=accept, daemon=True)
+            thread.start()
+            deadline = time.monotonic() + BlenderWorker.START_TIMEOUT
+            while thread.is_alive() and self.process.poll() is None and time.monotonic() < deadline:
+                thread.join(BlenderWorker.START_POLL_INTERVAL)
+            self.connection = accepted.get("connection", None)
+
+        if self.connection is None:
+            exit_code = self.process.poll()
+            self.kill()
+            reason = "timed out" if exit_code is None else f"exited with code {exit_code}"
+            log_tail = self.read_log_tail()
+            self.close_log()
+            raise BlenderWorkerError(f"blender worker did not start, {reason}: \"{self.blender_executable}\"" 
+                + (f"\n{log_tail}" if log_tail else ""))
+        return self
+
+    def read_log_tail(self) -> str:
+        if self.log is None: return ""
+        try:
+            size = self.log.seek(0, 2)
+            self.log.seek(max(size - BlenderWorker.LOG_TAIL_SIZE, 0))
+            return self.log.read().decode(errors="replace").strip()
+        except (OSError, ValueError):
+            return ""
+
+    def close_log(self):
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid if self.process is not None else None
+
+    @property
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def run(self, blend_file:Path, script:Path, threads:int=0) -> dict:
+        """
+        opens *blend_file* in the worker and runs *script* with *threads* render threads (0 - all),
+        returns dict with "success", "out", "err".
+        worker is killed if `current_cancel_token` is cancelled
+        """
+        cancel_token = current_cancel_token.get()
+        try:
+            if cancel_token: cancel_token.add(self)
+            self.connection.send({"blend_file": str(Path(blend_file).resolve()), "script": str(Path(script).resolve()), "threads": threads})
+            result = self.connection.recv()
+        except (EOFError, OSError) as e:
+            self.kill()
+            if cancel_token: cancel_token.raise_if_cancelled()
+            log_tail = self.read_log_tail()
+            raise BlenderWorkerError(f"blender worker died while exporting \"{Path(blend_file).name}\""
+                + (f"\n{log_tail}" if log_tail else "")) from e
+        finally:
+            if cancel_token: cancel_token.discard(self)
+        self.jobs_done += 1
+        self.memory = result.get("memory", 0)
+        return result
+
+    def stop(self, timeout=10.0):
+        if self.connection is not None:
+            try: self.connection.send(None)
+            except Exception: pass
+            self.connection.close()
+            self.connection = None
+        if self.process is not None:
+            try: self.process.wait(timeout)
+            except subprocess.TimeoutExpired: self.kill()
+        self.close_log()
+
+    def kill(self):
+        if self.process is not None and self.process.poll() is None:
+            kill_process_tree(self.process.pid)
+            self.process.kill()
+            self.process.wait()
+
+class BlenderPool():
+    """
+    Keeps up to `size` background blender processes, so blender startup is paid once per worker, not per file.
+    Worker is replaced after `max_jobs` jobs or when its memory goes over `max_memory_mb`.
+    """
+    def __init__(self, blender_executable:str="blender", size:int=2, max_jobs:int=50, max_memory_mb:int=4096) -> None:
+        self.blender_executable = blender_executable
+        self.size = max(int(size), 1)
+        self.max_jobs = max_jobs
+        self.max_memory_mb = max_memory_mb
+        self._condition = threading.Condition()
+        self._idle:typing.List[BlenderWorker] = []
+        self._workers_count = 0
+
+    def _acquire(self) -> BlenderWorker:
+        with self._condition:
+            while len(self._idle) == 0 and self._workers_count >= self.size:
+                self._condition.wait()
+            if len(self._idle) > 0:
+                return self._idle.pop()
+            self._workers_count += 1
+        try:
+            return BlenderWorker(self.blender_executable).start()
+        except:
+            with self._condition:
+                self._workers_count -= 1
+                self._condition.notify()
+            raise
+
+    def _release(self, worker:BlenderWorker):
+        worn_out = worker.jobs_done >= self.max_jobs or worker.memory > self.max_memory_mb*1024*1024
+        if worn_out or not worker.is_alive:
+            worker.stop()
+            worker = None
+        with self._condition:
+            if worker is None: self._workers_count -= 1
+            else: self._idle.append(worker)
+            self._condition.notify()
+
+    def run_script(self, blend_file:Path, script:Path, threads:int=0) -> str:
+        """
+        runs *script* with *blend_file* opened in one of workers, returns its output.
+        raises an exception with error output, like `Resource.run_program` does
+        """
+        worker = self._acquire()
+        try:
+            result = worker.run(blend_file, script, threads)
+        finally:
+            self._release(worker)
+        if result["err"]: raise Exception(result["err"])
+        return result["out"]
+
+    def shutdown(self):
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self._workers_count -= len(idle)
+        for worker in idle:
+            worker.stop()
+
+_pools:typing.Dict[tuple, BlenderPool] = {}
+_pools_lock = threading.Lock()
+
+def get_blender_pool(blender_executable:str="blender", size:int=2, max_jobs:int=50, max_memory_mb:int=4096) -> BlenderPool:
+    """shared pool for given settings, workers are stopped at exit"""
+    key = (blender_executable, size, max_jobs, max_memory_mb)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = BlenderPool(*key)
+        return _pools[key]
+
+@atexit.register
+def shutdown_blender_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.shutdown()
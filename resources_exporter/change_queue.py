@@ -0,0 +1,93 @@
+from pathlib import Path
+import threading
+import time
+import typing
+
+from .utils import file_fingerprint
+
+class ChangeQueue():
+    """
+    Collects changed files reported by files observer.
+    Same file reported many times is queued once, files are given away as a batch
+    when no changes came for `quiet_period` seconds, or when the oldest change waits `max_delay` seconds.
+    A file is held until its size and mtime stay the same for `stable_period` seconds,
+    so files that are still being written are not exported, other files of the batch are not held by it.
+    Is safe to use from observer thread and from exporter thread.
+    """
+    def __init__(self, quiet_period:float=0.3, max_delay:float=5.0, stable_period:float=0.0) -> None:
+        self.quiet_period:float = quiet_period
+        self.max_delay:float = max_delay
+        self.stable_period:float = stable_period
+        self._lock = threading.Lock()
+        # file -> time of its first change in the current batch, keeps order of changes
+        self._changes:typing.Dict[Path, float] = {}
+        # file -> (fingerprint, time since it is the same)
+        self._fingerprints:typing.Dict[Path, tuple] = {}
+        self._last_change_time = 0.0
+
+    def push(self, filepath:Path, now:float=None):
+        now = time.monotonic() if now is None else now
+        filepath = Path(filepath)
+        fingerprint = file_fingerprint(filepath) if self.stable_period > 0 else None
+        with self._lock:
+            self._changes.setdefault(filepath, now)
+            self._last_change_time = now
+            if self.stable_period > 0:
+                self._update_fingerprint(filepath, fingerprint, now)
+
+    def _update_fingerprint(self, filepath:Path, fingerprint, now:float):
+        old = self._fingerprints.get(filepath, None)
+        if old is None or old[0] != fingerprint:
+            self._fingerprints[filepath] = (fingerprint, now)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._changes)
+
+    def _is_batch_ready(self, now:float) -> bool:
+        if len(self._changes) == 0: return False
+        if now - self._last_change_time >= self.quiet_period: return True
+        first_change_time = next(iter(self._changes.values()))
+        return now - first_change_time >= self.max_delay
+
+    def is_batch_ready(self, now:float=None) -> bool:
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            return self._is_batch_ready(now)
+
+    def _held_files(self, files:typing.List[Path], now:float) -> typing.Set[Path]:
+        """files of *files* which were written less than `stable_period` seconds ago"""
+        held = set()
+        if self.stable_period <= 0: return held
+        for filepath in files:
+            fingerprint, since = self._fingerprints.get(filepath, (None, now))
+            if now - since < self.stable_period:
+                held.add(filepath)
+                continue
+            # stat only files which could be stable already
+            new_fingerprint = file_fingerprint(filepath)
+            if new_fingerprint != fingerprint:
+                self._fingerprints[filepath] = (new_fingerprint, now)
+                held.add(filepath)
+        return held
+
+    def pop_batch(self, now:float=None) -> typing.List[Path]:
+        """
+        returns changed files in order of their first change, if the batch is ready, else empty list.
+        files which are still being written stay in the queue.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if not self._is_batch_ready(now): return []
+            files = list(self._changes.keys())
+            held = self._held_files(files, now)
+            batch = [filepath for filepath in files if filepath not in held]
+            for filepath in batch:
+                self._changes.pop(filepath)
+                self._fingerprints.pop(filepath, None)
+        return batch
+
+    def clear(self):
+        with self._lock:
+            self._changes.clear()
+            self._fingerprints.clear()
@@ -0,0 +1,173 @@
+import json
+import os
+from pathlib import Path
+import threading
+import typing
+
+from . import utils
+
+class DependencyIndex():
+    """
+    Raw files referenced by resources, like models of `.qc` files or materials of `.vmf` maps,
+    and the reverse map - resources depending on every raw file.
+    Stored in *storage_file* as `{"version":, "sources": {source key: [size, mtime, [referenced keys]]}}`,
+    keys are made by *registry*, so they are relative to the raw folder like keys of the files registry.
+    Entry of a source is made again when its size or mtime changes, so the index is updated incrementally.
+    """
+    VERSION = 1
+
+    def __init__(self, storage_file:Path, registry) -> None:
+        self.storage_file = Path(storage_file)
+        # `BaseFilesRegistry`, it makes keys of paths
+        self.registry = registry
+        self._lock = threading.RLock()
+        self._sources:typing.Dict[str, tuple] = {}
+        self._dependents:typing.Dict[str, typing.Set[str]] = {}
+        self._changed = False
+
+    def key(self, filepath:Path) -> str:
+        return self.registry.path_key(filepath)
+
+    def _set(self, key:str, size:int, mtime:float, references:typing.List[str]):
+        self._remove(key)
+        self._sources[key] = (size, mtime, references)
+        for reference in references:
+            self._dependents.setdefault(reference, set()).add(key)
+
+    def _remove(self, key:str):
+        entry = self._sources.pop(key, None)
+        if entry is None: return
+        for reference in entry[2]:
+            dependents = self._dependents.get(reference, None)
+            if dependents is None: continue
+            dependents.discard(key)
+            if len(dependents) == 0: self._dependents.pop(reference)
+
+    def load(self):
+        try:
+            data = json.loads(self.storage_file.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            data = {}
+        if data.get("version", None) != DependencyIndex.VERSION: data = {}
+        with self._lock:
+            self._sources, self._dependents = {}, {}
+            for key, (size, mtime, references) in data.get("sources", {}).items():
+                self._set(key, size, mtime, references)
+            self._changed = False
+        return self
+
+    def remove_missing(self, existing_keys:typing.Set[str]) -> int:
+        """removes entries of sources which are not in *existing_keys*, found by a scan, and do not exist"""
+        with self._lock:
+            missing = [key for key in self._sources
+                if key not in existing_keys and not os.path.exists(self.registry.key_to_posix(key))]
+            for key in missing:
+                self._remove(key)
+            if missing: self._changed = True
+        return len(missing)
+
+    def save(self):
+        """writes the index when it changed"""
+        with self._lock:
+            if not self._changed: return
+            data = {"version": DependencyIndex.VERSION,
+                "sources": {key: [size, mtime, references] for key, (size, mtime, references) in self._sources.items()}}
+            self._changed = False
+        utils.make_dirs_to_file(self.storage_file)
+        utils.atomic_write_text(self.storage_file, json.dumps(data))
+
+    def is_indexed(self, source:Path) -> bool:
+        with self._lock:
+            return self.key(source) in self._sources
+
+    def is_outdated(self, source:Path) -> bool:
+        """*source* is not indexed, or it changed since it was"""
+        with self._lock:
+            entry = self._sources.get(self.key(source), None)
+        if entry is None: return True
+        fingerprint = utils.file_fingerprint(source)
+        return fingerprint is None or fingerprint != (entry[0], entry[1])
+
+    def update(self, source:Path, references:typing.Optional[typing.Iterable[Path]]):
+        """indexes *references* of *source* as it is now, `None` references are not known, *source* is not indexed"""
+        fingerprint = utils.file_fingerprint(source)
+        if fingerprint is None or references is None:
+            self.remove(source)
+            return
+        key = self.key(source)
+        references = sorted({self.key(reference) for reference in references} - {key})
+        with self._lock:
+            if self._sources.get(key, None) == (*fingerprint, references): return
+            self._set(key, *fingerprint, references)
+            self._changed = True
+
+    def remove(self, source:Path):
+        with self._lock:
+            key = self.key(source)
+            if key not in self._sources: return
+            self._remove(key)
+            self._changed = True
+
+    def refresh(self, sources:typing.Iterable[Path], get_references:typing.Callable[[Path], typing.Optional[typing.List[Path]]]) -> int:
+        """updates outdated entries of *sources* by *get_references*, returns count of updated ones"""
+        count = 0
+        for source in sources:
+            if not self.is_outdated(source): continue
+            self.update(source, get_references(source))
+            count += 1
+        return count
+
+    def get_references(self, source:Path) -> typing.List[Path]:
+        with self._lock:
+            entry = self._sources.get(self.key(source), None)
+        if entry is None: return []
+        return [self.registry.key_to_path(key) for key in entry[2]]
+
+    def get_dependents(self, filepath:Path) -> typing.List[Path]:
+        """indexed resources referencing *filepath*"""
+        with self._lock:
+            keys = sorted(self._dependents.get(self.key(filepath), ()))
+        return [self.registry.key_to_path(key) for key in keys]
+
+    def get_all_dependents(self, files:typing.Iterable[Path]) -> typing.List[Path]:
+        """resources depending on *files* directly or through other resources, *files* are not in it"""
+        keys = [self.key(filepath) for filepath in files]
+        seen = set(keys)
+        dependents = []
+        with self._lock:
+            while keys:
+                for dependent in sorted(self._dependents.get(keys.pop(), ())):
+                    if dependent in seen: continue
+                    seen.add(dependent)
+                    dependents.append(dependent)
+                    keys.append(dependent)
+        return [self.registry.key_to_path(key) for key in dependents]
+
+    def sort_files(self, files:typing.Iterable[Path]) -> typing.List[Path]:
+        """*files* with referenced files moved before resources using them, order of others is kept"""
+        files_by_key = {}
+        for filepath in files:
+            files_by_key.setdefault(self.key(filepath), filepath)
+        with self._lock:
+            references = {key: [reference for reference in self._sources.get(key, (0, 0, []))[2] if reference in files_by_key]
+                for key in files_by_key}
+
+        order:typing.List[str] = []
+        done:typing.Set[str] = set()
+        for key in files_by_key:
+            if key in done: continue
+            # depth first, a file goes after its references. reference to a file on the stack is a cycle, it is ignored
+            stack = [(key, iter(references[key]))]
+            on_stack = {key}
+            while stack:
+                node, node_references = stack[-1]
+                reference = next(node_references, None)
+                if reference is None:
+                    stack.pop()
+                    on_stack.discard(node)
+                    done.add(node)
+                    order.append(node)
+                elif reference not in done and reference not in on_stack:
+                    on_stack.add(reference)
+                    stack.append((reference, iter(references[reference])))
+        return [files_by_key[key] for key in order]
@@ -4,6 +4,7 @@ import json
 from os import stat
 import os
 from pathlib import Path
+import threading
 from threading import Lock, RLock
 import time
 from typing import Generator
@@ -12,9 +13,17 @@ from typing import Type
 import typing
 from termcolor import colored
 
+from .artifact_cache import ArtifactCache, get_code_fingerprint
+from .dependency_index import DependencyIndex
+from .output_manifest import OutputInfo, OutputManifest
 from .resources_registry import ResourcesRegistry
+from .scheduler import AdmissionControl, ExportJob, ExportScheduler
+from .change_queue import ChangeQueue
+from .own_writes import own_writes
+from .process_runner import CancelToken, current_cancel_token
 
 from .resource_types.plugin import Plugin
+from .resource_types.core.blender_export.output_writer import default_writer as output_writer
 
 from .storable import PathField, Storable
 from .resource_types.resource_base import ExportConfig, Resource
@@ -107,6 +116,22 @@ class ExportResult():
         self.out_log:str = out_log or ""
         self.error_log:str = error_log or ""
         self.date:datetime.datetime = date
+        # "superseded" when source changed during export, "timeout" when export took too long
+        self.cancel_reason:str = None
+        # outputs were restored from `ArtifactCache`
+        self.from_cache:bool = False
+        # output key -> size, mtime and hash of files written by the export
+        self.outputs:typing.Dict[str, OutputInfo] = {}
+
+    @property
+    def cancelled(self):
+        return self.cancel_reason is not None
+
+    @property
+    def derived_files(self) -> typing.List[Path]:
+        """raw files written by the export, that have to be exported after it"""
+        if self.resource is None: return []
+        return self.resource.derived_files
 
 class ResourcesExporter:
     @staticmethod
@@ -120,25 +145,181 @@ class ResourcesExporter:
         if self.config is None:
             self.config = ExporterConfig.load_from_file(ResourcesExporter.get_config_path(self.project_dir))
         
-        self.files_iterator = FilesInDirIterator(self.config.raw_folder, self.project_dir)
+        self.files_iterator = FilesInDirIterator(self.config.raw_folder, self.project_dir, 
+            self.change_detection, self.files_registry_backend)
         self.resources_registry = ResourcesRegistry()
         self.resources_registry.register_core_plugin()
         for plugin_id in self.config.plugins:
             self.resources_registry.register_plugin(plugin_id)
 
+        self.output_manifest = OutputManifest(self.project_dir/"outputs_manifest.json",
+            self.config.raw_folder, self.config.output_folder).load()
+
         self.export_args_registry = ExportArgsRegistry()
         self.export_args_registry.load_with_files_iterator(self.files_iterator)
 
-        self.files_to_export_queue:typing.List[Path] = []
+        self.change_queue = ChangeQueue(self.observe_quiet_period, stable_period=self.observe_stable_period)
+        # file -> (cancel token, fingerprint of file when export started)
+        self._running_exports:typing.Dict[Path, tuple] = {}
+        self._running_exports_lock = threading.Lock()
 
         self.config.save()
 
         self.observing_status_printer = TimerStatusPrinter()
     
+    @property
+    def change_detection(self) -> str:
+        """"mtime" - file is changed when its mtime went up, "hash" - when its content changed"""
+        return self.config.get("change_detection", "mtime", True)
+
+    @property
+    def observe_quiet_period(self) -> float:
+        """seconds without files changes before observed changes are exported together"""
+        return self.config.get("observe_quiet_period", 0.3, True)
+
+    @property
+    def observe_stable_period(self) -> float:
+        """seconds file size and mtime have to stay the same before observed file is exported"""
+        return self.config.get("observe_stable_period", 0.5, True)
+
+    @property
+    def export_timeouts(self) -> typing.Dict[str, float]:
+        """seconds an export of files with the extension can take before it is cancelled, like {"blend": 600}"""
+        return self.config.get("export_timeouts", {}, True)
+
+    def get_export_timeout(self, filepath:Path) -> float:
+        return self.export_timeouts.get(utils.normalize_extension(filepath.suffix), None)
+
+    @property
+    def files_registry_backend(self) -> str:
+        """"json" - files_registry.json with journal, "sqlite" - files_registry.sqlite for big projects"""
+        return self.config.get("files_registry_backend", "json", True)
+
+    @property
+    def artifact_cache_dir(self) -> str:
+        """folder of export outputs cache, relative to project folder, "" - no cache"""
+        return self.config.get("artifact_cache_dir", "export_cache", True)
+
+    @property
+    def artifact_cache_max_size_mb(self) -> float:
+        return self.config.get("artifact_cache_max_size_mb", 10240, True)
+
+    @property
+    def artifact_cache_shared_dir(self) -> str:
+        """folder of cache shared by the team, like a network drive, "" - no shared cache"""
+        return self.config.get("artifact_cache_shared_dir", "", True)
+
+    @property
+    def artifact_cache_shared_max_size_mb(self) -> float:
+        """0 - shared cache is not pruned by this exporter"""
+        return self.config.get("artifact_cache_shared_max_size_mb", 0, True)
+
+    @cached_property
+    def artifact_cache(self) -> ArtifactCache:
+        if not self.artifact_cache_dir: return None
+        shared = None
+        if self.artifact_cache_shared_dir:
+            shared = ArtifactCache(self.project_dir/self.artifact_cache_shared_dir, self.artifact_cache_shared_max_size_mb)
+        return ArtifactCache(self.project_dir/self.artifact_cache_dir, self.artifact_cache_max_size_mb, shared)
+
+    def get_cache_key(self, resource:Resource, export_kwargs:dict) -> str:
+        """key of *resource* outputs in `artifact_cache`, `None` if they can not be cached"""
+        if self.artifact_cache is None or not resource.CACHEABLE: return None
+        res_class = type(resource)
+        parts = [f"{res_class.__module__}.{res_class.__qualname__}", get_code_fingerprint(res_class),
+            json.dumps(export_kwargs, sort_keys=True, default=str), resource.get_cache_key_extra()]
+        parts += [utils.get_program_fingerprint(tool) for tool in resource.get_cache_tools()]
+        for filepath in resource.get_cache_inputs():
+            try: parts.append(filepath.relative_to(self.config.raw_folder).as_posix())
+            except ValueError: parts.append(filepath.as_posix())
+            parts.append(utils.file_hash(filepath) if filepath.is_file() else "missing")
+        return ArtifactCache.make_key(parts)
+
+    def restore_cached_outputs(self, resource:Resource, cache_key:str) -> typing.List[Path]:
+        """restored output files, `None` if *cache_key* is not in cache"""
+        try:
+            entry = self.artifact_cache.get(cache_key)
+            if entry is None: return None
+            return self.artifact_cache.restore(entry, self.config.output_folder)
+        except Exception as e:
+            print(colored(f"failed to restore {resource} from cache: {e}", 'yellow'))
+            return None
+
+    def store_cached_outputs(self, resource:Resource, cache_key:str, outputs:typing.List[Path]):
+        """stores *outputs* of *resource*, if all of them are in the output folder"""
+        output_folder = self.config.output_folder.resolve()
+        for filepath in outputs:
+            try: filepath.relative_to(output_folder)
+            except ValueError: return
+        if len(outputs) == 0: return
+        try:
+            self.artifact_cache.put(cache_key, outputs, output_folder)
+        except Exception as e:
+            print(colored(f"failed to cache outputs of {resource}: {e}", 'yellow'))
+
+    def print_output_writes(self):
+        """counts of text outputs written by exports since the last call, unchanged ones are not rewritten"""
+        written, skipped = output_writer.take_counts()
+        if written + skipped == 0: return
+        print(colored(f"outputs written: {written}, unchanged: {skipped}", "green"))
+
+    def print_artifact_cache_stats(self):
+        if self.artifact_cache is None:
+            print("artifact cache is disabled")
+            return
+        for cache in [self.artifact_cache, self.artifact_cache.shared]:
+            if cache is None: continue
+            stats = cache.stats()
+            max_size = f"{stats['max_size']/1024/1024:.0f} MB" if stats['max_size'] > 0 else "unlimited"
+            print(f"artifact cache \"{cache.root}\": {stats['entries']} entries, {stats['objects']} files, "
+                f"{stats['size']/1024/1024:.1f} MB of {max_size}")
+
+    def prune_artifact_cache(self, max_size_mb:float=None, shared=False):
+        cache = self.artifact_cache
+        if cache is not None and shared: cache = cache.shared
+        if cache is None: return
+        max_size_mb = cache.max_size_mb if max_size_mb is None else max_size_mb
+        if max_size_mb <= 0 and shared:
+            print("size of shared cache is not limited, give the size to prune it to")
+            return
+        removed = cache.prune(int(max_size_mb*1024*1024))
+        print(f"removed {removed['entries']} entries, {removed['objects']} files, {removed['size']/1024/1024:.1f} MB")
+
     def print_exporting(self, filepath:Path):
         short_path = (filepath.relative_to(self.config.raw_folder).as_posix())
         print(f"exporting \"{filepath.suffix}\" resource: \"{short_path}\"...")
 
+    @property
+    def dependency_index(self) -> DependencyIndex:
+        return self.files_iterator.dependency_index
+
+    def get_referenced_files(self, filepath:Path) -> typing.Optional[typing.List[Path]]:
+        """raw files resource of *filepath* uses, see `Resource.get_referenced_files`"""
+        res_class = self.resources_registry.get_res_class_by_filepath(filepath)
+        if res_class is None: return []
+        try:
+            return res_class(filepath, self.config).get_referenced_files()
+        except Exception as e:
+            print(colored(f"failed to find files referenced by \"{filepath.name}\": {e}", 'yellow'))
+            return None
+
+    def update_dependency_index(self, files:typing.Iterable[Path]) -> int:
+        """indexes references of *files* changed since they were indexed, returns count of indexed files"""
+        files = [file for file in files if self.is_referencing_file(file)]
+        return self.dependency_index.refresh(files, self.get_referenced_files)
+
+    def is_referencing_file(self, filepath:Path) -> bool:
+        res_class = self.resources_registry.get_res_class_by_filepath(filepath)
+        return res_class is not None and self.resources_registry.is_referencing_class(res_class)
+
+    def add_dependents(self, files:typing.List[Path]) -> typing.List[Path]:
+        """*files* with resources depending on them, in dependency order"""
+        dependents = [file for file in self.dependency_index.get_all_dependents(files)
+            if file.exists() and self.resources_registry.get_res_class_by_filepath(file) is not None]
+        for dependent in dependents:
+            if self.config.verbose: print(f"\"{dependent.name}\" depends on changed files")
+        return self.resources_registry.sort_by_dependencies(list(files) + dependents, self.dependency_index)
+
     def run_resource_command(self, filepath:Path, cmd_id:str):
         res_class = self.resources_registry.get_res_class_by_filepath(filepath)
         if res_class is None: return
@@ -164,23 +345,49 @@ class ResourcesExporter:
         resource = res_class(filepath, self.config)
         export_result.resource = resource
 
+        start_time = time.time()
+        cancel_token = self._start_export_task(filepath)
+        token_context = current_cancel_token.set(cancel_token)
         with utils.StdoutSplitter.context() as stdout_splitter:
             try:
                 export_args = ResLocalConfig.s_get_settings_for_file(filepath)
                 export_kwargs = export_args.to_dict()
-                resource.export(**export_kwargs)
-                print(colored(f"exported {resource}", "green"))
+                resource.prepare_export(**export_kwargs)
+                cache_key = self.get_cache_key(resource, export_kwargs)
+                outputs = self.restore_cached_outputs(resource, cache_key) if cache_key else None
+                if outputs is not None:
+                    export_result.from_cache = True
+                    print(colored(f"restored {resource} from cache", "green"))
+                else:
+                    # restored outputs are links to cache files, programs must not write into them
+                    if cache_key: ArtifactCache.unlink_shared(resource.get_possible_outputs())
+                    resource.export(**export_kwargs)
+                    cancel_token.raise_if_cancelled()
+                    outputs = resource.collect_outputs(start_time)
+                    if cache_key: self.store_cached_outputs(resource, cache_key, outputs)
+                    print(colored(f"exported {resource}", "green"))
+                export_result.outputs = self.output_manifest.set_outputs(filepath, outputs)
+                if self.resources_registry.is_referencing_class(res_class):
+                    self.dependency_index.update(filepath, resource.get_referenced_files())
                 export_result.success = True
 
             except Exception as e:
-                if self.config.verbose:
-                    print(colored(str(e), 'red'))
-                    traceback.print_exc()
+                if cancel_token.cancelled:
+                    export_result.cancel_reason = cancel_token.reason
+                    resource.discard_outputs(start_time)
+                    print(colored(f"cancelled export of {resource}: {cancel_token.reason}", 'yellow'))
                 else:
-                    print(" ".join(list(map(str, e.args))))
-                
-                print(colored(f"failed to export {resource}", 'red'))
+                    if self.config.verbose:
+                        print(colored(str(e), 'red'))
+                        traceback.print_exc()
+                    else:
+                        print(" ".join(list(map(str, e.args))))
+                    
+                    print(colored(f"failed to export {resource}", 'red'))
                 export_result.error_log = str(e)
+            finally:
+                current_cancel_token.reset(token_context)
+                self._finish_export_task(filepath, cancel_token)
             
             export_result.out_log = stdout_splitter.read()
             
@@ -188,22 +395,184 @@ class ResourcesExporter:
         
         return export_result
     
-    def export_resources(self):
-        """uses self.export_one_resource(res_path)"""
-        results = []
-        exts = self.resources_registry.sorted_extensions
-        for ext in exts:
-            for filepath in self.files_iterator.iterate_changed_files(ext=ext):
-                result = self.export_one_resource(filepath)
-                if result is None:
-                    self.files_iterator.update_file_info(filepath)
-                else:
-                    results.append(result)
-                    if result.success:
-                        self.files_iterator.update_file_info(filepath)
+    def _start_export_task(self, filepath:Path) -> CancelToken:
+        cancel_token = CancelToken()
+        timeout = self.get_export_timeout(filepath)
+        if timeout: cancel_token.cancel_after(timeout, "timeout")
+        with self._running_exports_lock:
+            self._running_exports[filepath.resolve()] = (cancel_token, utils.file_fingerprint(filepath))
+        return cancel_token
+
+    def _finish_export_task(self, filepath:Path, cancel_token:CancelToken):
+        cancel_token.close()
+        with self._running_exports_lock:
+            if self._running_exports.get(filepath.resolve(), (None,))[0] is cancel_token:
+                self._running_exports.pop(filepath.resolve())
+
+    def cancel_export(self, filepath:Path, reason:str="cancelled") -> bool:
+        """kills programs of running export of *filepath*, returns `False` if it is not exporting"""
+        with self._running_exports_lock:
+            running = self._running_exports.get(Path(filepath).resolve(), None)
+        if running is None: return False
+        running[0].cancel(reason)
+        return True
+
+    def cancel_superseded_export(self, filepath:Path) -> bool:
+        """cancels export of *filepath* if the file changed since the export started"""
+        with self._running_exports_lock:
+            running = self._running_exports.get(Path(filepath).resolve(), None)
+        if running is None: return False
+        cancel_token, fingerprint = running
+        if utils.file_fingerprint(filepath) == fingerprint: return False
+        # the export rewrote its own file, like `.qc` adjusted before compiling
+        if own_writes.is_own_write(filepath): return False
+        cancel_token.cancel("superseded")
+        return True
+
+    def get_export_memory(self, filepath:Path) -> int:
+        """resident memory of programs running for export of *filepath*, in bytes"""
+        with self._running_exports_lock:
+            running = self._running_exports.get(Path(filepath).resolve(), None)
+        if running is None: return 0
+        return sum(utils.get_process_memory(pid) or 0 for pid in running[0].pids())
+
+    @property
+    def export_workers(self) -> int:
+        """count of parallel exports, 0 - one per cpu core"""
+        return self.config.get("export_workers", 0, True)
+
+    @property
+    def export_limits(self) -> dict:
+        """resource class name -> max parallel exports, or dict with limit, weight and memory_mb"""
+        return self.config.get("export_limits", {}, True)
+
+    @property
+    def min_free_memory_mb(self) -> int:
+        """memory left free when exports with memory estimate are started"""
+        return self.config.get("min_free_memory_mb", 1024, True)
+
+    def make_export_scheduler(self, export_func=None) -> ExportScheduler:
+        export_func = export_func or self.export_one_resource
+        admission = AdmissionControl(self.export_limits, self.min_free_memory_mb,
+            lambda job: self.get_export_memory(job.filepath))
+        return ExportScheduler(self.resources_registry, export_func, self.export_workers, admission, self.dependency_index)
+
+    def export_files(self, files:typing.List[Path]) -> typing.List[ExportResult]:
+        """
+        exports *files*, expected in `sort_by_dependencies` order, and files written by their exports.
+        uses self.export_one_resource(res_path), exports are scheduled with `ExportScheduler`
+        """
+        def on_done(job:ExportJob):
+            result = job.result
+            if result is None or result.success:
+                self.files_iterator.update_file_info(job.filepath)
+
+        scheduler = self.make_export_scheduler()
+        def export_batch(files:typing.List[Path]):
+            return scheduler.run(scheduler.build_jobs(files), on_done=on_done)
+
+        with self.files_iterator.files_registry.batch():
+            results = export_batch(files)
+            results += self.export_derived_files(results, export_batch, set(files))
+        results = [result for result in results if result is not None]
+        self.files_iterator.save()
+        self.output_manifest.save()
+        self.print_output_writes()
         ResLocalConfig.clear_cache()
         return results
 
+    def export_resources(self):
+        """exports changed files and resources depending on them"""
+        with self.files_iterator.files_registry.batch():
+            buckets = self.files_iterator.scan()
+            exts = self.resources_registry.sorted_extensions
+            self.update_dependency_index(self.files_iterator.iterate_files_of_exts(
+                self.resources_registry.referencing_extensions, buckets))
+            files = list(self.files_iterator.iterate_changed_files_of_exts(exts, buckets))
+            return self.export_files(self.add_dependents(files))
+
+    def verify_outputs(self) -> typing.List[ExportResult]:
+        """exports again sources which outputs were removed or changed since their export"""
+        files = []
+        for source in self.output_manifest.iterate_sources():
+            if not source.exists(): continue
+            changed = self.output_manifest.get_changed_outputs(source)
+            if len(changed) == 0: continue
+            names = ", ".join(f"\"{filepath.name}\"" for filepath in changed[:3]) + (", ..." if len(changed) > 3 else "")
+            print(colored(f"{len(changed)} outputs of \"{source.name}\" are missing or changed: {names}", "yellow"))
+            files.append(source)
+        files = [file for file in self.resources_registry.sort_by_dependencies(files, self.dependency_index)
+            if self.resources_registry.get_res_class_by_filepath(file) is not None]
+        if len(files) == 0:
+            print(colored("all outputs are as they were exported", "green"))
+            return []
+        return self.export_files(files)
+
+    def prune_outputs(self, dry_run=False) -> typing.List[Path]:
+        """removes outputs of removed sources, returns removed files"""
+        removed = []
+        for source, outputs in self.output_manifest.find_orphans().items():
+            for output in outputs:
+                if not output.exists(): continue
+                print(f"{'would remove' if dry_run else 'removing'} \"{output}\" of removed \"{source.name}\"")
+                if dry_run:
+                    removed.append(output)
+                    continue
+                try:
+                    output.unlink()
+                    removed.append(output)
+                except OSError as e:
+                    print(colored(f"failed to remove \"{output}\": {e}", 'red'))
+            if not dry_run: self.output_manifest.remove_source(source)
+        self.output_manifest.save()
+        print(colored(f"{'would remove' if dry_run else 'removed'} {len(removed)} outputs", "green"))
+        return removed
+
+    def import_files_registry(self, registry_file:Path=None, old_root:str=None) -> int:
+        """
+        imports files registry of this project from another location,
+        absolute keys under *old_root* (raw folder there) become relative to raw folder here.
+        without *registry_file* the current registry is rebased
+        """
+        files_registry = self.files_iterator.files_registry
+        if registry_file is None:
+            count = files_registry.rebase(old_root)
+        else:
+            imported = load_files_registry(registry_file)
+            count = files_registry.import_from(imported, old_root)
+            imported.close()
+        self.files_iterator.save()
+        print(colored(f"imported {count} files infos", "green"))
+        return count
+
+    def get_derived_files(self, results:typing.List[ExportResult], exported:typing.Set[Path]) -> typing.List[Path]:
+        """files written by exports of *results* and resources depending on them"""
+        files = []
+        for result in results:
+            if result is None or result.cancelled: continue
+            for file in result.derived_files:
+                if file in exported or file in files: continue
+                if self.resources_registry.get_res_class_by_filepath(file) is None: continue
+                files.append(file)
+        if len(files) == 0: return files
+        self.update_dependency_index(files)
+        exported = {file.resolve() for file in exported}
+        return [file for file in self.add_dependents(files) if file.resolve() not in exported]
+
+    def export_derived_files(self, results:typing.List[ExportResult], export_files:typing.Callable, exported:typing.Set[Path]) -> list:
+        """
+        exports files written by exports of *results*, they are exported even if registry has them as unchanged.
+        *export_files* exports a list of files and returns results, *exported* files are not exported again
+        """
+        all_results = []
+        files = self.get_derived_files(results, exported)
+        while len(files) > 0:
+            exported.update(files)
+            results = export_files(self.resources_registry.sort_by_dependencies(files, self.dependency_index))
+            all_results += results
+            files = self.get_derived_files(results, exported)
+        return all_results
+
     # observing
     _has_something_to_export = False
     observe_start_date = datetime.datetime.now()
@@ -235,8 +604,11 @@ class ResourcesExporter:
 
     def _on_some_file_change(self, file:Path):
         try:
-            with self.files_observer._lock:
-                self.files_to_export_queue.append(file)
+            # echo of exporter's own write, it is exported explicitly if needed
+            if own_writes.is_own_write(file): return
+            # export of the old file content is a waste, it is exported again from the queue
+            self.cancel_superseded_export(file)
+            self.change_queue.push(file)
         except:
             traceback.print_exc()
 
@@ -267,16 +639,38 @@ class ResourcesExporter:
         self.print_status()
         resources = []
 
-        with self.files_observer._lock:
-            while len(self.files_to_export_queue)>0:
-                file = self.files_to_export_queue.pop()
-                if self.files_iterator.files_registry.is_file_changed(file):
-                    cfg = ResLocalConfig.s_get_settings_for_file(file)
-                    if not cfg.get("observer_ignore", False):
-                        res = self.export_one_resource(file)
-                        self.files_iterator.files_registry.update_file_info(file)
-                        resources.append(res)
-            ResLocalConfig.clear_cache()
+        files = self.change_queue.pop_batch()
+        if len(files) == 0: return resources
+
+        files_to_export = []
+        for file in files:
+            # removed while it was waiting, like temporary files of editors
+            if not file.exists(): continue
+            if not self.files_iterator.files_registry.is_file_changed(file): continue
+            cfg = ResLocalConfig.s_get_settings_for_file(file)
+            if not cfg.get("observer_ignore", False):
+                files_to_export.append(file)
+
+        # resources using changed files are exported too
+        self.update_dependency_index(files_to_export)
+        files_to_export = self.add_dependents(files_to_export)
+
+        def export_files(files:typing.List[Path]):
+            results = []
+            # dependencies of the batch are exported first
+            for file in self.resources_registry.sort_by_dependencies(files, self.dependency_index):
+                result = self.export_one_resource(file)
+                results.append(result)
+                # superseded file is in the queue again, its new content is not exported yet
+                if result is None or result.cancel_reason != "superseded":
+                    self.files_iterator.files_registry.update_file_info(file)
+            return results
+
+        resources = export_files(files_to_export)
+        resources += self.export_derived_files(resources, export_files, set(files_to_export))
+        self.output_manifest.save()
+        self.print_output_writes()
+        ResLocalConfig.clear_cache()
         
         return resources
 
@@ -285,6 +679,8 @@ class ResourcesExporter:
         if self.files_observer is not None:
             self.files_observer.stop()
             self.files_observer.join()
+        if getattr(self, "files_iterator", None) is not None:
+            self.files_iterator.save()
 
     def init_workspace(self, for_cli=False):
         self.config.save()
@@ -62,6 +62,47 @@ class Observe(ActionUnit):
     def run(self):
         self.res_exporter.start_observing_loop()
 
+class ImportRegistry(ActionUnit):
+    parser_id:str = "import_registry"
+    parser_help:str = "import files registry made in another project location, or rebase the current one"
+    file:Path = None
+    old_root:str = None
+    def add_args_to_argparser(self, argparser:argparse.ArgumentParser):
+        argparser.add_argument("-f", "--file", type=path_factory, help="registry file to import")
+        argparser.add_argument("-r", "--old-root", type=str, help="raw folder path where registry was made")
+    def run(self):
+        self.res_exporter.import_files_registry(self.file, self.old_root)
+
+class ArtifactCacheAction(ActionUnit):
+    parser_id:str = "cache"
+    parser_help:str = "show export outputs cache size, or remove least recently used outputs"
+    command:str = "stats"
+    max_size_mb:float = None
+    shared:bool = False
+    def add_args_to_argparser(self, argparser:argparse.ArgumentParser):
+        argparser.add_argument("command", choices=["stats", "prune"])
+        argparser.add_argument("-s", "--max-size-mb", type=float, help="size to prune cache to, config value by default")
+        argparser.add_argument("--shared", action="store_true", help="prune cache shared by the team")
+    def run(self):
+        if self.command == "prune":
+            self.res_exporter.prune_artifact_cache(self.max_size_mb, self.shared)
+        self.res_exporter.print_artifact_cache_stats()
+
+class VerifyOutputs(ActionUnit):
+    parser_id:str = "verify"
+    parser_help:str = "export again resources which outputs were removed or changed"
+    def run(self):
+        self.res_exporter.verify_outputs()
+
+class PruneOutputs(ActionUnit):
+    parser_id:str = "prune"
+    parser_help:str = "remove outputs of removed resources"
+    dry_run:bool = False
+    def add_args_to_argparser(self, argparser:argparse.ArgumentParser):
+        argparser.add_argument("-n", "--dry-run", action="store_true", help="only print outputs to remove")
+    def run(self):
+        self.res_exporter.prune_outputs(self.dry_run)
+
 class MakePluginAction(ActionUnit):
     parser_id:str = "new_plugin"
     parser_help:str = "make new plugin"
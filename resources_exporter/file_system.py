@@ -1,92 +1,749 @@
 
+from array import array
+from contextlib import contextmanager
+import hashlib
+import json
 import os
 from pathlib import Path
+import sqlite3
+import threading
+import time
+import typing
 from typing import Generator
 
-from .storable import PathField, Storable
+from .dependency_index import DependencyIndex
+from .storable import LazyPathField, Storable, StoredPath
+from . import utils
 from serde import Model, fields
 
 CFD = Path(__file__).parent.resolve()
 CWD = Path(os.getcwd()).resolve()
 
 class FileInfo(Model):
+    HASH_CHUNK_SIZE = 1024*1024
+
     mtime: float
-    filepath: PathField
+    filepath: LazyPathField
+    size: fields.Optional(fields.Int, default=0)
+    hash: fields.Optional(fields.Str)
 
-    def __init__(self, mtime=None, filepath:Path=None) -> None:
+    def __init__(self, mtime=None, filepath:Path=None, size=None, hash=None) -> None:
         self.mtime:float = mtime or 0.0
         self.filepath:Path = filepath
+        self.size:int = size or 0
+        self.hash:str = hash
+
+    @property
+    def filepath(self) -> Path:
+        """loaded path is resolved on first use"""
+        if isinstance(self._filepath, StoredPath):
+            self._filepath = self._filepath.to_path()
+        return self._filepath
+    @filepath.setter
+    def filepath(self, value):
+        self._filepath = value
 
-    def is_file_changed(self)->bool:
-        new_info = FileInfo.from_file(self.filepath)
+    def is_file_changed(self, use_hash=False, stat:os.stat_result=None)->bool:
+        """
+        by default file is changed if its mtime went up.
+        with *use_hash* (size, mtime) are checked first, and if mtime differs, content hash decides.
+        *stat* of the file can be given if it is already known.
+        """
+        if stat is not None: new_info = FileInfo.from_stat(self.filepath, stat)
+        else: new_info = FileInfo.from_file(self.filepath)
         if new_info is None: return True
-        if new_info.mtime > self.mtime:
-            return True
-        else:
-            return False
+        if not use_hash:
+            return new_info.mtime > self.mtime
+
+        if new_info.size != self.size: return True
+        if new_info.mtime == self.mtime: return False
+        if self.hash is None: return True
+        if new_info.calc_hash() != self.hash: return True
+        # same bytes, just touched. remember new mtime to skip hashing next time
+        self.mtime = new_info.mtime
+        return False
+
+    def calc_hash(self)->str:
+        hasher = hashlib.blake2b(digest_size=16)
+        with open(self.filepath, "rb") as file:
+            for chunk in iter(lambda: file.read(FileInfo.HASH_CHUNK_SIZE), b""):
+                hasher.update(chunk)
+        self.hash = hasher.hexdigest()
+        return self.hash
 
     @staticmethod
-    def from_file(filepath:Path):
+    def from_file(filepath:Path, with_hash=False):
         filepath = Path(filepath)
         if not filepath.exists(): return None
 
-        fileinfo = FileInfo(None, filepath)
-        stat = filepath.stat()
-        fileinfo.mtime = stat.st_mtime
+        return FileInfo.from_stat(filepath, filepath.stat(), with_hash)
+
+    @staticmethod
+    def from_stat(filepath:Path, stat:os.stat_result, with_hash=False):
+        fileinfo = FileInfo(stat.st_mtime, Path(filepath), stat.st_size)
+        if with_hash: fileinfo.calc_hash()
         return fileinfo
 
-class FilesRegistry(Storable):
-    registry: fields.Dict(str, FileInfo)
+class BaseFilesRegistry():
+    """
+    Common api of files registry backends.
+    Backend stores `FileInfo` by key - posix path of file relative to the registry root,
+    or resolved posix path for files outside of it, so a registry stays valid when the project is moved.
+    Backend also implements `load` and `save`, infos of removed files are cleared by `remove_missing`.
+    """
+    CHANGE_DETECTION_MODES = ["mtime", "hash"]
 
-    def __init__(self, registry=None, _storage_file:Path=None, **kwargs) -> None:
-        self.registry = registry or {}
-        super().__init__(_storage_file=_storage_file, **kwargs)
+    def init_root(self, root:Path=None):
+        self._root_prefix:str = None
+        if root is not None:
+            self._root_prefix = Path(root).resolve().as_posix().rstrip("/")+"/"
+
+    def init_change_detection(self, change_detection="mtime"):
+        if change_detection not in BaseFilesRegistry.CHANGE_DETECTION_MODES:
+            raise Exception(f"unknown change detection mode \"{change_detection}\", "
+                f"expected one of {BaseFilesRegistry.CHANGE_DETECTION_MODES}")
+        self._change_detection = change_detection
+        self._batch_depth = 0
+
+    @property
+    def use_hash(self):
+        return self._change_detection == "hash"
+
+    @staticmethod
+    def is_relative_key(key:str)->bool:
+        return not (key.startswith("/") or key[1:3] == ":/")
+
+    @staticmethod
+    def root_prefix(root)->str:
+        """posix prefix of keys under *root*, *root* can be a path of another machine"""
+        return str(root).replace("\\", "/").rstrip("/")+"/"
+
+    def key_of_posix(self, posix:str)->str:
+        if self._root_prefix and posix.startswith(self._root_prefix):
+            return posix[len(self._root_prefix):]
+        return posix
+
+    def path_key(self, filepath:Path)->str:
+        return self.key_of_posix(Path(filepath).resolve().as_posix())
+
+    def key_to_posix(self, key:str)->str:
+        if self._root_prefix and self.is_relative_key(key):
+            return self._root_prefix + key
+        return key
+
+    def key_to_path(self, key:str)->Path:
+        return Path(self.key_to_posix(key))
+
+    def dir_key_prefix(self, directory:Path)->str:
+        """keys of files under *directory* start with it, it is empty for the root"""
+        return self.key_of_posix(Path(directory).resolve().as_posix().rstrip("/")+"/")
+
+    def is_key_under(self, key:str, prefix:str)->bool:
+        if prefix: return key.startswith(prefix)
+        return self.is_relative_key(key)
 
     def get_file_info(self, filepath:Path)->FileInfo:
-        filepath = Path(filepath).resolve()
-        key = filepath.as_posix()
-        info = None
-        if key in self.registry:
-            info = self.registry[key]
-        return info
+        return self.get_file_info_by_key(self.path_key(filepath))
+
+    def is_file_changed(self, filepath:Path, stat:os.stat_result=None)->bool:
+        key = self.path_key(filepath)
+        info = self.get_file_info_by_key(key)
+        if info is None: return True
+        mtime = info.mtime
+        changed = info.is_file_changed(self.use_hash, stat)
+        if not changed and info.mtime != mtime:
+            self.on_file_info_refreshed(key, info)
+        return changed
 
-    def is_file_changed(self, filepath:Path)->bool:
+    def update_file_info(self, filepath:Path, stat:os.stat_result=None):
         filepath = Path(filepath).resolve()
-        info = self.get_file_info(filepath)
-        if info:
-            return info.is_file_changed()
+        fileinfo = None
+        if stat is not None:
+            fileinfo = FileInfo.from_stat(filepath, stat, self.use_hash)
+        elif filepath.exists():
+            fileinfo = FileInfo.from_file(filepath, self.use_hash)
+        if fileinfo:
+            self.put_file_info(self.key_of_posix(filepath.as_posix()), fileinfo)
+        return fileinfo
+
+    def iterate_file_infos_under(self, directory:Path) -> Generator[FileInfo, None, None]:
+        """infos of all files in *directory* and its subdirectories"""
+        prefix = self.dir_key_prefix(directory)
+        for key, info in self.iterate_file_infos():
+            if self.is_key_under(key, prefix): yield info
+
+    def rebase_key(self, key:str, old_prefix:str)->str:
+        if old_prefix and key.startswith(old_prefix):
+            return key[len(old_prefix):]
+        return self.key_of_posix(key)
+
+    def import_from(self, registry:"BaseFilesRegistry", old_root=None)->int:
+        """
+        copies infos of *registry*, its absolute keys under *old_root*
+        (a project location on another machine) become relative to this registry root.
+        returns count of imported infos
+        """
+        old_prefix = self.root_prefix(old_root) if old_root is not None else None
+        items = [(self.rebase_key(key, old_prefix), info) for key, info in registry.iterate_file_infos()]
+        self.put_file_infos(items)
+        return len(items)
+
+    def rebase(self, old_root=None)->int:
+        """
+        makes absolute keys under *old_root* relative to the registry root,
+        without *old_root* only keys under the current root are rebased.
+        returns count of rebased infos
+        """
+        old_prefix = self.root_prefix(old_root) if old_root is not None else None
+        renamed = {}
+        for key in self.iterate_keys():
+            if not self.is_relative_key(key):
+                new_key = self.rebase_key(key, old_prefix)
+                if new_key != key: renamed[key] = new_key
+        if renamed:
+            items = [(renamed[key], self.get_file_info_by_key(key)) for key in renamed]
+            self.remove_file_infos(list(renamed.keys()))
+            self.put_file_infos(items)
+        return len(renamed)
+
+    def remove_missing(self, existing_keys:typing.Set[str]) -> int:
+        """
+        removes infos of files which are not in *existing_keys*, found by a scan, and do not exist.
+        only files missing in the scan are stated. returns count of removed infos
+        """
+        missing = [key for key in self.iterate_keys()
+            if key not in existing_keys and not os.path.exists(self.key_to_posix(key))]
+        if missing: self.remove_file_infos(missing)
+        return len(missing)
+
+    @contextmanager
+    def batch(self):
+        """updates made inside are stored together"""
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0: self.flush_batch()
+
+    @property
+    def in_batch(self):
+        return self._batch_depth > 0
+
+    # backend methods
+
+    def get_file_info_by_key(self, key:str)->FileInfo:
+        raise NotImplementedError()
+
+    def put_file_info(self, key:str, fileinfo:FileInfo):
+        raise NotImplementedError()
+
+    def iterate_file_infos(self) -> Generator[typing.Tuple[str, FileInfo], None, None]:
+        raise NotImplementedError()
+
+    def iterate_keys(self) -> Generator[str, None, None]:
+        for key, _ in self.iterate_file_infos():
+            yield key
+
+    def put_file_infos(self, items:typing.List[typing.Tuple[str, FileInfo]]):
+        with self.batch():
+            for key, fileinfo in items:
+                self.put_file_info(key, fileinfo)
+
+    def remove_file_infos(self, keys:typing.List[str]):
+        raise NotImplementedError()
+
+    def on_file_info_refreshed(self, key:str, fileinfo:FileInfo):
+        """info of unchanged file got new mtime after hash check"""
+        pass
+
+    def flush_batch(self):
+        pass
+
+    def close(self):
+        pass
+
+class FileInfoTable():
+    """
+    Compact in-memory storage of file infos by key.
+    Directories of keys are stored once, row values are kept in parallel arrays,
+    `FileInfo` objects are made only when requested.
+    """
+    __slots__ = ("_dirs", "_dir_ids", "_dir_rows", "_row_dirs", "_names", "_mtimes", "_sizes", "_hashes")
+
+    def __init__(self) -> None:
+        self._dirs:typing.List[str] = []
+        self._dir_ids:typing.Dict[str, int] = {}
+        # name -> row, for every directory
+        self._dir_rows:typing.List[typing.Dict[str, int]] = []
+        self._row_dirs = array("I")
+        self._names:typing.List[str] = []
+        self._mtimes = array("d")
+        self._sizes = array("q")
+        # digests, not hex strings
+        self._hashes:typing.List[bytes] = []
+
+    def __len__(self):
+        return len(self._names)
+
+    @staticmethod
+    def _split_key(key:str):
+        # directory keeps its "/", so "a.png" and "/a.png" are in different ones
+        i = key.rfind("/")+1
+        return key[:i], key[i:]
+
+    def _find_row(self, key:str) -> int:
+        directory, name = self._split_key(key)
+        dir_id = self._dir_ids.get(directory, None)
+        if dir_id is None: return -1
+        return self._dir_rows[dir_id].get(name, -1)
+
+    def _row_key(self, row:int) -> str:
+        return self._dirs[self._row_dirs[row]]+self._names[row]
+
+    def __contains__(self, key:str):
+        return self._find_row(key) != -1
+
+    def get(self, key:str, filepath:Path=None) -> FileInfo:
+        row = self._find_row(key)
+        if row == -1: return None
+        hash = self._hashes[row]
+        return FileInfo(self._mtimes[row], filepath or Path(key), self._sizes[row], hash.hex() if hash else None)
+
+    def set(self, key:str, mtime:float, size:int=0, hash:str=None):
+        hash = bytes.fromhex(hash) if hash else None
+        row = self._find_row(key)
+        if row != -1:
+            self._mtimes[row] = mtime
+            self._sizes[row] = size or 0
+            self._hashes[row] = hash
+            return
+        directory, name = self._split_key(key)
+        dir_id = self._dir_ids.get(directory, None)
+        if dir_id is None:
+            dir_id = len(self._dirs)
+            self._dirs.append(directory)
+            self._dir_ids[directory] = dir_id
+            self._dir_rows.append({})
+        self._dir_rows[dir_id][name] = len(self._names)
+        self._row_dirs.append(dir_id)
+        self._names.append(name)
+        self._mtimes.append(mtime)
+        self._sizes.append(size or 0)
+        self._hashes.append(hash)
+
+    def set_info(self, key:str, fileinfo:FileInfo):
+        self.set(key, fileinfo.mtime, fileinfo.size, fileinfo.hash)
+
+    def set_from_dict(self, key:str, d:dict):
+        self.set(key, float(d["mtime"]), d.get("size", 0), d.get("hash", None))
+
+    def remove(self, key:str):
+        row = self._find_row(key)
+        if row == -1: return
+        last = len(self._names)-1
+        dir_id, name = self._row_dirs[row], self._names[row]
+        if row != last:
+            # last row takes place of the removed one
+            self._dir_rows[self._row_dirs[last]][self._names[last]] = row
+            for values in (self._row_dirs, self._names, self._mtimes, self._sizes, self._hashes):
+                values[row] = values[last]
+        del self._dir_rows[dir_id][name]
+        for values in (self._row_dirs, self._names, self._mtimes, self._sizes, self._hashes):
+            values.pop()
+
+    def keys(self) -> typing.List[str]:
+        return [self._row_key(row) for row in range(len(self._names))]
+
+    def row_to_dict(self, row:int, filepath:str) -> dict:
+        """`FileInfo.to_dict` compatible entry"""
+        d = {"mtime": self._mtimes[row], "filepath": filepath, "size": self._sizes[row]}
+        if self._hashes[row]: d["hash"] = self._hashes[row].hex()
+        return d
+
+    def to_dict(self, stored_filepath:typing.Callable[[str], str]) -> dict:
+        """*stored_filepath* gives "filepath" value of entry by its key"""
+        d = {}
+        for row in range(len(self._names)):
+            key = self._row_key(row)
+            d[key] = self.row_to_dict(row, stored_filepath(key))
+        return d
+
+    @staticmethod
+    def from_dict(d:dict) -> "FileInfoTable":
+        table = FileInfoTable()
+        for key, info in d.items():
+            table.set_from_dict(key, info)
+        return table
+
+class FilesRegistry(BaseFilesRegistry, Storable):
+    """
+    Json backend of files registry, infos are kept in `FileInfoTable`.
+    Updates are appended to a journal file nearby,
+    `save` compacts them into the json snapshot, it also happens when journal grows to `JOURNAL_COMPACT_THRESHOLD` records.
+    """
+    JOURNAL_COMPACT_THRESHOLD = 1000
+
+    def __init__(self, _storage_file:Path=None, _change_detection="mtime", _root:Path=None, **kwargs) -> None:
+        self._table = FileInfoTable()
+        self.init_change_detection(_change_detection)
+        self.init_root(_root)
+        self._journal = None
+        self._journal_records = 0
+        self._journal_lock = threading.RLock()
+        # table has changes which are not in the journal, like refreshed or removed infos
+        self._changed = False
+        super().__init__(_storage_file=_storage_file, **kwargs)
+
+    @property
+    def journal_file(self) -> Path:
+        return self._storage_file.with_suffix(".journal")
+
+    def get_file_info_by_key(self, key:str)->FileInfo:
+        return self._table.get(key, self.key_to_path(key))
+
+    def put_file_info(self, key:str, fileinfo:FileInfo):
+        self._table.set_info(key, fileinfo)
+        self.write_journal_record(key, fileinfo)
+
+    def on_file_info_refreshed(self, key:str, fileinfo:FileInfo):
+        # stored with the next snapshot
+        self._table.set_info(key, fileinfo)
+        self._changed = True
+
+    def iterate_file_infos(self):
+        # keys are copied, so the table can change while iterating
+        for key in self._table.keys():
+            fileinfo = self.get_file_info_by_key(key)
+            if fileinfo is not None: yield key, fileinfo
+
+    def iterate_keys(self):
+        return iter(self._table.keys())
+
+    def put_file_infos(self, items):
+        # bulk changes skip the journal, snapshot is written at once
+        with self._journal_lock:
+            for key, fileinfo in items:
+                self._table.set_info(key, fileinfo)
+            self.save()
+
+    def remove_file_infos(self, keys):
+        with self._journal_lock:
+            for key in keys:
+                self._table.remove(key)
+                self._changed = True
+
+    @classmethod
+    def from_dict(cls, d:dict):
+        registry:FilesRegistry = cls.__new__(cls)
+        registry._table = FileInfoTable.from_dict(d.get("registry", {}))
+        return registry
+
+    def to_dict(self):
+        # "filepath" of entries is kept relative to the storage dir, like `PathField` does
+        storage_prefix = self._storage_file.parent.resolve().as_posix().rstrip("/")+"/"
+        def stored_filepath(key:str):
+            filepath = self.key_to_posix(key)
+            return filepath[len(storage_prefix):] if filepath.startswith(storage_prefix) else filepath
+        return {"registry": self._table.to_dict(stored_filepath)}
+
+    def write_journal_record(self, key:str, fileinfo:FileInfo):
+        with self._journal_lock, self.paths_relative_to_storage():
+            record = json.dumps({"key": key, "info": fileinfo.to_dict()})
+            if self._journal is None:
+                self._journal = open(self.journal_file, "a", encoding="utf-8")
+            self._journal.write(record+"\n")
+            self._journal.flush()
+            self._journal_records += 1
+            # in batch journal is synced to disk once at the end
+            if not self.in_batch: self.sync_journal()
+        if self._journal_records >= FilesRegistry.JOURNAL_COMPACT_THRESHOLD:
+            self.save()
+
+    def sync_journal(self):
+        if self._journal is None: return
+        os.fsync(self._journal.fileno())
+
+    def flush_batch(self):
+        with self._journal_lock:
+            self.sync_journal()
+
+    def replay_journal(self):
+        """applies journal records written after the last snapshot, torn last record is skipped"""
+        if not self.journal_file.exists(): return
+        with self._journal_lock:
+            with open(self.journal_file, "r", encoding="utf-8") as journal:
+                for line in journal:
+                    try:
+                        record = json.loads(line)
+                        self._table.set_from_dict(record["key"], record["info"])
+                        self._journal_records += 1
+                    except Exception:
+                        break
+
+    def close_journal(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def load(self):
+        with self._journal_lock:
+            if super().load() is None: return None
+            self.replay_journal()
+            return self
+
+    def save(self):
+        """writes snapshot when the journal has records or infos changed, then clears the journal"""
+        with self._journal_lock:
+            if not self._changed and self._journal_records == 0: return True
+            if not super().save(): return False
+            self._changed = False
+            self.close_journal()
+            self.journal_file.write_text("", encoding="utf-8")
+            self._journal_records = 0
+            return True
+
+class SQLiteFilesRegistry(BaseFilesRegistry):
+    """
+    SQLite backend of files registry, for projects with a lot of files.
+    Infos are looked up by indexed key and not kept in memory.
+    Updates made in `batch` are written in one transaction, 
+    every `BATCH_FLUSH_SIZE` records or `BATCH_FLUSH_INTERVAL` seconds.
+    """
+    BATCH_FLUSH_SIZE = 500
+    BATCH_FLUSH_INTERVAL = 2.0
+
+    def __init__(self, _storage_file:Path=None, _change_detection="mtime", _root:Path=None) -> None:
+        self.init_change_detection(_change_detection)
+        self.init_root(_root)
+        self._storage_file = Path(_storage_file or CFD/"files_registry.sqlite")
+        self._connection:sqlite3.Connection = None
+        self._lock = threading.RLock()
+        self._pending:typing.Dict[str, FileInfo] = {}
+        self._last_flush_time = time.monotonic()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None: self.load()
+        return self._connection
+
+    def load(self):
+        with self._lock:
+            if self._connection is not None: return self
+            self._connection = sqlite3.connect(str(self._storage_file), check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            with self._connection:
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS files ("
+                    "key TEXT PRIMARY KEY, mtime REAL NOT NULL, size INTEGER NOT NULL, hash TEXT"
+                    ") WITHOUT ROWID")
+            self.migrate_from_json()
+            return self
+
+    def migrate_from_json(self, json_file:Path=None):
+        """imports infos from json registry nearby, if this registry is empty"""
+        json_file = Path(json_file or self._storage_file.with_suffix(".json"))
+        if not json_file.exists(): return False
+        if self._connection.execute("SELECT 1 FROM files LIMIT 1").fetchone() is not None: return False
+        json_registry = FilesRegistry(_storage_file=json_file, _root=self._root_prefix).load()
+        self.import_from(json_registry)
+        print(f"migrated files registry \"{json_file.name}\" into \"{self._storage_file.name}\"")
         return True
 
-    def update_file_info(self, filepath:Path):
-        filepath = Path(filepath).resolve()
-        if filepath.exists():
-            fileinfo = FileInfo.from_file(filepath)
-            if fileinfo:
-                key = filepath.as_posix()
-                self.registry[key] = fileinfo
-                return fileinfo
-        return None
+    def _row_to_info(self, row) -> FileInfo:
+        key, mtime, size, hash = row
+        return FileInfo(mtime, self.key_to_path(key), size, hash)
+
+    def get_file_info_by_key(self, key:str)->FileInfo:
+        with self._lock:
+            if key in self._pending: return self._pending[key]
+            row = self.connection.execute(
+                "SELECT key, mtime, size, hash FROM files WHERE key = ?", (key,)).fetchone()
+        if row is None: return None
+        return self._row_to_info(row)
+
+    def put_file_info(self, key:str, fileinfo:FileInfo):
+        with self._lock:
+            self._pending[key] = fileinfo
+            if not self.in_batch:
+                self.flush_batch()
+            elif len(self._pending) >= SQLiteFilesRegistry.BATCH_FLUSH_SIZE or \
+                    time.monotonic() - self._last_flush_time >= SQLiteFilesRegistry.BATCH_FLUSH_INTERVAL:
+                self.flush_batch()
+
+    def on_file_info_refreshed(self, key:str, fileinfo:FileInfo):
+        self.put_file_info(key, fileinfo)
+
+    def flush_batch(self):
+        with self._lock:
+            self._last_flush_time = time.monotonic()
+            if len(self._pending) == 0: return
+            rows = [(key, info.mtime, info.size, info.hash) for key, info in self._pending.items()]
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT INTO files (key, mtime, size, hash) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET mtime=excluded.mtime, size=excluded.size, hash=excluded.hash",
+                    rows)
+            self._pending.clear()
+
+    def iterate_file_infos(self):
+        self.flush_batch()
+        with self._lock:
+            rows = self.connection.execute("SELECT key, mtime, size, hash FROM files").fetchall()
+        for row in rows:
+            yield row[0], self._row_to_info(row)
+
+    def iterate_keys(self):
+        self.flush_batch()
+        with self._lock:
+            keys = [row[0] for row in self.connection.execute("SELECT key FROM files")]
+        return iter(keys)
+
+    def remove_file_infos(self, keys):
+        with self._lock:
+            for key in keys: self._pending.pop(key, None)
+            with self.connection:
+                self.connection.executemany("DELETE FROM files WHERE key = ?", [(key,) for key in keys])
+
+    def iterate_file_infos_under(self, directory:Path):
+        prefix = self.dir_key_prefix(directory)
+        if not prefix:
+            yield from super().iterate_file_infos_under(directory)
+            return
+        self.flush_batch()
+        # keys in [prefix, prefix with last "/" replaced by "0") are an index range
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT key, mtime, size, hash FROM files WHERE key >= ? AND key < ?",
+                (prefix, prefix[:-1]+"0")).fetchall()
+        for row in rows:
+            yield self._row_to_info(row)
+
+    def save(self):
+        """writes pending infos"""
+        self.flush_batch()
+        return True
+
+    def close(self):
+        with self._lock:
+            if self._connection is None: return
+            self.flush_batch()
+            self._connection.close()
+            self._connection = None
+
+FILES_REGISTRY_BACKENDS:typing.Dict[str, typing.Type[BaseFilesRegistry]] = {
+    "json": FilesRegistry,
+    "sqlite": SQLiteFilesRegistry,
+}
+
+def make_files_registry(storage_dir:Path, backend="json", change_detection="mtime", root:Path=None) -> BaseFilesRegistry:
+    """
+    makes registry of *backend* stored in *storage_dir* as "files_registry.<backend>",
+    keys of files under *root* are stored relative to it
+    """
+    if backend not in FILES_REGISTRY_BACKENDS:
+        raise Exception(f"unknown files registry backend \"{backend}\", "
+            f"expected one of {list(FILES_REGISTRY_BACKENDS.keys())}")
+    storage_file = Path(storage_dir) / f"files_registry.{backend}"
+    registry_class = FILES_REGISTRY_BACKENDS[backend]
+    return registry_class(_storage_file=storage_file, _change_detection=change_detection, _root=root)
+
+def load_files_registry(storage_file:Path, root:Path=None) -> BaseFilesRegistry:
+    """loads registry file of any backend, backend is known by file suffix"""
+    backend = Path(storage_file).suffix.lstrip(".")
+    registry_class = FILES_REGISTRY_BACKENDS.get(backend, FilesRegistry)
+    return registry_class(_storage_file=storage_file, _root=root).load()
 
 class FilesInDirIterator:
-    def __init__(self, directory: Path, storage_dir: Path) -> None:
-        storage_file = storage_dir / "files_registry.json"
-        self.files_registry = FilesRegistry(_storage_file=storage_file)
+    def __init__(self, directory: Path, storage_dir: Path, change_detection="mtime", backend="json") -> None:
+        self.files_registry = make_files_registry(storage_dir, backend, change_detection, directory)
         self.files_registry.load()
+        # registries written before keys became relative
+        self.files_registry.rebase()
+        self.dependency_index = DependencyIndex(Path(storage_dir)/"dependency_index.json", self.files_registry).load()
         self.directory = directory
+        # keys of files found by the last scan, `save` removes infos of other files
+        self._scanned_keys:typing.Set[str] = None
+
+    def scan(self) -> typing.Dict[str, typing.List[os.DirEntry]]:
+        """
+        walks `self.directory` once, returns files bucketed by normalized extension.
+        entries keep their stat results, so they are not requested again.
+        """
+        buckets:typing.Dict[str, typing.List[os.DirEntry]] = {}
+        scanned_keys:typing.Set[str] = set()
+        root = str(self.directory)
+        directories = [root]
+        while directories:
+            try:
+                entries = os.scandir(directories.pop())
+            except OSError:
+                continue
+            with entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            directories.append(entry.path)
+                        elif entry.is_file():
+                            ext = utils.normalize_extension(os.path.splitext(entry.name)[1])
+                            buckets.setdefault(ext, []).append(entry)
+                            scanned_keys.add(entry.path[len(root)+1:].replace("\\", "/"))
+                    except OSError:
+                        continue
+        self._scanned_keys = scanned_keys
+        return buckets
 
     def iterate_files(self, ext=None) -> Generator[Path, None, None]:
-        pattern = "*"
-        if ext is not None: pattern = "*."+ext
+        buckets = self.scan()
+        if ext is not None:
+            entries = buckets.get(utils.normalize_extension(ext), [])
+        else:
+            entries = [entry for bucket in buckets.values() for entry in bucket]
+        for entry in entries:
+            yield Path(entry.path)
 
-        for filepath in self.directory.rglob(pattern):
-            if filepath.is_file():
+    def _iterate_changed_entries(self, entries:typing.List[os.DirEntry]):
+        for entry in entries:
+            filepath = Path(entry.path)
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            if self.files_registry.is_file_changed(filepath, stat):
                 yield filepath
     
     def iterate_changed_files(self, ext=None):
-        for filepath in self.iterate_files(ext=ext):
-            if self.files_registry.is_file_changed(filepath):
-                yield filepath
+        buckets = self.scan()
+        if ext is not None:
+            yield from self._iterate_changed_entries(buckets.get(utils.normalize_extension(ext), []))
+        else:
+            for bucket in buckets.values():
+                yield from self._iterate_changed_entries(bucket)
+
+    def iterate_changed_files_of_exts(self, exts:typing.List[str], buckets:typing.Dict[str, typing.List[os.DirEntry]]=None):
+        """changed files of every extension in *exts*, in *exts* order, using one directory walk or `scan` *buckets*"""
+        buckets = self.scan() if buckets is None else buckets
+        for ext in exts:
+            yield from self._iterate_changed_entries(buckets.get(utils.normalize_extension(ext), []))
+
+    def iterate_files_of_exts(self, exts:typing.List[str], buckets:typing.Dict[str, typing.List[os.DirEntry]]=None):
+        buckets = self.scan() if buckets is None else buckets
+        for ext in exts:
+            for entry in buckets.get(utils.normalize_extension(ext), []):
+                yield Path(entry.path)
     
     def update_file_info(self, filepath:Path):
         self.files_registry.update_file_info(filepath)
-        self.files_registry.save()
\ No newline at end of file
+
+    def save(self):
+        """
+        compacts registry journal and writes dependency index, call it when a batch of exports is done.
+        infos of files missing in the last scan are removed
+        """
+        if self._scanned_keys is not None:
+            self.files_registry.remove_missing(self._scanned_keys)
+            self.dependency_index.remove_missing(self._scanned_keys)
+            self._scanned_keys = None
+        self.files_registry.save()
+        self.dependency_index.save()
\ No newline at end of file
@@ -18,6 +18,7 @@ import time
 from resources_exporter.resource_types.res_local_config import ResLocalConfig
 
 from ..exporter import ExportResult, ExporterConfig, FileSystemCallbackEventHandler, ResourcesExporter
+from ..scheduler import ExportJob
 from .. import utils
 
 CFD = Path(__file__).parent.resolve()
@@ -90,26 +91,25 @@ class QResourcesExporter(ResourcesExporter, QObject):
             self._should_export_queue = True
 
     def _thread_export_queued_resources(self):
-        sorted_exts = self.resources_registry.sorted_extensions
-        def sort_key(path:Path):
-            ext = utils.normalize_extension(path.suffix)
-            idx = -1
-            try:
-                idx = sorted_exts.index(ext)
-            except:
-                pass
-            return idx
-        
         with self._mutex:
-            files_to_export = sorted(list(self.threaded_files_to_export_queue), key=sort_key)
+            # same file queued several times is exported once
+            files_to_export = list(dict.fromkeys(self.threaded_files_to_export_queue))
             self.threaded_files_to_export_queue.clear()
         
-        for file in files_to_export:
-            cls = self.resources_registry.get_res_class_by_filepath(file)
-            if cls is not None:
-                self._events_queue.put(QueueItem(QueueItem.Type.EXPORT_STARTED, file))
-                result = super().export_one_resource(file)
-                self._events_queue.put(QueueItem(QueueItem.Type.EXPORTED, result))
+        files_to_export = [file for file in self.resources_registry.sort_by_dependencies(files_to_export, self.dependency_index)
+            if self.resources_registry.get_res_class_by_filepath(file) is not None]
+
+        def on_started(job:ExportJob):
+            self._events_queue.put(QueueItem(QueueItem.Type.EXPORT_STARTED, job.filepath))
+        def on_done(job:ExportJob):
+            self._events_queue.put(QueueItem(QueueItem.Type.EXPORTED, job.result))
+
+        scheduler = self.make_export_scheduler(super().export_one_resource)
+        def export_files(files:typing.List[Path]):
+            return scheduler.run(scheduler.build_jobs(files), on_started, on_done)
+        results = export_files(files_to_export)
+        self.export_derived_files(results, export_files, set(files_to_export))
+        self.output_manifest.save()
 
     def export_one_resource(self, filepath: Path):
         with self._mutex:
@@ -117,6 +117,7 @@ class QResourcesExporter(ResourcesExporter, QObject):
             ResLocalConfig.clear_cache()
     
     def update_queues_check(self):
+        file_system_changed = False
         while not self._events_queue.empty():
             qitem = self._events_queue.get()
 
@@ -126,11 +127,16 @@ class QResourcesExporter(ResourcesExporter, QObject):
             elif qitem.type is QueueItem.Type.EXPORTED:
                 result = qitem.data
                 self.exported.emit(result)
-                if result.resource:
+                # superseded file is in the queue again, its new content is not exported yet
+                if result.resource and result.cancel_reason != "superseded":
                     self.files_iterator.update_file_info(result.resource.filepath)
 
             elif qitem.type is QueueItem.Type.FILESYSTEM_CHANGED:
-                self.file_system_changed.emit()
+                file_system_changed = True
+
+        # burst of file system events refreshes views once
+        if file_system_changed:
+            self.file_system_changed.emit()
 
     def _on_file_system_change(self):
         self._events_queue.put(QueueItem(QueueItem.Type.FILESYSTEM_CHANGED))
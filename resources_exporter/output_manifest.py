@@ -0,0 +1,122 @@
+import json
+from pathlib import Path
+import threading
+import typing
+
+from . import utils
+
+class OutputInfo():
+    """output file as it was written by export"""
+    def __init__(self, size:int, mtime:float, hash:str) -> None:
+        self.size:int = size
+        self.mtime:float = mtime
+        self.hash:str = hash
+
+    @staticmethod
+    def from_file(filepath:Path) -> "OutputInfo":
+        stat = filepath.stat()
+        return OutputInfo(stat.st_size, stat.st_mtime, utils.file_hash(filepath))
+
+    def is_file_changed(self, filepath:Path) -> bool:
+        """missing, resized, or touched with other content"""
+        fingerprint = utils.file_fingerprint(filepath)
+        if fingerprint is None or fingerprint[0] != self.size: return True
+        if fingerprint[1] == self.mtime: return False
+        return utils.file_hash(filepath) != self.hash
+
+    def to_list(self) -> list:
+        return [self.size, self.mtime, self.hash]
+
+class OutputManifest():
+    """
+    Output files written by the last export of every source file, stored in *storage_file*:
+    `{source: {output: [size, mtime, hash]}}`, sources are relative to *raw_folder*, outputs to *output_folder*.
+    Is used to find sources with missing or changed outputs, and outputs of removed sources.
+    """
+    def __init__(self, storage_file:Path, raw_folder:Path, output_folder:Path) -> None:
+        self.storage_file = Path(storage_file)
+        self.raw_folder = Path(raw_folder).resolve()
+        self.output_folder = Path(output_folder).resolve()
+        self._lock = threading.Lock()
+        self._sources:typing.Dict[str, typing.Dict[str, OutputInfo]] = {}
+        self._changed = False
+
+    @staticmethod
+    def _key(filepath:Path, folder:Path) -> str:
+        filepath = Path(filepath).resolve()
+        try: return filepath.relative_to(folder).as_posix()
+        except ValueError: return filepath.as_posix()
+
+    def source_key(self, source:Path) -> str:
+        return self._key(source, self.raw_folder)
+
+    def output_key(self, output:Path) -> str:
+        return self._key(output, self.output_folder)
+
+    def source_path(self, key:str) -> Path:
+        return self.raw_folder/key
+
+    def output_path(self, key:str) -> Path:
+        return self.output_folder/key
+
+    def load(self):
+        try:
+            data = json.loads(self.storage_file.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            data = {}
+        with self._lock:
+            self._sources = {source: {output: OutputInfo(*info) for output, info in outputs.items()}
+                for source, outputs in data.items()}
+            self._changed = False
+        return self
+
+    def save(self):
+        with self._lock:
+            if not self._changed: return
+            data = {source: {output: info.to_list() for output, info in outputs.items()}
+                for source, outputs in self._sources.items()}
+            self._changed = False
+        utils.make_dirs_to_file(self.storage_file)
+        utils.atomic_write_text(self.storage_file, json.dumps(data, indent=1))
+
+    def set_outputs(self, source:Path, outputs:typing.Iterable[Path]) -> typing.Dict[str, OutputInfo]:
+        """remembers existing files of *outputs* as written by export of *source*, returns them by output key"""
+        infos = {}
+        for output in outputs:
+            try: infos[self.output_key(output)] = OutputInfo.from_file(Path(output))
+            except OSError: continue
+        with self._lock:
+            self._sources[self.source_key(source)] = infos
+            self._changed = True
+        return infos
+
+    def get_outputs(self, source:Path) -> typing.List[Path]:
+        with self._lock:
+            keys = list(self._sources.get(self.source_key(source), {}).keys())
+        return [self.output_path(key) for key in keys]
+
+    def remove_source(self, source:Path):
+        with self._lock:
+            if self._sources.pop(self.source_key(source), None) is not None:
+                self._changed = True
+
+    def iterate_sources(self) -> typing.Generator[Path, None, None]:
+        with self._lock:
+            keys = list(self._sources.keys())
+        for key in keys:
+            yield self.source_path(key)
+
+    def get_changed_outputs(self, source:Path) -> typing.List[Path]:
+        """outputs of *source* which were removed or changed since its export"""
+        with self._lock:
+            infos = dict(self._sources.get(self.source_key(source), {}))
+        return [self.output_path(key) for key, info in infos.items() if info.is_file_changed(self.output_path(key))]
+
+    def find_orphans(self) -> typing.Dict[Path, typing.List[Path]]:
+        """outputs of sources which do not exist anymore, and are not outputs of other sources, by their source"""
+        with self._lock:
+            sources = {key: list(outputs.keys()) for key, outputs in self._sources.items()}
+        existing = {key for key in sources if self.source_path(key).exists()}
+        used_outputs = {output for key in existing for output in sources[key]}
+        return {self.source_path(key): [self.output_path(output) for output in outputs if output not in used_outputs]
+            for key, outputs in sources.items() if key not in existing}
@@ -0,0 +1,87 @@
+from contextlib import contextmanager
+from pathlib import Path
+import re
+import threading
+import time
+import typing
+
+from .utils import file_fingerprint
+
+# printed by export scripts running in other processes, like blender, see `parse_derived_files`
+DERIVED_FILE_MARKER = "resources_exporter: derived file "
+# same for output files, see `parse_output_files`
+OUTPUT_FILE_MARKER = "resources_exporter: output file "
+
+class OwnWrites():
+    """
+    Files the exporter wrote itself with their (size, mtime) after the write.
+    Observer drops changes of these files while they are the same,
+    the exporter exports them explicitly if they have to be exported.
+    """
+    # records are forgotten after this many seconds
+    TTL = 60.0
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # resolved file -> (fingerprint, time of record)
+        self._records:typing.Dict[Path, tuple] = {}
+        # resolved file -> count of `writing` contexts, file is being written
+        self._writing:typing.Dict[Path, int] = {}
+
+    def record(self, filepath:Path):
+        """call it after *filepath* is written"""
+        filepath = Path(filepath).resolve()
+        fingerprint = file_fingerprint(filepath)
+        now = time.monotonic()
+        with self._lock:
+            for old_filepath, (_, record_time) in list(self._records.items()):
+                if now - record_time > OwnWrites.TTL:
+                    self._records.pop(old_filepath)
+            if fingerprint is not None:
+                self._records[filepath] = (fingerprint, now)
+
+    @contextmanager
+    def writing(self, filepath:Path):
+        """
+        *filepath* is written inside, it is recorded at the end.
+        its changes are own writes already while it is written, observer can report them before `record`
+        """
+        filepath = Path(filepath).resolve()
+        with self._lock:
+            self._writing[filepath] = self._writing.get(filepath, 0) + 1
+        try:
+            yield
+        finally:
+            self.record(filepath)
+            with self._lock:
+                count = self._writing.pop(filepath) - 1
+                if count > 0: self._writing[filepath] = count
+
+    def is_own_write(self, filepath:Path) -> bool:
+        """*filepath* is being written or is the same as the exporter left it. Record of changed file is forgotten"""
+        filepath = Path(filepath).resolve()
+        with self._lock:
+            if filepath in self._writing: return True
+            record = self._records.get(filepath, None)
+            if record is None: return False
+            if file_fingerprint(filepath) == record[0]: return True
+            self._records.pop(filepath)
+            return False
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+own_writes = OwnWrites()
+
+def _parse_marked_files(marker:str, output:str) -> typing.List[Path]:
+    pattern = "^" + re.escape(marker) + "\"(.+)\"\\s*$"
+    return [Path(match.group(1)) for match in re.finditer(pattern, output, flags=re.MULTILINE)]
+
+def parse_derived_files(output:str) -> typing.List[Path]:
+    """files reported by `DERIVED_FILE_MARKER` lines of script *output*"""
+    return _parse_marked_files(DERIVED_FILE_MARKER, output)
+
+def parse_output_files(output:str) -> typing.List[Path]:
+    """files reported by `OUTPUT_FILE_MARKER` lines of script *output*"""
+    return _parse_marked_files(OUTPUT_FILE_MARKER, output)
@@ -6,7 +6,7 @@ class MegaImage(ImageResource):
         utils.make_dirs_to_file(dst_filepath)
 
         color = self.filepath.read_text()
-        cmd = f"\"{self.config.image_magic_cmd}\" -size 64x64 xc:\"{color}\" \"{dst_filepath}\""
+        cmd = f"\"{self.config.image_magic_cmd}\" {self.magick_thread_args} -size 64x64 xc:\"{color}\" \"{dst_filepath}\""
         self.run_program(cmd)
 
     @res_cmd("Turn into mega color", "")
@@ -3,6 +3,11 @@ import typing
 import os
 import datetime
 
+try:
+    from ....resource_types.core.blender_export.output_writer import write_text_if_different
+except ImportError:
+    from output_writer import write_text_if_different
+
 class TextRenderer():
     def __init__(self) -> None:
         self.text = ""
@@ -93,10 +98,5 @@ class QCFileMaker(ValveResRenderer):
         
         return self.text
 
-    def write(self):
-        self.filepath.parent.mkdir(parents=True, exist_ok=True)
-        self.filepath.write_text(self.render())
-
-    def update_file_mtime(self):
-        now = now = datetime.datetime.now().timestamp()
-        os.utime(self.filepath, (now, now))
\ No newline at end of file
+    def write(self) -> bool:
+        return write_text_if_different(self.filepath, self.render())
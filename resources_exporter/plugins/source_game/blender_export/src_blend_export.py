@@ -30,9 +30,8 @@ class MDLCompiler():
         # dont write qc if its already exists
         if not self.qc_maker.filepath.exists():
             self.qc_maker.write()
-        else:
-            # this will trigger exporter to compile model
-            self.qc_maker.update_file_mtime()
+        # exporter compiles model after blender is closed
+        gre_utils.request_export(self.qc_maker.filepath)
 
 class SourceModel(ModelResource):
     MDL_COMPILERS:typing.Dict[str, MDLCompiler] = {}
@@ -70,6 +69,7 @@ class SourceModel(ModelResource):
         bpy.context.scene.vs.export_path = "//"
         bpy.context.scene.vs.export_format = 'SMD'
         bpy.ops.export_scene.smd(collection=self.collection.name)
+        gre_utils.request_export(self.smd_filepath)
 
     @property
     def smd_filepath(self)->Path:
@@ -1,4 +1,5 @@
 from functools import cached_property
+import re
 
 from .renderers.vmt_renderer import VMTRenderer
 from ...resource_types import *
@@ -6,6 +7,36 @@ from ...resource_types import *
 CFD = Path(__file__).parent.resolve()
 
 class SourceMaterialFile(MaterialResource):
+    TEXTURE_PARAMETERS = ["basetexture", "basetexture2", "bumpmap", "bumpmap2", "normalmap",
+        "detail", "envmapmask", "selfillummask", "phongexponenttexture", "blendmodulatetexture"]
+    TEXTURE_SUFFIXES = [".psd", ".png", ".tga", ".bmp", ".jpg", ".jpeg"]
+
+    @staticmethod
+    def find_raw_files(raw_folder:Path, game_path:str, suffixes:typing.List[str]) -> typing.List[Path]:
+        """
+        raw files of "materials/<game_path>" with one of *suffixes*,
+        they can be in "materials" of raw folder or in raw folder itself, see `dst_filepath`
+        """
+        game_path = game_path.replace("\\", "/").strip("/")
+        files = []
+        for rel_path in dict.fromkeys([game_path, game_path.lower()]):
+            for base in [raw_folder/"materials", raw_folder]:
+                for suffix in suffixes:
+                    filepath = base/(rel_path+suffix)
+                    if filepath.is_file() and filepath not in files: files.append(filepath)
+        return files
+
+    def get_referenced_files(self) -> typing.List[Path]:
+        """raw images of textures used by the vmt file"""
+        pattern = r'^\s*"?\$(?:' + "|".join(SourceMaterialFile.TEXTURE_PARAMETERS) + r')"?\s+"?([^"\r\n]+?)"?\s*$'
+        files = []
+        text = self.filepath.read_text(errors="replace")
+        for match in re.finditer(pattern, text, flags=re.MULTILINE|re.IGNORECASE):
+            texture = Path(match.group(1).strip()).with_suffix("").as_posix()
+            for filepath in self.find_raw_files(self.config.raw_folder.resolve(), texture, SourceMaterialFile.TEXTURE_SUFFIXES):
+                if filepath not in files: files.append(filepath)
+        return files
+
     @cached_property
     def relates_to_materials(self):
         return self.filepath.relative_to(self.config.raw_folder).as_posix().startswith("materials")
@@ -23,6 +54,11 @@ class SourceMaterialFile(MaterialResource):
         return ["vmt"]
 
 class SourceImageResource(ImageResource, SourceMaterialFile):
+    # images are converted to .vtf
+    CACHEABLE = True
+    # images do not reference other files, only .vmt files are in the dependency index
+    get_referenced_files = Resource.get_referenced_files
+
     @property
     def vtfcmd_executable(self):
         return self.config.get("vtfcmd_executable", "VTFCmd.exe", True)
@@ -59,6 +95,8 @@ class SourceImageResource(ImageResource, SourceMaterialFile):
 
         renderer = self.render_simple_vmt(dst_filepath)
         renderer.write()
+        # unchanged file keeps its mtime, so it is not found by `collect_outputs`
+        self.add_output(dst_filepath)
 
         return dst_filepath
     
@@ -77,6 +115,16 @@ class SourceImageResource(ImageResource, SourceMaterialFile):
         self.run_program(cmd)
         return dst_filepath
 
+    def get_cache_inputs(self) -> typing.List[Path]:
+        # generated vmt depends on them existing
+        return [self.filepath, self.format_to_normalmap(self.filepath), self.filepath.with_suffix(".vmt")]
+
+    def get_cache_tools(self) -> typing.List[str]:
+        return [self.vtfcmd_executable]
+
+    def get_possible_outputs(self) -> typing.List[Path]:
+        return [self.dst_filepath.with_suffix(".vtf"), self.dst_filepath.with_suffix(".vmt")]
+
     def export(self, **kwargs):
         if self.filepath.suffix == ".vtf":
             super().export(**kwargs)
@@ -89,6 +137,18 @@ class SourceImageResource(ImageResource, SourceMaterialFile):
         return ImageResource.get_extensions() + ["vtf"]
 
 class SourcePhotoshopImage(PhotoshopImage, SourceImageResource):
+    def get_cache_inputs(self) -> typing.List[Path]:
+        return SourceImageResource.get_cache_inputs(self)
+
+    def get_cache_tools(self) -> typing.List[str]:
+        return PhotoshopImage.get_cache_tools(self) + SourceImageResource.get_cache_tools(self)
+
+    def get_cache_key_extra(self) -> str:
+        return ""
+
+    def get_possible_outputs(self) -> typing.List[Path]:
+        return SourceImageResource.get_possible_outputs(self)
+
     def export(self, ico=False, **kwargs):
         png_filepath = self.dst_filepath.with_suffix(".png")
         self.export_png(self.filepath, png_filepath)
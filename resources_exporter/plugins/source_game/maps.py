@@ -1,9 +1,15 @@
 from email.mime import base
+import re
 from ...resource_types import *
 
 CFD = Path(__file__).parent.resolve()
 
 class SourceMapResource(Resource):
+    # vbsp, vvis and vrad use all cores
+    EXPORT_LIMIT = 1
+    EXPORT_WEIGHT = 4
+    EXPORT_MEMORY_MB = 2048
+
     @property
     def vbsp_executable(self):
         return self.config.get("vbsp_executable", "vbsp.exe", True)
@@ -28,8 +34,8 @@ class SourceMapResource(Resource):
         gen_args = f"-game \"{self.config.game_root}\" \"{self.filepath}\""
 
         self.run_program(f"\"{self.vbsp_executable}\" {gen_args}")
-        self.run_program(f"\"{self.vvis_executable}\" {gen_args}")
-        self.run_program(f"\"{self.vrad_executable}\" -StaticPropLighting -StaticPropPolys -both {gen_args}")
+        self.run_program(f"\"{self.vvis_executable}\" -threads {self.thread_budget} {gen_args}")
+        self.run_program(f"\"{self.vrad_executable}\" -threads {self.thread_budget} -StaticPropLighting -StaticPropPolys -both {gen_args}")
 
         if not self.generated_bsp_filepath.exists():
             raise Exception("Failed to generate bsp file")
@@ -39,6 +45,31 @@ class SourceMapResource(Resource):
         shutil.copyfile(self.generated_bsp_filepath, self.dst_bsp_filepath)
         os.remove(self.generated_bsp_filepath)
 
+    def get_possible_outputs(self) -> typing.List[Path]:
+        return [self.dst_bsp_filepath]
+
+    def get_referenced_files(self) -> typing.List[Path]:
+        """raw materials and models used by the map, materials without raw vmt are made from raw images"""
+        # not imported by the module, plugin loader would register the class from its namespace
+        from .images_override import SourceMaterialFile
+        text = self.filepath.read_text(errors="replace")
+        raw_folder = self.config.raw_folder.resolve()
+        files = []
+        materials = dict.fromkeys(re.findall(r'^\s*"material"\s+"([^"]+)"', text, flags=re.MULTILINE|re.IGNORECASE))
+        for material in materials:
+            found = SourceMaterialFile.find_raw_files(raw_folder, material, [".vmt"])
+            found = found or SourceMaterialFile.find_raw_files(raw_folder, material, SourceMaterialFile.TEXTURE_SUFFIXES)
+            files += [filepath for filepath in found if filepath not in files]
+        models = dict.fromkeys(re.findall(r'^\s*"model"\s+"([^"]+\.mdl)"', text, flags=re.MULTILINE|re.IGNORECASE))
+        for model in models:
+            model = Path(model.replace("\\", "/")).with_suffix("")
+            rel_paths = [model, model.relative_to("models")] if model.parts[:1] == ("models",) else [model]
+            for rel_path in rel_paths:
+                for suffix in [".qc", ".blend"]:
+                    filepath = raw_folder/rel_path.with_suffix(suffix)
+                    if filepath.is_file() and filepath not in files: files.append(filepath)
+        return files
+
     def export(self, **kwargs):
         self.compile_map()
 
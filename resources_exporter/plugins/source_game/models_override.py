@@ -3,6 +3,7 @@ from ...resource_types import *
 import re
 import shlex
 from .renderers.vmt_renderer import VMTRenderer
+from ...resource_types.core.blender_export.output_writer import write_text_if_different
 
 CFD = Path(__file__).parent.resolve()
 
@@ -22,7 +23,8 @@ class SourceTextResource(Resource):
     def text(self, value:str):
         self._text = value
     def write(self):
-        self.filepath.write_text(self.text)
+        with self.writing_own_file(self.filepath):
+            write_text_if_different(self.filepath, self.text)
     def add_line_at_start(self, line_text:str):
         self.text = line_text+"\n"+self.text
 
@@ -60,6 +62,11 @@ class SMDModel(SourceTextResource):
         return ModelResource.get_icon()
 
 class SourceQCModel(SourceTextResource):
+    CACHEABLE = True
+    MODEL_SOURCE_SUFFIXES = [".smd", ".dmx", ".vta", ".vrd"]
+    # files studiomdl writes for a model
+    MODEL_OUTPUT_SUFFIXES = [".mdl", ".vvd", ".vtx", ".dx90.vtx", ".dx80.vtx", ".sw.vtx", ".phy", ".ani"]
+
     @property
     def studiomdl_executable(self):
         return self.config.get("studiomdl_executable", "studiomdl.exe", True)
@@ -142,14 +149,15 @@ class SourceQCModel(SourceTextResource):
                     psd = bmp.with_suffix(".psd").resolve()
                     if bmp.exists() and not psd.exists():
                         print(f'trying to convert "{bmp.name}" into psd...')
-                        cmd = f"\"{self.config.image_magic_cmd}\" -colorspace RGB -transparent black  \"{bmp}\" \"{psd}\""
+                        cmd = f"\"{self.config.image_magic_cmd}\" {self.magick_thread_args} -colorspace RGB -transparent black  \"{bmp}\" \"{psd}\""
                         self.run_program(cmd)
             except: pass
         self.remove_cmd("texrendermode")
 
         for renderer in self.vmt_renderers.values():
-            print(colored(f'saved material "{renderer.filepath.name}"', 'green'))
-            renderer.write()
+            if renderer.write():
+                print(colored(f'saved material "{renderer.filepath.name}"', 'green'))
+            self.add_derived_file(renderer.filepath)
         
         self.write()
         if self.text != old_text:
@@ -169,9 +177,40 @@ class SourceQCModel(SourceTextResource):
             shutil.copy(file, self.dst_filepath.parent/file.name)
             os.remove(file)
 
-    def export(self, **kwargs):
+    def get_referenced_files(self) -> typing.List[Path]:
+        """existing model sources used by the qc file, studiomdl adds ".smd" to names without extension"""
+        files = []
+        for line in self.text.splitlines():
+            try:
+                tokens = shlex.split(line.replace("\\", "/"))
+            except ValueError:
+                continue
+            for token in tokens:
+                if not token or token.startswith("$") or token.startswith("/") or token in "{}": continue
+                filepath = self.filepath.parent/token
+                if filepath.suffix.lower() not in SourceQCModel.MODEL_SOURCE_SUFFIXES:
+                    filepath = Path(str(filepath)+".smd")
+                try:
+                    if filepath.is_file() and filepath not in files: files.append(filepath)
+                except OSError:
+                    continue
+        return files
+
+    def get_cache_inputs(self) -> typing.List[Path]:
+        return [self.filepath] + self.get_referenced_files()
+
+    def get_cache_tools(self) -> typing.List[str]:
+        return [self.studiomdl_executable]
+
+    def get_possible_outputs(self) -> typing.List[Path]:
+        name = self.filepath.with_suffix("").name
+        return [self.dst_filepath.parent/(name+suffix) for suffix in SourceQCModel.MODEL_OUTPUT_SUFFIXES]
+
+    def prepare_export(self, **kwargs):
         if not self.is_using_goldsrc:
             self.adjust_to_new_source()
+
+    def export(self, **kwargs):
         self.compile_model()
 
     @staticmethod
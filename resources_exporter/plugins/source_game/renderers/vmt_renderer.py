@@ -3,6 +3,8 @@
 from pathlib import Path
 import json
 
+from ....resource_types.core.blender_export.output_writer import write_text_if_different
+
 class VMTRenderer():
     def __init__(self, filepath:Path) -> None:
         self.filepath = filepath
@@ -137,6 +139,6 @@ class VMTRenderer():
         vmt += "}\n"
         return vmt
     
-    def write(self):
-        self.filepath.parent.mkdir(parents=True, exist_ok=True)
-        self.filepath.write_text(self.render())
\ No newline at end of file
+    def write(self) -> bool:
+        """returns whether the file was written, it is not when it has the same text"""
+        return write_text_if_different(self.filepath, self.render())
\ No newline at end of file
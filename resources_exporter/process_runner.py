@@ -0,0 +1,247 @@
+import asyncio
+import contextvars
+import os
+import signal
+import subprocess
+import threading
+import time
+import typing
+from typing import Callable
+
+LineCallback = Callable[[str], None]
+
+class CancelledError(Exception):
+    pass
+
+class CancelToken():
+    """
+    Cancels one task: programs started while it is `current_cancel_token` are killed by `cancel`,
+    programs are not started after it.
+    Anything with `kill` method can be added to be killed too.
+    """
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._killables = set()
+        self._timer:threading.Timer = None
+        self.cancelled = False
+        self.reason:str = None
+
+    def cancel(self, reason:str="cancelled"):
+        with self._lock:
+            if self.cancelled: return
+            self.cancelled = True
+            self.reason = reason
+            killables = list(self._killables)
+        for killable in killables:
+            killable.kill()
+
+    def cancel_after(self, seconds:float, reason:str="timeout"):
+        self._timer = threading.Timer(seconds, self.cancel, args=(reason,))
+        self._timer.daemon = True
+        self._timer.start()
+
+    def close(self):
+        """stops `cancel_after` timer, call it when the task is done"""
+        if self._timer is not None: self._timer.cancel()
+
+    def raise_if_cancelled(self):
+        if self.cancelled: raise CancelledError(self.reason)
+
+    def add(self, killable):
+        with self._lock:
+            if not self.cancelled:
+                self._killables.add(killable)
+                return
+        killable.kill()
+        self.raise_if_cancelled()
+
+    def discard(self, killable):
+        with self._lock:
+            self._killables.discard(killable)
+
+    def pids(self) -> typing.List[int]:
+        """processes of the task which are running now"""
+        with self._lock:
+            killables = list(self._killables)
+        return [killable.pid for killable in killables if getattr(killable, "pid", None) is not None]
+
+# token of the task running in the current thread or asyncio task
+current_cancel_token:contextvars.ContextVar[CancelToken] = contextvars.ContextVar("current_cancel_token", default=None)
+
+# threads programs of the current task can use, is set by `ExportScheduler` for every job
+current_thread_budget:contextvars.ContextVar[int] = contextvars.ContextVar("current_thread_budget", default=None)
+
+def get_thread_budget() -> int:
+    """`current_thread_budget`, all cpu cores outside of scheduler"""
+    return current_thread_budget.get() or os.cpu_count() or 1
+
+def new_session_kwargs() -> dict:
+    """Popen arguments to start program in its own process group, so `kill_process_tree` kills its children too"""
+    if os.name == "nt": return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+def kill_process_tree(pid:int):
+    if os.name == "nt":
+        subprocess.run(["taskkill", "/F", "/T", "/PID", str(pid)], 
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+class ProcessResult():
+    def __init__(self, args:typing.List[str]) -> None:
+        self.args:typing.List[str] = args
+        self.returncode:int = None
+        self.out:str = ""
+        self.err:str = ""
+        self.start_time:float = None
+        self.duration:float = 0.0
+        self.timed_out = False
+        self.killed = False
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} \"{self.args[0]}\" code={self.returncode} {self.duration:.2f}s>"
+
+class ProcessTimeoutError(Exception):
+    def __init__(self, result:ProcessResult) -> None:
+        self.result = result
+        super().__init__(f"\"{result.args[0]}\" did not finish in {result.duration:.1f}s and was killed")
+
+class ProcessRun():
+    """
+    Runs a program without shell, both stdout and stderr are read at the same time in their own threads,
+    so a program writing a lot into one of them can not block.
+    Lines are given to *on_out_line* and *on_err_line* as they come, in a copy of the starting thread context.
+    `kill` can be called from any thread, it kills children of the program too.
+    Program is killed when `current_cancel_token` of the starting thread is cancelled.
+    """
+    def __init__(self, args:typing.List[str], on_out_line:LineCallback=None, on_err_line:LineCallback=None,
+            cwd=None, env:dict=None) -> None:
+        self.args = [str(arg) for arg in args]
+        self.on_out_line = on_out_line
+        self.on_err_line = on_err_line
+        self.cwd = cwd
+        self.env = env
+        self.process:subprocess.Popen = None
+        self.result = ProcessResult(self.args)
+        self._readers:typing.List[threading.Thread] = []
+        self._cancel_token:CancelToken = None
+
+    def _read_pipe(self, pipe, lines:typing.List[str], callback:LineCallback):
+        with pipe:
+            for line in iter(pipe.readline, ""):
+                lines.append(line)
+                if callback: callback(line.rstrip("\r\n"))
+
+    def start(self):
+        self._cancel_token = current_cancel_token.get()
+        if self._cancel_token: self._cancel_token.raise_if_cancelled()
+        self.result.start_time = time.perf_counter()
+        self.process = subprocess.Popen(self.args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            cwd=self.cwd, env=self.env, universal_newlines=True, errors="replace", **new_session_kwargs())
+        if self._cancel_token: self._cancel_token.add(self)
+        self._out_lines, self._err_lines = [], []
+        for pipe, lines, callback in [(self.process.stdout, self._out_lines, self.on_out_line),
+                (self.process.stderr, self._err_lines, self.on_err_line)]:
+            # callbacks run in the context of the starting task, so its prints are captured by the task
+            reader = threading.Thread(target=contextvars.copy_context().run, args=(self._read_pipe, pipe, lines, callback), daemon=True)
+            reader.start()
+            self._readers.append(reader)
+        return self
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid if self.process is not None else None
+
+    def kill(self):
+        if self.process is not None and self.process.poll() is None:
+            self.result.killed = True
+            kill_process_tree(self.process.pid)
+            self.process.kill()
+
+    def wait(self, timeout:float=None) -> ProcessResult:
+        """
+        waits for the program, kills it after *timeout* seconds and raises `ProcessTimeoutError`.
+        raises `CancelledError` if it was killed by cancel token
+        """
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.result.timed_out = True
+            self.kill()
+            self.process.wait()
+        finally:
+            if self._cancel_token: self._cancel_token.discard(self)
+        for reader in self._readers:
+            # children of killed program can keep pipes open
+            reader.join(5.0 if self.result.killed else None)
+        result = self.result
+        result.returncode = self.process.returncode
+        result.duration = time.perf_counter() - result.start_time
+        result.out, result.err = "".join(self._out_lines), "".join(self._err_lines)
+        if result.timed_out: raise ProcessTimeoutError(result)
+        if self._cancel_token: self._cancel_token.raise_if_cancelled()
+        return result
+
+def run_process(args:typing.List[str], timeout:float=None, on_out_line:LineCallback=None, on_err_line:LineCallback=None,
+        cwd=None, env:dict=None) -> ProcessResult:
+    return ProcessRun(args, on_out_line, on_err_line, cwd, env).start().wait(timeout)
+
+async def run_process_async(args:typing.List[str], timeout:float=None, on_out_line:LineCallback=None, on_err_line:LineCallback=None,
+        cwd=None, env:dict=None) -> ProcessResult:
+    """`run_process` for asyncio event loop"""
+    cancel_token = current_cancel_token.get()
+    if cancel_token: cancel_token.raise_if_cancelled()
+    result = ProcessResult([str(arg) for arg in args])
+    result.start_time = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(*result.args, stdin=subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, cwd=cwd, env=env, **new_session_kwargs())
+
+    class ProcessKiller():
+        pid = process.pid
+        def kill(self):
+            if process.returncode is not None: return
+            result.killed = True
+            kill_process_tree(process.pid)
+            try: process.kill()
+            except ProcessLookupError: pass
+    killer = ProcessKiller()
+    if cancel_token: cancel_token.add(killer)
+
+    async def read_stream(stream:asyncio.StreamReader, lines:typing.List[str], callback:LineCallback):
+        def add_line(raw_line:bytes):
+            line = raw_line.decode(errors="replace")
+            lines.append(line)
+            if callback: callback(line.rstrip("\r\n"))
+        # read by chunks, `readline` fails on lines longer than stream limit
+        tail = b""
+        while True:
+            chunk = await stream.read(65536)
+            if not chunk: break
+            *raw_lines, tail = (tail + chunk).split(b"\n")
+            for raw_line in raw_lines: add_line(raw_line + b"\n")
+        if tail: add_line(tail)
+
+    out_lines, err_lines = [], []
+    readers = asyncio.gather(read_stream(process.stdout, out_lines, on_out_line),
+        read_stream(process.stderr, err_lines, on_err_line), process.wait())
+    try:
+        await asyncio.wait_for(readers, timeout)
+    except asyncio.TimeoutError:
+        result.timed_out = True
+        killer.kill()
+        await process.wait()
+    except asyncio.CancelledError:
+        killer.kill()
+        raise
+    finally:
+        if cancel_token: cancel_token.discard(killer)
+
+    result.returncode = process.returncode
+    result.duration = time.perf_counter() - result.start_time
+    result.out, result.err = "".join(out_lines), "".join(err_lines)
+    if result.timed_out: raise ProcessTimeoutError(result)
+    if cancel_token: cancel_token.raise_if_cancelled()
+    return result
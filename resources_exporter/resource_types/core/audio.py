@@ -4,6 +4,9 @@ from ..resource_base import *
 CFD = Path(__file__).parent.resolve()
 
 class AudioResource(Resource):
+    # copies are materialized by links, in the cache they would only take the disk twice
+    CACHEABLE = False
+
     def export(self, **kwargs):
         return super().export()
 
@@ -1,6 +1,8 @@
 import sys
 import os
 import subprocess
+import hashlib
+import json
 from pathlib import Path
 
 CFD = Path(__file__).parent.resolve()
@@ -30,20 +32,27 @@ def install_requirements():
             print("The godot-parser module could not be installed in the Blender python.")
             print(f"This often happens due to the lack of write permissions to the folder: \n\"{target}\"")
             print("Try changing the permissions or run the exporter with administrator rights.")
-install_requirements()
+# in a blender worker modules loaded by the previous job of this script are reused as they are,
+# `blend_worker.py` forgets them when the script changes
+REUSE_MODULES = os.environ.get("RESOURCES_EXPORTER_BLEND_WORKER") == "1" and "game_resources" in sys.modules
+
+if not REUSE_MODULES: install_requirements()
 
 try:
     from . import gre_utils
+    from . import output_writer
     from . import exporter_core
     from . import game_resources
 except:
     import gre_utils as gre_utils
+    import output_writer
     import exporter_core
     import game_resources
 
-importlib.reload(gre_utils)
-importlib.reload(exporter_core)
-importlib.reload(game_resources)
+if not REUSE_MODULES:
+    importlib.reload(gre_utils)
+    importlib.reload(exporter_core)
+    importlib.reload(game_resources)
 
 try:
     from .exporter_core import *
@@ -53,18 +62,33 @@ except:
     from game_resources import *
 
 class BlendExporter():
+    # made differently fingerprints are not compared with stored ones
+    COLLECTIONS_STATE_VERSION = 1
+
     def __init__(self, config:Config) -> None:
         self.config:Config = config
+        # {collection name: {"fingerprint":, "outputs": [], "derived": []}} of this export
+        self.collections_state:dict = {}
+
+    @property
+    def incremental(self) -> bool:
+        """skip collections not changed since the last export"""
+        return self.config.external_config.get("blend_incremental_collections", True)
 
-    def prepare_workspace_to_export(self):
-        for collection in bpy.context.scene.collection.children.values():
-            bpy.context.view_layer.layer_collection.children.get(collection.name).hide_viewport = False
+    def prepare_workspace_to_export(self, collections:list):
+        layer_collections = bpy.context.view_layer.layer_collection.children
+        for collection in collections:
+            layer_collections.get(collection.name).hide_viewport = False
 
         print("changing mode to OBJECT")
         bpy.ops.object.mode_set(mode = 'OBJECT')
 
-        result = bpy.ops.object.make_single_user(type='ALL', object=True, obdata=True, material=False, animation=False)
+        objects = [obj for collection in collections for obj in collection.objects.values()]
+        if len(objects) == 0: return
+        gre_utils.select_only_objects(objects)
+        result = bpy.ops.object.make_single_user(type='SELECTED_OBJECTS', object=True, obdata=True, material=False, animation=False)
         print(f"getting rid of multi user data... {result}")
+        gre_utils.unselect_all_objects()
 
         # result = utils.apply_modifiers_of_all()
         # print(f"applying modifiers... {result}")
@@ -74,13 +98,166 @@ class BlendExporter():
             collection.hide_render = True
 
     def export_project(self):
-        self.prepare_workspace_to_export()
+        output_writer.default_writer.take_counts()
+        collections = self.get_collections_to_export()
+        self.prepare_workspace_to_export(collections)
         self.deactivate_everything()
         
-        self.export_collections()
+        self.export_collections(collections)
+        self.write_collections_state()
+        self.write_inputs_manifest()
+        written, skipped = output_writer.default_writer.take_counts()
+        print(f"outputs written: {written}, unchanged: {skipped}")
+
+    def get_output_sidecar_path(self, suffix:str) -> Path:
+        """`<output folder>/<blend file relative to raw folder><suffix>`"""
+        try:
+            rel_path = self.config.project_filepath.relative_to(self.config.raw_resources_folder)
+        except (AttributeError, ValueError):
+            return None
+        return self.config.game_resources_dir/(rel_path.as_posix()+suffix)
+
+    @property
+    def inputs_manifest_path(self) -> Path:
+        """`BlenderModel` of the exporter reads it"""
+        return self.get_output_sidecar_path(".inputs.json")
+
+    @property
+    def collections_state_path(self) -> Path:
+        """fingerprints and outputs of collections of the last export"""
+        return self.get_output_sidecar_path(".collections.json")
+
+    def raw_relative_path(self, filepath:Path) -> str:
+        """posix path relative to the raw folder, so the manifest stays valid when the project is moved. absolute for files outside"""
+        filepath = Path(filepath).resolve()
+        try:
+            return filepath.relative_to(Path(self.config.raw_resources_folder).resolve()).as_posix()
+        except (AttributeError, TypeError, ValueError):
+            return filepath.as_posix()
+
+    def get_external_files(self) -> dict:
+        """files this blend file reads: linked libraries and not packed images, relative to the raw folder"""
+        def absolute(filepath, library=None):
+            return self.raw_relative_path(bpy.path.abspath(filepath, library=library))
+        libraries = [absolute(library.filepath) for library in bpy.data.libraries if library.filepath]
+        images = [absolute(image.filepath, image.library) for image in bpy.data.images
+            if image.source in {"FILE", "SEQUENCE", "MOVIE"} and image.filepath and image.packed_file is None]
+        return {"libraries": sorted(set(libraries)), "images": sorted(set(images))}
+
+    def write_inputs_manifest(self):
+        """exporter exports this blend file after the files it reads, and again when they change"""
+        filepath = self.inputs_manifest_path
+        if filepath is None: return
+        manifest = {"blend_file": self.raw_relative_path(self.config.project_filepath)}
+        manifest.update(self.get_external_files())
+        output_writer.write_text_if_different(filepath, json.dumps(manifest, indent=1), "utf-8")
+        gre_utils.report_output(filepath)
+
+    @staticmethod
+    def get_model_name(collection_name:str) -> str:
+        """name of the model of *collection_name*, like `ModelResource.from_collection` makes it"""
+        if collection_name.endswith("_phy"): return collection_name[:collection_name.rfind("_phy")]
+        pref_pos = collection_name.rfind("_ref")
+        return collection_name[:pref_pos] if pref_pos != -1 else collection_name
+
+    def get_common_fingerprint(self) -> str:
+        """hash of what every collection export depends on: export scripts, exporter config, scene settings and actions"""
+        hasher = hashlib.blake2b(digest_size=16)
+        scripts = set(CFD.glob("*.py"))
+        main_file = getattr(sys.modules.get("__main__", None), "__file__", None)
+        if main_file: scripts.update(Path(main_file).resolve().parent.glob("*.py"))
+        for script in sorted(scripts):
+            hasher.update(script.read_bytes())
+        hasher.update(json.dumps(self.config.external_config, sort_keys=True, default=str).encode())
+        scene = bpy.context.scene
+        hasher.update(repr(gre_utils.get_rna_values(scene.render)).encode())
+        if scene.camera is not None:
+            hasher.update(repr([list(row) for row in scene.camera.matrix_world]).encode())
+            hasher.update(repr(gre_utils.get_rna_values(scene.camera.data)).encode())
+        hasher.update(gre_utils.get_actions_fingerprint().encode())
+        return hasher.hexdigest()
+
+    def get_fingerprints(self) -> dict:
+        """fingerprint of every collection, made with fingerprints of other collections of the same model"""
+        common = self.get_common_fingerprint()
+        own = {name: gre_utils.get_collection_fingerprint(collection)
+            for name, collection in bpy.context.scene.collection.children.items()}
+        by_model = {}
+        for name in sorted(own):
+            by_model.setdefault(self.get_model_name(name), []).append(name)
+        fingerprints = {}
+        for name in own:
+            hasher = hashlib.blake2b(digest_size=16)
+            hasher.update(common.encode())
+            for related in by_model[self.get_model_name(name)]:
+                hasher.update(f"{related}:{own[related]};".encode())
+            fingerprints[name] = hasher.hexdigest()
+        return fingerprints
+
+    def read_collections_state(self) -> dict:
+        filepath = self.collections_state_path
+        if filepath is None: return {}
+        try:
+            data = json.loads(filepath.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+        if data.get("version", None) != BlendExporter.COLLECTIONS_STATE_VERSION: return {}
+        return data.get("collections", {})
+
+    @staticmethod
+    def get_file_stat(filepath) -> list:
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return None
+        return [stat.st_size, stat.st_mtime]
+
+    def is_collection_unchanged(self, state:dict, fingerprint:str) -> bool:
+        """*state* of the last export has the same fingerprint, and its files are not removed or changed since"""
+        if state is None or state.get("fingerprint", None) != fingerprint: return False
+        files = dict(state.get("outputs", {}))
+        files.update(state.get("derived", {}))
+        return all(self.get_file_stat(filepath) == file_stat for filepath, file_stat in files.items())
+
+    def get_collections_to_export(self) -> list:
+        """
+        collections changed since the last export, outputs of unchanged ones are reported again,
+        so they stay in the outputs manifest of the exporter
+        """
+        collections = bpy.context.scene.collection.children
+        fingerprints = self.get_fingerprints()
+        last_state = self.read_collections_state() if self.incremental else {}
+        to_export = []
+        for name, fingerprint in fingerprints.items():
+            state = last_state.get(name, None)
+            if not self.is_collection_unchanged(state, fingerprint):
+                self.collections_state[name] = {"fingerprint": fingerprint, "outputs": [], "derived": []}
+                to_export.append(collections.get(name))
+                continue
+            print(f"collection \"{name}\" is not changed, skipping")
+            self.collections_state[name] = {"fingerprint": fingerprint, 
+                "outputs": list(state.get("outputs", {}).keys()), "derived": list(state.get("derived", {}).keys())}
+            for filepath in self.collections_state[name]["outputs"]:
+                gre_utils.report_output(filepath)
+        print(f"collections to export: {len(to_export)} of {len(fingerprints)}")
+        return to_export
+
+    def write_collections_state(self):
+        """files are stated after all exports, as a collection can rewrite outputs of another one, like shared materials"""
+        filepath = self.collections_state_path
+        if filepath is None: return
+        collections = {}
+        for name, state in self.collections_state.items():
+            collections[name] = {"fingerprint": state["fingerprint"],
+                "outputs": {path: self.get_file_stat(path) for path in state["outputs"]},
+                "derived": {path: self.get_file_stat(path) for path in state["derived"]}}
+        data = {"version": BlendExporter.COLLECTIONS_STATE_VERSION, "collections": collections}
+        output_writer.write_text_if_different(filepath, json.dumps(data, indent=1, sort_keys=True), "utf-8")
+        gre_utils.report_output(filepath)
 
-    def export_collections(self):
-        for collection_key in bpy.context.scene.collection.children.keys():
+    def export_collections(self, collections:list=None):
+        if collections is None: collections = bpy.context.scene.collection.children.values()
+        for collection_key in [collection.name for collection in collections]:
             def get_collection():
                 return bpy.context.scene.collection.children.get(collection_key)
             collection = get_collection()
@@ -90,7 +267,13 @@ class BlendExporter():
             collection.hide_render = False
             collection.hide_select = False
 
+            outputs_start = len(gre_utils.reported_outputs)
+            derived_start = len(gre_utils.requested_exports)
             self.export_one_collection(collection)
+            state = self.collections_state.get(collection_key, None)
+            if state is not None:
+                state["outputs"] += gre_utils.reported_outputs[outputs_start:]
+                state["derived"] += gre_utils.requested_exports[derived_start:]
 
             collection = get_collection()
             
@@ -0,0 +1,121 @@
+"""
+Long-lived blender process, which runs export scripts for many blend files.
+Is started by `BlenderPool` of the exporter:
+
+    blender -b --python blend_worker.py -- <port> <authkey hex>
+
+and gets jobs `{"blend_file": ..., "script": ..., "threads": ...}` over connection, `None` stops it.
+For every job the blend file is opened, so the scene is reset,
+and the script is ran as `__main__`. Modules imported by the script stay loaded for next jobs of the same script,
+scripts see `BLEND_WORKER_ENV` and do not reload them.
+"""
+import contextlib
+import io
+import os
+from multiprocessing.connection import Client
+from pathlib import Path
+import runpy
+import sys
+import traceback
+
+import bpy
+
+EXPORTER_DIR = Path(__file__).resolve().parents[3]
+# is "1" in blender worker processes
+BLEND_WORKER_ENV = "RESOURCES_EXPORTER_BLEND_WORKER"
+
+def get_memory_usage() -> int:
+    """peak resident memory of this process in bytes"""
+    try:
+        import resource
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on linux, bytes on mac
+        return usage if sys.platform == "darwin" else usage*1024
+    except ImportError:
+        pass
+    try:
+        import ctypes
+        from ctypes import wintypes
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb)
+        return counters.WorkingSetSize
+    except Exception:
+        return 0
+
+class BlendWorker():
+    def __init__(self, connection) -> None:
+        self.connection = connection
+        self.last_script:str = None
+        self.base_sys_path = list(sys.path)
+        self.base_modules = set(sys.modules.keys())
+
+    def forget_exporter_modules(self):
+        """drops modules of exporter scripts, so the next script gets them clean"""
+        for name, module in list(sys.modules.items()):
+            if name in self.base_modules: continue
+            module_file = getattr(module, "__file__", None)
+            if module_file and EXPORTER_DIR in Path(module_file).resolve().parents:
+                sys.modules.pop(name)
+        sys.path[:] = self.base_sys_path
+
+    def reset_job_state(self):
+        """clears state loaded modules keep for one job, like files reported by `gre_utils`"""
+        for name, module in list(sys.modules.items()):
+            if name.rsplit(".", 1)[-1] == "gre_utils" and hasattr(module, "reset_reports"):
+                module.reset_reports()
+
+    def set_threads(self, threads:int):
+        """same as `-t` argument of blender, 0 - all cores"""
+        for scene in bpy.data.scenes:
+            scene.render.threads_mode = "FIXED" if threads > 0 else "AUTO"
+            if threads > 0: scene.render.threads = threads
+
+    def run_job(self, blend_file:str, script:str, threads:int=0) -> dict:
+        if self.last_script is not None and script != self.last_script:
+            self.forget_exporter_modules()
+        self.last_script = script
+        self.reset_job_state()
+
+        out, err = io.StringIO(), io.StringIO()
+        success = True
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+            try:
+                bpy.ops.wm.open_mainfile(filepath=blend_file, load_ui=False)
+                self.set_threads(threads)
+                runpy.run_path(script, run_name="__main__")
+            except SystemExit:
+                pass
+            except BaseException:
+                traceback.print_exc()
+                success = False
+        return {"success": success, "out": out.getvalue(), "err": err.getvalue(), "memory": get_memory_usage()}
+
+    def run(self):
+        while True:
+            try:
+                job = self.connection.recv()
+            except EOFError:
+                break
+            if job is None: break
+            self.connection.send(self.run_job(job["blend_file"], job["script"], job.get("threads", 0)))
+
+def main():
+    args = sys.argv[sys.argv.index("--")+1:]
+    port, authkey = int(args[0]), bytes.fromhex(args[1])
+    os.environ[BLEND_WORKER_ENV] = "1"
+    connection = Client(("127.0.0.1", port), authkey=authkey)
+    try:
+        BlendWorker(connection).run()
+    finally:
+        connection.close()
+
+if __name__ == '__main__':
+    main()
@@ -19,9 +19,11 @@ import shlex
 
 try:
     from . import gre_utils
+    from . import output_writer
     from .exporter_core import *
 except:
     import gre_utils as gre_utils
+    import output_writer
     from exporter_core import *
 
 class GodotResPath(type(pathlib.Path())):
@@ -39,7 +41,9 @@ class GodotResSaver():
         self.filepath:Path = filepath
     
     def save(self):
-        self.res.write(str(self.filepath.resolve()))
+        # same text as `GDFile.write`, file is not touched when it is unchanged
+        output_writer.write_text_if_different(self.filepath.resolve(), str(self.res), "utf-8")
+        gre_utils.report_output(self.filepath)
 
 class GDTypedResource(gp.GDResource):
     def __init__(self, type:str="Resource", *sections: gp.GDSection) -> None:
@@ -345,6 +349,7 @@ class ModelResource(GameResource):
             axis_forward='-Z',
             use_mesh_modifiers=True,
             axis_up='Y')
+        gre_utils.report_output(filepath)
 
     def export_glb(self):
         self.select_related_objects()
@@ -357,6 +362,7 @@ class ModelResource(GameResource):
             # export_materials="NONE",
             export_lights=True,
             )
+        gre_utils.report_output(filepath)
 
 class ViewModel(ModelResource):
     class AnimationStruct:
@@ -464,6 +470,7 @@ class ViewModel(ModelResource):
                 scene.render.filepath = output_folder.as_posix()+"/"+filename
                 animation.images.append((output_folder/filename).with_suffix(".png"))
                 bpy.ops.render.render(False, animation=False, write_still=True)
+                gre_utils.report_output((output_folder/filename).with_suffix(".png"))
             
             print()
             print(f"Rendered animation \"{name}\" to folder \"{output_folder.as_posix()}\"")
@@ -584,6 +591,7 @@ class ViewModel(ModelResource):
         filepath = self.output_path.with_name(self.name+"_icon.png")
         scene.render.filepath = filepath.as_posix()
         bpy.ops.render.render(write_still=True)
+        gre_utils.report_output(filepath)
 
 ModelResource.VIEW_MODEL_CLASS = ViewModel
 
@@ -12,6 +12,29 @@ from pathlib import Path
 from mathutils import Vector
 import shlex
 import time
+import array
+import hashlib
+
+# files reported by this export, `BlendExporter` remembers them for every collection
+requested_exports = []
+reported_outputs = []
+
+def reset_reports():
+    """forgets files reported by the previous export, blender worker calls it for every job"""
+    requested_exports.clear()
+    reported_outputs.clear()
+
+def request_export(filepath):
+    """tells the exporter that raw *filepath* is written by this export and has to be exported"""
+    filepath = Path(filepath).resolve().as_posix()
+    requested_exports.append(filepath)
+    print(f"resources_exporter: derived file \"{filepath}\"")
+
+def report_output(filepath):
+    """tells the exporter that output *filepath* is written by this export, so it is in its outputs manifest"""
+    filepath = Path(filepath).resolve().as_posix()
+    reported_outputs.append(filepath)
+    print(f"resources_exporter: output file \"{filepath}\"")
 
 def format_modelname(model_name):
     if model_name[-4:] == "_ref": model_name = model_name[:-4]
@@ -142,4 +165,155 @@ def apply_modifiers(objects):
             pass
             # obj.modifiers.remove(m)
     
-    return {'FINISHED'}
\ No newline at end of file
+    return {'FINISHED'}
+
+def _update_hash(hasher, *parts):
+    for part in parts:
+        part = part if isinstance(part, bytes) else repr(part).encode()
+        # length prefix, so ("ab", "c") and ("a", "bc") are different
+        hasher.update(len(part).to_bytes(8, "little"))
+        hasher.update(part)
+
+def _foreach_bytes(collection, attr, typecode, size=1):
+    values = array.array(typecode, [0]) * (len(collection)*size)
+    collection.foreach_get(attr, values)
+    return values.tobytes()
+
+def _property_values(value):
+    """custom property as plain python value"""
+    if hasattr(value, "to_dict"): return value.to_dict()
+    if hasattr(value, "to_list"): return value.to_list()
+    return value
+
+def get_custom_properties(id_data) -> list:
+    return [(key, _property_values(id_data[key])) for key in sorted(id_data.keys()) if key != "_RNA_UI"]
+
+# properties of the editor only, they do not change exported data
+_UI_PROPERTIES = {"rna_type", "location", "width", "height", "dimensions", "select", "hide", 
+    "show_expanded", "show_options", "show_preview", "show_texture", "show_viewport", "show_in_editmode", "show_on_cage"}
+
+def get_rna_values(struct, linked_ids:list=None) -> list:
+    """
+    values of rna properties of *struct*, data blocks it points to are named
+    and appended to *linked_ids*, so they can be hashed too
+    """
+    values = []
+    for prop in struct.bl_rna.properties:
+        if prop.identifier in _UI_PROPERTIES: continue
+        if prop.type in {"BOOLEAN", "INT", "FLOAT", "STRING", "ENUM"}:
+            value = getattr(struct, prop.identifier, None)
+            if getattr(prop, "is_array", False) or isinstance(value, set):
+                try: value = sorted(value) if isinstance(value, set) else list(value)
+                except TypeError: pass
+            values.append((prop.identifier, value))
+        elif prop.type == "POINTER":
+            value = getattr(struct, prop.identifier, None)
+            if isinstance(value, bpy.types.ID):
+                values.append((prop.identifier, value.name))
+                if linked_ids is not None: linked_ids.append(value)
+    return values
+
+def _hash_mesh(hasher, mesh, with_weights:bool):
+    _update_hash(hasher, 
+        _foreach_bytes(mesh.vertices, "co", "f", 3),
+        _foreach_bytes(mesh.loops, "vertex_index", "i"),
+        _foreach_bytes(mesh.polygons, "loop_total", "i"),
+        _foreach_bytes(mesh.polygons, "material_index", "i"),
+        _foreach_bytes(mesh.polygons, "use_smooth", "b"))
+    for uv_layer in mesh.uv_layers:
+        _update_hash(hasher, uv_layer.name, _foreach_bytes(uv_layer.data, "uv", "f", 2))
+    for vertex in (mesh.vertices if with_weights else []):
+        if len(vertex.groups) > 0: _update_hash(hasher, vertex.index, [(group.group, group.weight) for group in vertex.groups])
+    if mesh.shape_keys is not None:
+        for key_block in mesh.shape_keys.key_blocks:
+            _update_hash(hasher, key_block.name, _foreach_bytes(key_block.data, "co", "f", 3))
+
+def _hash_material(hasher, material, linked_ids:list):
+    _update_hash(hasher, get_rna_values(material), get_custom_properties(material))
+    if material.node_tree is None: return
+    for node in sorted(material.node_tree.nodes, key=lambda node: node.name):
+        _update_hash(hasher, node.name, node.bl_idname, get_rna_values(node, linked_ids))
+        for socket in node.inputs:
+            value = getattr(socket, "default_value", None)
+            try: value = list(value)
+            except TypeError: pass
+            _update_hash(hasher, socket.identifier, value)
+    for link in material.node_tree.links:
+        _update_hash(hasher, link.from_node.name, link.from_socket.identifier, link.to_node.name, link.to_socket.identifier)
+
+def _hash_image(hasher, image):
+    _update_hash(hasher, image.source, image.filepath, list(image.size))
+    if image.packed_file is not None:
+        _update_hash(hasher, image.packed_file.size)
+        return
+    try:
+        stat = os.stat(bpy.path.abspath(image.filepath, library=image.library))
+        _update_hash(hasher, stat.st_size, stat.st_mtime)
+    except (OSError, ValueError):
+        _update_hash(hasher, None)
+
+def _hash_object(hasher, obj, linked_ids:list):
+    _update_hash(hasher, obj.name, obj.type, obj.parent.name if obj.parent else None,
+        [list(row) for row in obj.matrix_world], obj.hide_render, get_custom_properties(obj),
+        [slot.material.name if slot.material else None for slot in obj.material_slots],
+        list(obj.vertex_groups.keys()))
+    for modifier in obj.modifiers:
+        _update_hash(hasher, modifier.name, modifier.type, get_rna_values(modifier, linked_ids))
+    for constraint in obj.constraints:
+        _update_hash(hasher, constraint.name, constraint.type, get_rna_values(constraint, linked_ids))
+    if obj.animation_data is not None and obj.animation_data.action is not None:
+        linked_ids.append(obj.animation_data.action)
+    if obj.data is None: return
+
+    data = obj.data
+    _update_hash(hasher, data.name, get_custom_properties(data))
+    if obj.type == "MESH":
+        _hash_mesh(hasher, data, len(obj.vertex_groups) > 0)
+        linked_ids.extend(material for material in data.materials if material is not None)
+    elif obj.type == "ARMATURE":
+        for bone in data.bones:
+            _update_hash(hasher, bone.name, bone.parent.name if bone.parent else None,
+                [list(row) for row in bone.matrix_local], bone.length, bone.use_deform)
+    elif obj.type == "CURVE":
+        for spline in data.splines:
+            _update_hash(hasher, spline.type, spline.use_cyclic_u,
+                _foreach_bytes(spline.points, "co", "f", 4), _foreach_bytes(spline.bezier_points, "co", "f", 3))
+        _update_hash(hasher, get_rna_values(data, linked_ids))
+    else:
+        _update_hash(hasher, get_rna_values(data, linked_ids))
+
+def _hash_action(hasher, action):
+    _update_hash(hasher, list(action.frame_range), [(marker.name, marker.frame) for marker in action.pose_markers])
+    for fcurve in action.fcurves:
+        _update_hash(hasher, fcurve.data_path, fcurve.array_index,
+            _foreach_bytes(fcurve.keyframe_points, "co", "f", 2),
+            [keyframe.interpolation for keyframe in fcurve.keyframe_points])
+
+def get_collection_fingerprint(collection) -> str:
+    """
+    hash of the collection as it is exported: object transforms, mesh data, modifiers, materials
+    with their images, actions and custom properties, including objects and data they point to
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    _update_hash(hasher, collection.name, get_custom_properties(collection))
+    hashed = set()
+    linked_ids = sorted(collection.all_objects, key=lambda obj: obj.name)
+    while linked_ids:
+        id_data = linked_ids.pop(0)
+        id_key = (type(id_data).__name__, id_data.name, id_data.library.filepath if id_data.library else None)
+        if id_key in hashed: continue
+        hashed.add(id_key)
+        _update_hash(hasher, id_key)
+        if isinstance(id_data, bpy.types.Object): _hash_object(hasher, id_data, linked_ids)
+        elif isinstance(id_data, bpy.types.Material): _hash_material(hasher, id_data, linked_ids)
+        elif isinstance(id_data, bpy.types.Image): _hash_image(hasher, id_data)
+        elif isinstance(id_data, bpy.types.Action): _hash_action(hasher, id_data)
+    return hasher.hexdigest()
+
+def get_actions_fingerprint() -> str:
+    """hash of all actions, view models read events of all of them"""
+    hasher = hashlib.blake2b(digest_size=16)
+    for action in sorted(bpy.data.actions, key=lambda action: action.name):
+        _update_hash(hasher, action.name)
+        _hash_action(hasher, action)
+    return hasher.hexdigest()
@@ -0,0 +1,102 @@
+"""
+Writes files only when their content changes, so an identical rewrite does not touch mtime,
+which makes godot reimport the resource and wakes the exporter observer.
+Is used by the exporter and by scripts running in blender, so it needs only the standard library.
+"""
+import hashlib
+import locale
+import os
+from pathlib import Path
+import tempfile
+import threading
+import typing
+
+def _hash_file(filepath, chunk_size:int=1024*1024) -> bytes:
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(filepath, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.digest()
+
+def _get_umask() -> int:
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+# read once, changing umask is not thread safe
+_UMASK = _get_umask()
+
+def set_replacing_file_mode(tmp_path, filepath):
+    """
+    temporary files are made with 0600 mode, *tmp_path* gets mode of *filepath* it replaces,
+    or mode of a new file when there is no *filepath*
+    """
+    try:
+        mode = os.stat(filepath).st_mode & 0o7777
+    except OSError:
+        mode = 0o666 & ~_UMASK
+    os.chmod(tmp_path, mode)
+
+def atomic_write_bytes(filepath:Path, data:bytes):
+    """writes *data* into a temporary file nearby and replaces *filepath* with it, so *filepath* is never half-written"""
+    filepath = Path(filepath)
+    fd, tmp_path = tempfile.mkstemp(prefix="."+filepath.name+".", suffix=".tmp", dir=filepath.parent)
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        set_replacing_file_mode(tmp_path, filepath)
+        os.replace(tmp_path, filepath)
+    except:
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+        raise
+
+class OutputWriter():
+    """writes files atomically when their content differs, counts written and skipped files"""
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.written = 0
+        self.skipped = 0
+
+    @staticmethod
+    def has_content(filepath:Path, data:bytes) -> bool:
+        """compares size first, content is hashed only for files of the same size"""
+        try:
+            if os.path.getsize(filepath) != len(data): return False
+            return _hash_file(filepath) == hashlib.blake2b(data, digest_size=16).digest()
+        except OSError:
+            return False
+
+    def write_bytes(self, filepath:Path, data:bytes) -> bool:
+        """writes *data* unless *filepath* already has it, returns whether it was written"""
+        filepath = Path(filepath)
+        if self.has_content(filepath, data):
+            with self._lock: self.skipped += 1
+            return False
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write_bytes(filepath, data)
+        with self._lock: self.written += 1
+        return True
+
+    def write_text(self, filepath:Path, text:str, encoding:str=None) -> bool:
+        """`write_bytes` of *text* encoded the way `Path.write_text` does it, with platform line endings"""
+        encoding = encoding or locale.getpreferredencoding(False)
+        if os.linesep != "\n": text = text.replace("\n", os.linesep)
+        return self.write_bytes(filepath, text.encode(encoding))
+
+    def take_counts(self) -> typing.Tuple[int, int]:
+        """(written, skipped) since the last call"""
+        with self._lock:
+            counts = (self.written, self.skipped)
+            self.written = self.skipped = 0
+        return counts
+
+# writer of this process, outputs of all exports are counted by it
+default_writer = OutputWriter()
+
+def write_bytes_if_different(filepath:Path, data:bytes) -> bool:
+    return default_writer.write_bytes(filepath, data)
+
+def write_text_if_different(filepath:Path, text:str, encoding:str=None) -> bool:
+    return default_writer.write_text(filepath, text, encoding)
@@ -6,6 +6,9 @@ from ..resource_base import *
 CFD = Path(__file__).parent.resolve()
 
 class ImageResource(Resource):
+    # copies are materialized by links, in the cache they would only take the disk twice
+    CACHEABLE = False
+
     def export(self, **kwargs):
         return super().export(**kwargs)
 
@@ -17,7 +20,7 @@ class ImageResource(Resource):
     def convert_to_psd_cmd(self):
         src_filepath = self.filepath.resolve()
         dst_filepath = src_filepath.with_suffix(".psd")
-        cmd = f'{self.config.image_magic_cmd} "{src_filepath}" "{dst_filepath}"'
+        cmd = f'{self.config.image_magic_cmd} {self.magick_thread_args} "{src_filepath}" "{dst_filepath}"'
         self.run_program(cmd)
 
     @staticmethod
@@ -25,6 +28,23 @@ class ImageResource(Resource):
         return CFD/"icons/image.png"
 
 class PhotoshopImage(ImageResource):
+    EXPORT_LIMIT = 8
+    CACHEABLE = True
+
+    def get_cache_tools(self) -> typing.List[str]:
+        return [shlex.split(self.config.image_magic_cmd)[0]]
+
+    def get_glb_paths(self, dst_filepath:Path) -> typing.List[Path]:
+        """pngs for models nearby *dst_filepath*, they are updated too"""
+        dst_filepath = dst_filepath.with_suffix(".png")
+        return [dst_filepath.with_stem(glbfile.stem+"_"+dst_filepath.stem) for glbfile in dst_filepath.parent.glob("*.glb")]
+
+    def get_cache_key_extra(self) -> str:
+        return " ".join(sorted(path.name for path in self.get_glb_paths(self.dst_filepath) if path.exists()))
+
+    def get_possible_outputs(self) -> typing.List[Path]:
+        return [self.dst_filepath.with_suffix(".png"), self.dst_filepath.with_suffix(".ico")] + self.get_glb_paths(self.dst_filepath)
+
     def export(self, ico=False, **kwargs):
         self.export_png(self.filepath, self.dst_filepath)
         if ico: self.export_ico(self.filepath, self.dst_filepath)
@@ -34,7 +54,7 @@ class PhotoshopImage(ImageResource):
         utils.make_dirs_to_file(dst_filepath)
 
         def convert_to_png(dst_filepath):
-            cmd = f'{self.config.image_magic_cmd} "{src_filepath}[0]" "{dst_filepath}"'
+            cmd = f'{self.config.image_magic_cmd} {self.magick_thread_args} "{src_filepath}[0]" "{dst_filepath}"'
             self.run_program(cmd)
 
         convert_to_png(dst_filepath)
@@ -51,7 +71,7 @@ class PhotoshopImage(ImageResource):
     def export_ico(self, src_filepath:Path, dst_filepath:Path):
         ico_filepath = dst_filepath.with_suffix(".ico")
         utils.make_dirs_to_file(dst_filepath)
-        cmd = f'{self.config.image_magic_cmd} "{src_filepath}[0]" -define icon:auto-resize=128,64,48,32,16 "{ico_filepath}"'
+        cmd = f'{self.config.image_magic_cmd} {self.magick_thread_args} "{src_filepath}[0]" -define icon:auto-resize=128,64,48,32,16 "{ico_filepath}"'
         self.run_program(cmd)
         return ico_filepath
 
@@ -71,6 +91,8 @@ class PhotoshopImage(ImageResource):
 PhotoshopImage.add_setting("ico", "Create .ico file", "Export .ico")
 
 class MaterialResource(Resource):
+    CACHEABLE = True
+
     @staticmethod
     def get_extensions():
         return []
@@ -1,12 +1,18 @@
+import json
 import os
 from pathlib import Path
 from ..resource_base import *
 from ..plugin import *
+from ...own_writes import parse_derived_files, parse_output_files
+from ...blender_pool import get_blender_pool
 
 CFD = Path(__file__).parent.resolve()
 CWD = Path(os.getcwd()).resolve()
 
 class ModelResource(Resource):
+    # copies are materialized by links, in the cache they would only take the disk twice
+    CACHEABLE = False
+
     def export(self, **kwargs):
         return super().export(**kwargs)
 
@@ -19,22 +25,71 @@ class ModelResource(Resource):
         return CFD/"icons/mesh.png"
 
 class BlenderModel(ModelResource):
+    EXPORT_LIMIT = 2
+    EXPORT_MEMORY_MB = 1024
+    # blend files link libraries and images
+    CACHEABLE = False
+
     def export(self, **kwargs):
         blend_export_script = CFD/"blender_export/blend_export.py"
         self.export_using_script(blend_export_script)
 
-    def export_using_script(self, blend_export_script:Path):
-        raw_resources_folder = self.config.raw_folder
-        export_folder = self.config.output_folder
-        game_root = self.config.game_root
-        cmd = f'blender "{self.filepath.as_posix()}" -b --python "{blend_export_script.as_posix()}"'
+    @property
+    def inputs_manifest_path(self) -> Path:
+        """external files the blend file read in its last export, `blend_export.py` writes it next to the outputs"""
+        return self.dst_filepath.with_name(self.dst_filepath.name+".inputs.json")
+
+    def get_referenced_files(self) -> typing.List[Path]:
+        """
+        existing libraries and images from `inputs_manifest_path`, `None` before the first export.
+        paths of the manifest are relative to the raw folder
+        """
+        try:
+            manifest = json.loads(self.inputs_manifest_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        files = []
+        for filepath in manifest.get("libraries", []) + manifest.get("images", []):
+            filepath = Path(self.config.raw_folder)/filepath
+            if filepath.is_file() and filepath not in files: files.append(filepath)
+        return files
+
+    @property
+    def blender_workers(self) -> int:
+        """count of background blender processes reused for exports, 0 - new blender for every file"""
+        return self.config.get("blender_workers", 2, True)
 
-        self.run_program(cmd)
+    @property
+    def blender_worker_max_jobs(self) -> int:
+        return self.config.get("blender_worker_max_jobs", 50, True)
+
+    @property
+    def blender_worker_max_memory_mb(self) -> int:
+        return self.config.get("blender_worker_max_memory_mb", 4096, True)
+
+    def export_using_script(self, blend_export_script:Path):
+        if self.blender_workers > 0:
+            pool = get_blender_pool("blender", self.blender_workers, 
+                self.blender_worker_max_jobs, self.blender_worker_max_memory_mb)
+            out = pool.run_script(self.filepath, blend_export_script, self.thread_budget)
+            if self.config.verbose: print(out)
+        else:
+            cmd = f'blender "{self.filepath.as_posix()}" -b -t {self.thread_budget} --python "{blend_export_script.as_posix()}"'
+            out = self.run_program(cmd)
+        for filepath in parse_derived_files(out):
+            self.add_derived_file(filepath)
+        for filepath in parse_output_files(out):
+            self.add_output(filepath)
 
     @staticmethod
     def get_extensions():
         return ["blend"]
 
+    @staticmethod
+    def get_dependencies():
+        # until its first export writes `inputs_manifest_path`, blend file waits for all images of the batch
+        return ["png", "bmp", "jpg", "jpeg", "psd"]
+
     @staticmethod
     def get_icon() -> Path:
         return CFD/"icons/blender.png"
@@ -14,6 +14,8 @@ from typing import Callable, Generator
 import traceback
 from typing import Type, TypeVar
 from resources_exporter.storable import Storable, PathField
+from resources_exporter.own_writes import own_writes
+from resources_exporter.process_runner import ProcessResult, get_thread_budget, run_process
 from serde import Model, fields
 import shutil
 import subprocess
@@ -68,10 +70,24 @@ class SettingSignature():
 
 class Resource:
     _subclasses = set()
+    # admission control of `ExportScheduler`, can be changed with "export_limits" config:
+    # max parallel exports of this class and its subclasses, 0 - no limit
+    EXPORT_LIMIT = 0
+    # count of workers one export takes
+    EXPORT_WEIGHT = 1
+    # memory one export needs at first, until the real peak is measured
+    EXPORT_MEMORY_MB = 0
+    # outputs depend only on cache inputs, tools and export settings,
+    # so they can be restored from `ArtifactCache` instead of exporting again
+    CACHEABLE = False
 
     def __init__(self, filepath:Path, config:ExportConfig=None) -> None:
         self.filepath = filepath.resolve()
         self.config = config or ExportConfig()
+        # raw files written by the export, that have to be exported after it
+        self.derived_files:typing.List[Path] = []
+        # output files reported by the export, see `collect_outputs`
+        self.outputs:typing.List[Path] = []
 
     @staticmethod
     def _give_subclass(subcls):
@@ -88,20 +104,101 @@ class Resource:
         name += " "*int(max(self._get_max_name_length()-len(name), 0))
         return f"<{name} \"{short_path}\">"
 
-    def run_program(self, cmd):
-        args = shlex.split(cmd)
-        # args = ["chcp", "65001", "&"] + args
-
-        with subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True, universal_newlines=True) as process:
-            out = process.stdout.read()
-            err = process.stderr.read()
-            if self.config.verbose:
-                print(out)
-                print(colored(err, 'red'))
-                # for c in iter(lambda: process.stdout.read(1), b''):
-                #     sys.stdout.write(c.decode('utf-8'))
-            if err: raise Exception(err)
-        return out
+    def run_process(self, args:typing.List[str], timeout:float=None) -> ProcessResult:
+        """
+        runs program without shell, with verbose config its output is printed line by line as it comes.
+        program is killed after *timeout* seconds
+        """
+        on_out_line = on_err_line = None
+        if self.config.verbose:
+            on_out_line = print
+            on_err_line = lambda line: print(colored(line, 'red'))
+        return run_process(args, timeout, on_out_line, on_err_line)
+
+    def run_program(self, cmd, timeout:float=None):
+        """runs *cmd* string, returns its output, raises exception with error output if there is any"""
+        args = shlex.split(cmd) if isinstance(cmd, str) else list(cmd)
+        result = self.run_process(args, timeout)
+        if result.err: raise Exception(result.err)
+        return result.out
+
+    def prepare_export(self, **kwargs):
+        """part of export done before cache lookup, it is done even when outputs are restored from cache"""
+        pass
+
+    def get_cache_inputs(self) -> typing.List[Path]:
+        """files outputs are made from, files which do not exist are a part of cache key too"""
+        return [self.filepath]
+
+    def get_cache_tools(self) -> typing.List[str]:
+        """programs making outputs, their versions are a part of cache key"""
+        return []
+
+    def get_cache_key_extra(self) -> str:
+        """anything else outputs depend on"""
+        return ""
+
+    def get_referenced_files(self) -> typing.List[Path]:
+        """
+        existing raw files this resource uses, like models of a `.qc` file.
+        resource is exported again when one of them changes, and after them.
+        `None` when they are not known yet, then the resource waits for its `get_dependencies` extensions
+        """
+        return []
+
+    def get_possible_outputs(self) -> typing.List[Path]:
+        """files the export can write, the ones it wrote are its outputs"""
+        return [self.dst_filepath]
+
+    def add_output(self, filepath:Path):
+        """output *filepath* was written by this export, for outputs `get_possible_outputs` does not know"""
+        filepath = Path(filepath).resolve()
+        if filepath not in self.outputs:
+            self.outputs.append(filepath)
+
+    def collect_outputs(self, since:float) -> typing.List[Path]:
+        """existing outputs written by this export started at *since* (`time.time()`)"""
+        outputs = [filepath for filepath in self.outputs if filepath.exists()]
+        for filepath in self.get_possible_outputs():
+            fingerprint = utils.file_fingerprint(filepath)
+            # one second for file systems with coarse mtime
+            if fingerprint is None or fingerprint[1] < since - 1.0: continue
+            filepath = Path(filepath).resolve()
+            if filepath not in outputs: outputs.append(filepath)
+        return outputs
+
+    @property
+    def thread_budget(self) -> int:
+        """threads programs of this export can use, budgets of parallel exports add up to cpu cores"""
+        return get_thread_budget()
+
+    @property
+    def magick_thread_args(self) -> str:
+        return f"-limit thread {self.thread_budget}"
+
+    def record_own_write(self, filepath:Path):
+        """observer will ignore changes of raw *filepath* made by this export"""
+        own_writes.record(filepath)
+
+    def writing_own_file(self, filepath:Path):
+        """context to write raw *filepath* in, observer ignores its changes from the start of the write"""
+        return own_writes.writing(filepath)
+
+    def add_derived_file(self, filepath:Path):
+        """raw *filepath* was written by this export and has to be exported after it"""
+        filepath = Path(filepath).resolve()
+        self.record_own_write(filepath)
+        if filepath not in self.derived_files:
+            self.derived_files.append(filepath)
+
+    def discard_outputs(self, since:float):
+        """removes outputs of cancelled export started at *since* (`time.time()`), they can be written partially"""
+        for filepath in self.outputs + self.get_possible_outputs():
+            try:
+                if filepath.exists() and filepath.stat().st_mtime >= since:
+                    filepath.unlink()
+            except Exception:
+                pass
 
     @property
     def dst_filepath(self)->Path:
@@ -123,9 +220,15 @@ class Resource:
     def pure_name(self)->str:
         return self.filepath.with_suffix("").name
 
+    @property
+    def link_copied_files(self) -> bool:
+        """copied outputs can be hardlinks of raw files, when both folders are on one drive"""
+        return self.config.get("link_copied_files", True, True)
+
     def export(self, **kwargs):
-        utils.make_dirs_to_file(self.dst_filepath)
-        shutil.copy(self.filepath, self.dst_filepath)
+        utils.materialize_file(self.filepath, self.dst_filepath, self.link_copied_files)
+        # output keeps modification time of the raw file, so `collect_outputs` does not find it by time
+        self.add_output(self.dst_filepath)
 
     @staticmethod
     def get_extensions():
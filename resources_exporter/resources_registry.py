@@ -89,6 +89,26 @@ class ResourcesRegistry:
         """sorted depending on resources dependencies"""
         return self._get_sorted_extensions(str(self.resource_classes))
 
+    def sort_by_dependencies(self, files:typing.Iterable[Path], dependency_index=None) -> typing.List[Path]:
+        """
+        *files* in `sorted_extensions` order, files of unknown extensions go last.
+        with `DependencyIndex` files referenced by other files of the batch go before them
+        """
+        exts_order = {ext: i for i, ext in enumerate(self.sorted_extensions)}
+        def sort_key(filepath:Path):
+            return exts_order.get(self.__normalize_extension(filepath.suffix), len(exts_order))
+        files = sorted(files, key=sort_key)
+        if dependency_index is not None: files = dependency_index.sort_files(files)
+        return files
+
+    def is_referencing_class(self, res_class:Type[Resource]) -> bool:
+        """resources of *res_class* can reference other raw files, they are in `DependencyIndex`"""
+        return res_class.get_referenced_files is not Resource.get_referenced_files
+
+    @property
+    def referencing_extensions(self) -> typing.List[str]:
+        return [ext for ext, res_class in self.res_classes_ext_map.items() if self.is_referencing_class(res_class)]
+
     @staticmethod
     def __normalize_extension(ext:str):
         ext = utils.normalize_extension(ext)
@@ -0,0 +1,236 @@
+import concurrent.futures
+import heapq
+import os
+from pathlib import Path
+import typing
+from typing import Callable, Type
+
+from .dependency_index import DependencyIndex
+from .process_runner import current_thread_budget
+from .resources_registry import ResourcesRegistry
+from .resource_types.resource_base import Resource
+from . import utils
+
+class ExportJob():
+    """one file to export and jobs it has to wait for"""
+    def __init__(self, filepath:Path, res_class:Type[Resource]=None, index:int=0) -> None:
+        self.filepath:Path = filepath
+        self.res_class:Type[Resource] = res_class
+        # position in the serial export order, ready jobs are started by it
+        self.index:int = index
+        self.dependencies:typing.Set[ExportJob] = set()
+        self.dependents:typing.Set[ExportJob] = set()
+        self.result = None
+        # peak resident memory of the job programs, measured while it runs
+        self.peak_memory:int = 0
+        # threads its programs can use, is set when it starts
+        self.thread_budget:int = 0
+
+    @property
+    def extension(self) -> str:
+        return utils.normalize_extension(self.filepath.suffix)
+
+    def add_dependency(self, job:"ExportJob"):
+        self.dependencies.add(job)
+        job.dependents.add(self)
+
+    def __lt__(self, other:"ExportJob"):
+        return self.index < other.index
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} \"{self.filepath.name}\">"
+
+class ExportLimits():
+    """how many jobs of a resource class can run at once, how much of workers they use and memory they need"""
+    def __init__(self, limit:int=0, weight:int=1, memory_mb:int=0, group:str=None) -> None:
+        # 0 means no limit
+        self.limit:int = limit
+        self.weight:int = max(int(weight), 1)
+        self.memory_mb:int = memory_mb
+        # name of the class which jobs are counted together for `limit`
+        self.group:str = group
+
+class AdmissionControl():
+    """
+    Decides which of ready jobs can start now.
+    Jobs of a resource class run up to its `limit` at once, weights of running jobs are up to workers count.
+    A job with memory estimate waits until free memory, minus memory still reserved by running jobs,
+    is more than the estimate and `min_free_memory_mb`.
+    The estimate is learned from peak memory of finished jobs of the class.
+    Limits come from `EXPORT_LIMIT`, `EXPORT_WEIGHT`, `EXPORT_MEMORY_MB` of resource classes
+    and from *limits_config*: `{class name: limit}` or `{class name: {"limit":, "weight":, "memory_mb":}}`,
+    which applies to subclasses too.
+    Nothing is held when no job is running, so one job always can run.
+    """
+    def __init__(self, limits_config:dict=None, min_free_memory_mb:int=1024, memory_probe:Callable=None,
+            available_memory:Callable=utils.get_available_memory) -> None:
+        self.limits_config:dict = limits_config or {}
+        self.min_free_memory_mb:int = min_free_memory_mb
+        # job -> resident memory of its programs in bytes
+        self.memory_probe:Callable = memory_probe
+        self.available_memory:Callable = available_memory
+        self._limits:typing.Dict[type, ExportLimits] = {}
+        # limits group -> peak memory of its jobs in bytes
+        self._learned_memory:typing.Dict[str, int] = {}
+
+    def get_limits(self, res_class:Type[Resource]) -> ExportLimits:
+        if res_class is None: return ExportLimits()
+        if res_class not in self._limits:
+            limits = ExportLimits(getattr(res_class, "EXPORT_LIMIT", 0), getattr(res_class, "EXPORT_WEIGHT", 1),
+                getattr(res_class, "EXPORT_MEMORY_MB", 0), res_class.__name__)
+            # limit of a base class counts jobs of all its subclasses together
+            for base in res_class.__mro__:
+                if vars(base).get("EXPORT_LIMIT", 0):
+                    limits.group = base.__name__
+                    break
+            for base in reversed(res_class.__mro__):
+                config = self.limits_config.get(base.__name__, None)
+                if config is None: continue
+                if not isinstance(config, dict): config = {"limit": config}
+                if "limit" in config:
+                    limits.limit = int(config["limit"])
+                    limits.group = base.__name__
+                limits.weight = max(int(config.get("weight", limits.weight)), 1)
+                limits.memory_mb = config.get("memory_mb", limits.memory_mb)
+            self._limits[res_class] = limits
+        return self._limits[res_class]
+
+    def get_memory_estimate(self, job:ExportJob) -> int:
+        """bytes of memory *job* is expected to use"""
+        limits = self.get_limits(job.res_class)
+        return self._learned_memory.get(limits.group, int(limits.memory_mb*1024*1024))
+
+    def can_start(self, job:ExportJob, running:typing.List[ExportJob], workers:int) -> bool:
+        if len(running) == 0: return True
+        limits = self.get_limits(job.res_class)
+        if limits.limit > 0:
+            same_group = sum(1 for other in running if self.get_limits(other.res_class).group == limits.group)
+            if same_group >= limits.limit: return False
+        running_weight = sum(self.get_limits(other.res_class).weight for other in running)
+        if running_weight + limits.weight > workers: return False
+
+        estimate = self.get_memory_estimate(job)
+        if estimate > 0:
+            available = self.available_memory()
+            if available is not None:
+                # running jobs have not reached their peak yet
+                reserved = sum(max(self.get_memory_estimate(other) - other.peak_memory, 0) for other in running)
+                if available - reserved < estimate + self.min_free_memory_mb*1024*1024: return False
+        return True
+
+    def sample(self, running:typing.List[ExportJob]):
+        """measures memory of running jobs"""
+        if self.memory_probe is None: return
+        for job in running:
+            job.peak_memory = max(job.peak_memory, self.memory_probe(job) or 0)
+
+    def on_finished(self, job:ExportJob):
+        if job.peak_memory > 0:
+            group = self.get_limits(job.res_class).group
+            self._learned_memory[group] = max(self._learned_memory.get(group, 0), job.peak_memory)
+
+class ExportScheduler():
+    """
+    Runs export jobs on a pool of worker threads.
+    Job graph is built from `Resource.get_dependencies()` of each resource class,
+    files known by *dependency_index* wait only for the files they reference,
+    so a job starts as soon as the jobs it depends on are finished,
+    and *admission* allows it.
+    Every job gets a thread budget for its programs from cores running jobs do not use,
+    while other jobs are ready it gets only its weight share of them. Budgets add up to cpu cores.
+    """
+    # how often memory of running jobs is measured, while some ready jobs are held
+    SAMPLE_INTERVAL = 0.5
+
+    def __init__(self, resources_registry:ResourcesRegistry, export_func:Callable, workers:int=0,
+            admission:AdmissionControl=None, dependency_index:DependencyIndex=None) -> None:
+        self.resources_registry = resources_registry
+        self.export_func:Callable = export_func
+        self.workers:int = max(int(workers or os.cpu_count() or 1), 1)
+        self.admission:AdmissionControl = admission
+        self.dependency_index:DependencyIndex = dependency_index
+
+    def get_thread_budget(self, job:ExportJob, running:typing.Iterable[ExportJob]=(), jobs_ready:bool=False) -> int:
+        """free cores, a share of all cores by job weight when *jobs_ready* to start after it"""
+        cores = os.cpu_count() or 1
+        budget = cores - sum(other.thread_budget for other in running)
+        if jobs_ready:
+            weight = self.admission.get_limits(job.res_class).weight if self.admission else 1
+            budget = min(budget, cores * min(weight, self.workers) // self.workers)
+        return max(budget, 1)
+
+    def _run_job(self, job:ExportJob, thread_budget:int):
+        token = current_thread_budget.set(thread_budget)
+        try:
+            return self.export_func(job.filepath)
+        finally:
+            current_thread_budget.reset(token)
+
+    def build_jobs(self, files:typing.Iterable[Path]) -> typing.List[ExportJob]:
+        """makes a job for every file, files are expected in `sort_by_dependencies` order"""
+        # raises on circular dependencies
+        self.resources_registry.sorted_extensions
+
+        jobs:typing.List[ExportJob] = []
+        jobs_by_ext:typing.Dict[str, typing.List[ExportJob]] = {}
+        for filepath in files:
+            res_class = self.resources_registry.get_res_class_by_filepath(filepath)
+            job = ExportJob(filepath, res_class, len(jobs))
+            jobs.append(job)
+            jobs_by_ext.setdefault(job.extension, []).append(job)
+
+        index = self.dependency_index
+        jobs_by_key = {index.key(job.filepath): job for job in jobs} if index is not None else {}
+        for job in jobs:
+            if job.res_class is None: continue
+            if index is not None and index.is_indexed(job.filepath):
+                # only earlier jobs, so a reference cycle can not block the graph
+                for reference in index.get_references(job.filepath):
+                    dep_job = jobs_by_key.get(index.key(reference), None)
+                    if dep_job is not None and dep_job.index < job.index: job.add_dependency(dep_job)
+                continue
+            for dep_ext in job.res_class.get_dependencies():
+                dep_ext = utils.normalize_extension(dep_ext)
+                if dep_ext == job.extension: continue
+                for dep_job in jobs_by_ext.get(dep_ext, []):
+                    job.add_dependency(dep_job)
+        return jobs
+
+    def run(self, jobs:typing.List[ExportJob], on_started:Callable=None, on_done:Callable=None) -> list:
+        """
+        exports *jobs* and returns their results in the same order as *jobs*.
+        *on_started* and *on_done* are called with a job in the calling thread.
+        """
+        waiting = {job: len(job.dependencies) for job in jobs}
+        ready = [job for job in jobs if waiting[job]==0]
+        heapq.heapify(ready)
+        running:typing.Dict[concurrent.futures.Future, ExportJob] = {}
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while ready or running:
+                held:typing.List[ExportJob] = []
+                while ready and len(running) < self.workers:
+                    job = heapq.heappop(ready)
+                    if self.admission and not self.admission.can_start(job, list(running.values()), self.workers):
+                        held.append(job)
+                        continue
+                    if on_started: on_started(job)
+                    job.thread_budget = self.get_thread_budget(job, running.values(), len(ready) > 0)
+                    running[pool.submit(self._run_job, job, job.thread_budget)] = job
+                for job in held:
+                    heapq.heappush(ready, job)
+
+                timeout = self.SAMPLE_INTERVAL if self.admission and (held or self.admission.memory_probe) else None
+                done, _ = concurrent.futures.wait(running, timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+                if self.admission: self.admission.sample(list(running.values()))
+                for future in sorted(done, key=lambda f: running[f].index):
+                    job = running.pop(future)
+                    job.result = future.result()
+                    if self.admission: self.admission.on_finished(job)
+                    if on_done: on_done(job)
+                    for dependent in job.dependents:
+                        waiting[dependent] -= 1
+                        if waiting[dependent]==0:
+                            heapq.heappush(ready, dependent)
+
+        return [job.result for job in jobs]
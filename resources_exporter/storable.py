@@ -1,27 +1,74 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
 import json
 from pathlib import Path
+from threading import RLock
 from typing import Generator
 from serde import Model, fields
 import traceback
 from typing import Type
 from serde.exceptions import ContextError, add_context
+from . import utils
 
 CFD = Path(__file__).parent.resolve()
 
+# directory that paths are stored relative to, it is set for the current thread while a storable is loading or saving
+_RELATIVE_TO = ContextVar("path_field_relative_to", default=CFD)
+# blocks recursive loading in the current thread
+_LOADING = ContextVar("storable_loading", default=False)
+# storables are written one at a time
+_SAVE_LOCK = RLock()
+
 class PathField(fields.Field):
-    _relative_to = CFD
+    @staticmethod
+    def relative_to() -> Path:
+        return _RELATIVE_TO.get()
+
+    @staticmethod
+    @contextmanager
+    def relative_to_dir(directory:Path):
+        token = _RELATIVE_TO.set(Path(directory))
+        try:
+            yield
+        finally:
+            _RELATIVE_TO.reset(token)
+
     def serialize(self, value):
+        if isinstance(value, StoredPath):
+            value = value.to_path()
         if hasattr(value, "relative_to"):
             try:
-                value = value.relative_to(PathField._relative_to)
+                value = value.relative_to(PathField.relative_to())
             except: pass
             value = value.as_posix()
         return str(value)
     def deserialize(self, value):
-        if (PathField._relative_to / value).exists():
-            return (PathField._relative_to / value).resolve()
+        relative_to = PathField.relative_to()
+        if (relative_to / value).exists():
+            return (relative_to / value).resolve()
         return Path(value).resolve()
 
+class StoredPath():
+    """path string as it was stored and the directory it is relative to"""
+    __slots__ = ("value", "relative_to")
+
+    def __init__(self, value:str, relative_to:Path) -> None:
+        self.value:str = value
+        self.relative_to:Path = relative_to
+
+    def to_path(self) -> Path:
+        path = self.relative_to / self.value
+        if not path.is_absolute(): path = path.resolve()
+        return path
+
+class LazyPathField(PathField):
+    """
+    Deserializes into `StoredPath` without touching the file system,
+    model turns it into `Path` when the path is used.
+    """
+    def deserialize(self, value):
+        return StoredPath(value, PathField.relative_to())
+
 class Storable(Model):
     """Storing class instance to json. Also stores all fields not defined with `serde.fields` and without underscore "_" at the beginning of field name"""
     def __init__(self, _storage_file:Path=None, **kwargs) -> None:
@@ -37,35 +84,34 @@ class Storable(Model):
                 self.save()
         return getattr(self, key, default)
 
-    def tune_path_field(self):
-        PathField._relative_to = self._storage_file.parent
+    def paths_relative_to_storage(self):
+        """context in which `PathField`s are stored relative to the storage file directory"""
+        return PathField.relative_to_dir(self._storage_file.parent)
     
     def load(self):
         """ returns `self`, if the `_storage_file` exists, loads data into itself """
-        self.tune_path_field()
-        loading_key = "___something_is_loading"
-        if getattr(Storable, loading_key, False):
-            return None
-
         # blocking recursion
-        setattr(Storable, loading_key, True)
-        
-        cls = self.__class__
-        if self._storage_file.exists():
-
-            json_string = self._storage_file.read_text(
-                encoding='utf-8')
-            try:
-                data_dict = json.loads(json_string)
-            except:
-                raise Exception("cant load json")
-            instance = cls.from_dict(data_dict)
-            _storage_file = self._storage_file
-            self.__dict__.update(instance.__dict__)
-            self._storage_file = _storage_file
-
-        # unblocking
-        setattr(Storable, loading_key, False)
+        if _LOADING.get():
+            return None
+        token = _LOADING.set(True)
+        try:
+            with self.paths_relative_to_storage():
+                cls = self.__class__
+                if self._storage_file.exists():
+
+                    json_string = self._storage_file.read_text(
+                        encoding='utf-8')
+                    try:
+                        data_dict = json.loads(json_string)
+                    except:
+                        raise Exception("cant load json")
+                    instance = cls.from_dict(data_dict)
+                    _storage_file = self._storage_file
+                    self.__dict__.update(instance.__dict__)
+                    self._storage_file = _storage_file
+        finally:
+            # unblocking
+            _LOADING.reset(token)
 
         return self
     
@@ -116,18 +162,15 @@ class Storable(Model):
         return data_dict
 
     def save(self):
-        self.tune_path_field()
-        data_dict:dict = self.to_dict()
-        for k in list(data_dict.keys()):
-            if k.startswith("_"): data_dict.pop(k)
-        json_string = json.dumps(data_dict, indent=2)
-        try: 
-            if not hasattr(self, "_storage_file"): return False
-            self._storage_file.write_text(
-                json_string,
-                encoding='utf-8')
-            return True
-        except:
-            traceback.print_exc()
-            return False
-
+        with _SAVE_LOCK, self.paths_relative_to_storage():
+            data_dict:dict = self.to_dict()
+            for k in list(data_dict.keys()):
+                if k.startswith("_"): data_dict.pop(k)
+            json_string = json.dumps(data_dict, indent=2)
+            try: 
+                if not hasattr(self, "_storage_file"): return False
+                utils.atomic_write_text(self._storage_file, json_string)
+                return True
+            except:
+                traceback.print_exc()
+                return False
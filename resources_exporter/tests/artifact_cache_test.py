@@ -0,0 +1,90 @@
+import os
+from pathlib import Path
+import threading
+
+from resources_exporter import utils
+from resources_exporter.artifact_cache import ArtifactCache
+
+def write_output(folder:Path, name:str, data:bytes) -> Path:
+    filepath = folder/name
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    filepath.write_bytes(data)
+    return filepath
+
+def test_restore_outputs(tmp_path:Path):
+    cache = ArtifactCache(tmp_path/"cache")
+    out = tmp_path/"out"
+    key = ArtifactCache.make_key(["PhotoshopImage", "a.psd", "hash"])
+    assert key != ArtifactCache.make_key(["PhotoshopImag", "ea.psd", "hash"])
+    assert cache.get(key) is None
+
+    cache.put(key, [write_output(out, "textures/a.png", b"png"), write_output(out, "textures/a.ico", b"ico")], out)
+    for filepath in out.rglob("*.*"): filepath.unlink()
+
+    restored = cache.restore(cache.get(key), out)
+    assert restored == [out/"textures/a.png", out/"textures/a.ico"]
+    assert (out/"textures/a.png").read_bytes() == b"png"
+
+    # a program writing restored file must not change the cache
+    ArtifactCache.unlink_shared(restored)
+    write_output(out, "textures/a.png", b"new png")
+    cache.restore(cache.get(key), out)
+    assert (out/"textures/a.png").read_bytes() == b"png"
+
+def test_prune_least_recently_used(tmp_path:Path):
+    cache = ArtifactCache(tmp_path/"cache")
+    out = tmp_path/"out"
+    keys = [ArtifactCache.make_key([str(i)]) for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.put(key, [write_output(out, f"{i}.bin", bytes([i])*100)], out)
+        os.utime(cache._entry_path(key), (1000+i, 1000+i))
+    # shared output is stored once
+    cache.put(ArtifactCache.make_key(["copy"]), [write_output(out, "copy.bin", bytes([2])*100)], out)
+    assert cache.stats()["objects"] == 3
+
+    cache.get(keys[0])
+    for object_path in (tmp_path/"cache/objects").glob("*/*"):
+        os.utime(object_path, (1000, 1000))
+    removed = cache.prune(250)
+    assert removed == {"entries": 1, "objects": 1, "size": 100}
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None and cache.get(keys[2]) is not None
+
+def test_shared_cache_read_through(tmp_path:Path):
+    shared_root = tmp_path/"team_cache"
+    alice = ArtifactCache(tmp_path/"alice/cache", shared=ArtifactCache(shared_root, 0))
+    bob = ArtifactCache(tmp_path/"bob/cache", shared=ArtifactCache(shared_root, 0))
+    key = ArtifactCache.make_key(["character.blend"])
+    alice_out, bob_out = tmp_path/"alice/out", tmp_path/"bob/out"
+    alice.put(key, [write_output(alice_out, "models/character.mdl", b"mdl")], alice_out)
+
+    entry = bob.get(key)
+    bob.restore(entry, bob_out)
+    assert (bob_out/"models/character.mdl").read_bytes() == b"mdl"
+    # copied into the local cache, so it is found without shared folder
+    assert ArtifactCache(tmp_path/"bob/cache").get(key) == entry
+
+def test_concurrent_publish(tmp_path:Path):
+    shared = ArtifactCache(tmp_path/"team_cache", 0)
+    key = ArtifactCache.make_key(["a.psd"])
+    def publish(name:str):
+        out = tmp_path/name
+        cache = ArtifactCache(tmp_path/name/"cache", shared=shared)
+        for _ in range(20):
+            cache.put(key, [write_output(out, "a.png", b"png"*10000)], out)
+    threads = [threading.Thread(target=publish, args=(f"user{i}",)) for i in range(4)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    assert shared.get(key) == {"outputs": [["a.png", shared.get(key)["outputs"][0][1], 30000]]}
+    assert not list((tmp_path/"team_cache").rglob("*.tmp"))
+
+def test_program_fingerprint_changes_with_content(tmp_path:Path):
+    program = write_output(tmp_path, "studiomdl", b"version 1")
+    fingerprint = utils.get_program_fingerprint(str(program))
+    assert fingerprint.startswith("studiomdl:9:")
+    assert utils.get_program_fingerprint(str(program)) == fingerprint
+    # update with the same size
+    program.write_bytes(b"version 2")
+    os.utime(program, (2000, 2000))
+    assert utils.get_program_fingerprint(str(program)) != fingerprint
+    assert utils.get_program_fingerprint(str(tmp_path/"missing")) == ""
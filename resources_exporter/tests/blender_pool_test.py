@@ -0,0 +1,50 @@
+import os
+from pathlib import Path
+import sys
+import time
+
+import pytest
+
+from resources_exporter.blender_pool import BlenderPool, BlenderWorker, BlenderWorkerError
+
+# answers jobs like blend_worker.py, without blender
+FAKE_BLENDER = '''#!{python}
+import os, sys
+from multiprocessing.connection import Client
+args = sys.argv[sys.argv.index("--")+1:]
+connection = Client(("127.0.0.1", int(args[0])), authkey=bytes.fromhex(args[1]))
+while True:
+    job = connection.recv()
+    if job is None: break
+    err = "failed" if job["blend_file"].endswith("broken.blend") else ""
+    connection.send({{"success": not err, "out": f"{{os.getpid()}} {{job['blend_file']}}", "err": err, "memory": 0}})
+'''
+
+@pytest.fixture
+def fake_blender(tmp_path):
+    if os.name == "nt": pytest.skip("fake blender is a posix script")
+    blender = tmp_path/"blender"
+    blender.write_text(FAKE_BLENDER.format(python=sys.executable))
+    blender.chmod(0o755)
+    return str(blender)
+
+def test_workers_are_reused_and_recycled(fake_blender, tmp_path):
+    pool = BlenderPool(fake_blender, size=1, max_jobs=2)
+    pids = [pool.run_script(tmp_path/f"{i}.blend", tmp_path/"export.py").split()[0] for i in range(3)]
+    # third job goes to a new worker
+    assert pids[0] == pids[1] != pids[2]
+    with pytest.raises(Exception):
+        pool.run_script(tmp_path/"broken.blend", tmp_path/"export.py")
+    pool.shutdown()
+
+def test_crashing_worker_fails_at_once_with_its_output(tmp_path):
+    if os.name == "nt": pytest.skip("fake blender is a posix script")
+    blender = tmp_path/"blender"
+    blender.write_text(f"#!{sys.executable}\nimport sys\nsys.stderr.write('no module named bpy')\nsys.exit(3)\n")
+    blender.chmod(0o755)
+    start = time.perf_counter()
+    with pytest.raises(BlenderWorkerError) as error:
+        BlenderWorker(str(blender)).start()
+    assert time.perf_counter() - start < 10
+    assert "exited with code 3" in str(error.value)
+    assert "no module named bpy" in str(error.value)
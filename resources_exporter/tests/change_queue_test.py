@@ -0,0 +1,36 @@
+from pathlib import Path
+
+from resources_exporter.change_queue import ChangeQueue
+
+def test_duplicates_are_collapsed():
+    queue = ChangeQueue(quiet_period=0.3)
+    for now in [0.0, 0.1, 0.2]:
+        queue.push(Path("a.psd"), now)
+        queue.push(Path("b.smd"), now)
+    assert len(queue) == 2
+    assert queue.pop_batch(now=0.3) == []
+    assert queue.pop_batch(now=0.5) == [Path("a.psd"), Path("b.smd")]
+    assert len(queue) == 0
+
+def test_steady_changes_are_not_delayed_forever():
+    queue = ChangeQueue(quiet_period=0.3, max_delay=1.0)
+    for i in range(10):
+        queue.push(Path(f"file_{i}.png"), i*0.1)
+        assert queue.pop_batch(i*0.1) == []
+    assert len(queue.pop_batch(1.0)) == 10
+
+def test_file_is_held_until_stable(tmp_path):
+    import os
+    psd, png = tmp_path/"a.psd", tmp_path/"b.png"
+    psd.write_bytes(b"header")
+    png.write_bytes(b"png")
+    queue = ChangeQueue(quiet_period=0.3, stable_period=1.0)
+    queue.push(psd, 0.0)
+    queue.push(png, 0.0)
+    assert queue.pop_batch(0.5) == []
+
+    # psd is still being written, png is exported meanwhile
+    psd.write_bytes(b"header and layers")
+    assert queue.pop_batch(1.0) == [png]
+    assert queue.pop_batch(1.5) == []
+    assert queue.pop_batch(2.0) == [psd]
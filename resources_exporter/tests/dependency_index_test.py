@@ -0,0 +1,116 @@
+import json
+import os
+from pathlib import Path
+
+from resources_exporter.dependency_index import DependencyIndex
+from resources_exporter.file_system import FilesRegistry
+from resources_exporter.scheduler import ExportScheduler
+from resources_exporter.tests.scheduler_test import make_registry
+
+def make_files(raw:Path, names):
+    files = []
+    for name in names:
+        filepath = raw/name
+        filepath.write_text(name)
+        files.append(filepath)
+    return files
+
+def test_dependents_order_and_persistence(tmp_path:Path):
+    raw = tmp_path/"raw"
+    raw.mkdir()
+    psd, vmt, smd, qc, vmf = make_files(raw, ["wall.psd", "wall.vmt", "chair.smd", "chair.qc", "map.vmf"])
+    references = {vmt: [psd], qc: [smd], vmf: [vmt, qc]}
+
+    registry = FilesRegistry(_storage_file=tmp_path/"files_registry.json", _root=raw)
+    index = DependencyIndex(tmp_path/"dependency_index.json", registry)
+    assert index.refresh(references.keys(), lambda source: references[source]) == 3
+    assert index.refresh(references.keys(), lambda source: references[source]) == 0
+
+    assert index.get_dependents(psd) == [vmt]
+    assert index.get_all_dependents([psd]) == [vmt, vmf]
+    assert set(index.get_all_dependents([psd, smd])) == {vmt, qc, vmf}
+    # references go first, files without them keep their order
+    assert index.sort_files([vmf, qc, vmt, psd, smd]) == [smd, qc, psd, vmt, vmf]
+    assert index.sort_files([smd, psd]) == [smd, psd]
+
+    index.save()
+    index = DependencyIndex(tmp_path/"dependency_index.json", registry).load()
+    assert index.get_references(vmf) == sorted([vmt, qc])
+    # changed file is parsed again
+    qc.write_text("chair.qc without models")
+    os.utime(qc, (1000, 1000))
+    assert index.is_outdated(qc)
+    index.refresh([qc], lambda source: [])
+    assert index.get_all_dependents([smd]) == []
+
+    # indexed jobs wait only for the files they reference
+    scheduler = ExportScheduler(make_registry(), lambda f: f, 4, dependency_index=index)
+    other_smd, = make_files(raw, ["other.smd"])
+    index.update(qc, [smd])
+    smd_job, other_job, qc_job = scheduler.build_jobs([smd, other_smd, qc])
+    assert qc_job.dependencies == {smd_job}
+
+def test_blend_references_come_from_its_inputs_manifest(tmp_path:Path):
+    from resources_exporter.resource_types.core.models import BlenderModel
+    from resources_exporter.resource_types.resource_base import ExportConfig
+    raw, out = tmp_path/"raw", tmp_path/"out"
+    raw.mkdir()
+    blend, library, psd = make_files(raw, ["car.blend", "parts.blend", "car.psd"])
+    config = ExportConfig()
+    config.raw_folder, config.output_folder = raw, out
+    model = BlenderModel(blend, config)
+    assert model.get_referenced_files() is None
+
+    model.inputs_manifest_path.parent.mkdir(parents=True)
+    # paths are relative to the raw folder, absolute ones are outside of it
+    model.inputs_manifest_path.write_text(json.dumps({"blend_file": "car.blend",
+        "libraries": ["parts.blend"], "images": [psd.as_posix(), "removed.png"]}))
+    assert model.inputs_manifest_path == out/"car.blend.inputs.json"
+    assert model.get_referenced_files() == [library, psd]
+
+def test_blend_without_inputs_manifest_waits_for_images(tmp_path:Path):
+    from resources_exporter.resource_types.core.models import BlenderModel
+    from resources_exporter.resource_types.resource_base import ExportConfig, Resource
+    from resources_exporter.resource_types.plugin import Plugin
+    from resources_exporter.resources_registry import ResourcesRegistry
+    class ImageRes(Resource):
+        @staticmethod
+        def get_extensions():
+            return ["png", "bmp", "jpg", "jpeg", "psd"]
+    plugin = Plugin("test")
+    for res_class in [ImageRes, BlenderModel]:
+        plugin.add_resource(res_class)
+    resources_registry = ResourcesRegistry()
+    resources_registry.add_plugin(plugin)
+
+    raw, out = tmp_path/"raw", tmp_path/"out"
+    raw.mkdir()
+    psd, blend = make_files(raw, ["car.psd", "car.blend"])
+    config = ExportConfig()
+    config.raw_folder, config.output_folder = raw, out
+    registry = FilesRegistry(_storage_file=tmp_path/"files_registry.json", _root=raw)
+    index = DependencyIndex(tmp_path/"dependency_index.json", registry)
+    get_references = lambda source: BlenderModel(source, config).get_referenced_files()
+
+    # fresh blend is not indexed, it waits for images of the batch by extension
+    index.refresh([blend], get_references)
+    assert not index.is_indexed(blend)
+    scheduler = ExportScheduler(resources_registry, lambda f: f, 4, dependency_index=index)
+    psd_job, blend_job = scheduler.build_jobs([psd, blend])
+    assert blend_job.dependencies == {psd_job}
+
+    manifest_path = BlenderModel(blend, config).inputs_manifest_path
+    manifest_path.parent.mkdir(parents=True)
+    manifest_path.write_text(json.dumps({"blend_file": "car.blend", "libraries": [], "images": []}))
+    index.refresh([blend], get_references)
+    assert index.is_indexed(blend)
+    psd_job, blend_job = scheduler.build_jobs([psd, blend])
+    assert blend_job.dependencies == set()
+
+def test_only_vmt_materials_are_indexed():
+    from resources_exporter.plugins.source_game.images_override import SourceMaterialFile, SourceImageResource, SourcePhotoshopImage
+    from resources_exporter.resources_registry import ResourcesRegistry
+    registry = ResourcesRegistry()
+    assert registry.is_referencing_class(SourceMaterialFile)
+    assert not registry.is_referencing_class(SourceImageResource)
+    assert not registry.is_referencing_class(SourcePhotoshopImage)
@@ -1,9 +1,11 @@
 from os import stat_result
+import os
 import mock
 from resources_exporter.exporter import FileInfo
 from pathlib import Path
 
-from resources_exporter.exporter import FilesRegistry
+from resources_exporter.exporter import FilesRegistry, FilesInDirIterator, SQLiteFilesRegistry
+from resources_exporter.file_system import FileInfoTable
 
 def make_stat(mtime=1):
     stat = stat_result((0, 0, 0, 0, 0, 0, 0, 0, mtime, 0))
@@ -34,4 +36,202 @@ def test_res(mocker):
     fileinfo = FileInfo.from_file("file")
     assert fileinfo.is_file_changed() == False
     patch_pathlib_stat(mocker, 2)
-    assert fileinfo.is_file_changed() == True
\ No newline at end of file
+    assert fileinfo.is_file_changed() == True
+
+def test_hash_change_detection(tmp_path):
+    file = tmp_path/"image.psd"
+    file.write_bytes(b"layers")
+    registry = FilesRegistry(_storage_file=tmp_path/"files_registry.json", _change_detection="hash")
+    registry.update_file_info(file)
+    assert registry.is_file_changed(file) == False
+
+    # touched without changing bytes
+    mtime = file.stat().st_mtime + 10
+    os.utime(file, (mtime, mtime))
+    assert registry.is_file_changed(file) == False
+    assert registry.get_file_info(file).mtime == mtime
+
+    # same size, other bytes
+    file.write_bytes(b"LAYERS")
+    os.utime(file, (mtime + 10, mtime + 10))
+    assert registry.is_file_changed(file) == True
+
+def test_hash_stored_in_registry(tmp_path):
+    file = tmp_path/"sound.wav"
+    file.write_bytes(b"wave")
+    storage_file = tmp_path/"files_registry.json"
+    registry = FilesRegistry(_storage_file=storage_file, _change_detection="hash")
+    registry.update_file_info(file)
+    registry.save()
+
+    loaded = FilesRegistry(_storage_file=storage_file, _change_detection="hash").load()
+    info = loaded.get_file_info(file)
+    assert info.hash == registry.get_file_info(file).hash
+    assert info.size == 4
+
+def test_scan_buckets_by_extension(tmp_path):
+    raw = tmp_path/"raw"
+    for name in ["a.png", "models/b.PNG", "models/props/c.blend", "models/props/d.qc", "e.export.json"]:
+        (raw/name).parent.mkdir(parents=True, exist_ok=True)
+        (raw/name).write_text("data")
+
+    iterator = FilesInDirIterator(raw, tmp_path)
+    buckets = iterator.scan()
+    assert sorted(buckets.keys()) == ["blend", "json", "png", "qc"]
+    assert sorted(e.name for e in buckets["png"]) == ["a.png", "b.PNG"]
+
+    changed = list(iterator.iterate_changed_files_of_exts(["qc", "png"]))
+    assert [f.suffix.lower() for f in changed] == [".qc", ".png", ".png"]
+
+    for filepath in changed: iterator.files_registry.update_file_info(filepath)
+    assert list(iterator.iterate_changed_files(ext="png")) == []
+
+def test_journal_survives_crash(tmp_path):
+    storage_file = tmp_path/"files_registry.json"
+    files = []
+    for i in range(3):
+        files.append(tmp_path/f"model_{i}.blend")
+        files[-1].write_text("blend")
+
+    registry = FilesRegistry(_storage_file=storage_file)
+    for file in files: registry.update_file_info(file)
+    # process dies in the middle of writing next record
+    registry.close_journal()
+    with open(registry.journal_file, "a") as journal: journal.write('{"key": "torn')
+
+    loaded = FilesRegistry(_storage_file=storage_file).load()
+    assert all(loaded.get_file_info(file) is not None for file in files)
+
+def test_compaction_removes_missing_files(tmp_path):
+    raw = tmp_path/"raw"
+    raw.mkdir()
+    kept, removed = raw/"kept.png", raw/"removed.png"
+    kept.write_text("png"); removed.write_text("png")
+    iterator = FilesInDirIterator(raw, tmp_path)
+    registry = iterator.files_registry
+    registry.update_file_info(kept)
+    registry.update_file_info(removed)
+    removed.unlink()
+    iterator.scan()
+    iterator.save()
+
+    assert registry.journal_file.read_text() == ""
+    loaded = FilesRegistry(_storage_file=registry._storage_file, _root=raw).load()
+    assert loaded.get_file_info(kept) is not None
+    assert loaded.get_file_info(removed) is None
+
+def test_clean_registry_is_not_written(tmp_path):
+    storage_file = tmp_path/"files_registry.json"
+    file = tmp_path/"a.png"
+    file.write_text("png")
+    registry = FilesRegistry(_storage_file=storage_file)
+    registry.update_file_info(file)
+    registry.save()
+    os.utime(storage_file, (1000, 1000))
+
+    registry = FilesRegistry(_storage_file=storage_file).load()
+    assert registry.is_file_changed(file) == False
+    registry.save()
+    assert storage_file.stat().st_mtime == 1000
+
+def test_file_info_table():
+    table = FileInfoTable()
+    table.set("/raw/a/1.png", 1.0, 10, "ab"*16)
+    table.set("/raw/a/2.png", 2.0)
+    table.set("/raw/b/3.png", 3.0)
+    table.set("/raw/a/2.png", 4.0, 20)
+    assert len(table) == 3
+    assert table.get("/raw/a/1.png").hash == "ab"*16
+    assert table.get("/raw/a/2.png").mtime == 4.0
+    table.remove("/raw/a/1.png")
+    assert "/raw/a/1.png" not in table
+    assert table.get("/raw/b/3.png").filepath == Path("/raw/b/3.png")
+    assert sorted(table.keys()) == ["/raw/a/2.png", "/raw/b/3.png"]
+    d = table.to_dict(lambda key: key[len("/raw/"):])
+    assert d["/raw/b/3.png"]["filepath"] == "b/3.png"
+    assert FileInfoTable.from_dict(d).get("/raw/a/2.png").size == 20
+
+def test_sqlite_backend(tmp_path):
+    raw = tmp_path/"raw"
+    (raw/"models").mkdir(parents=True)
+    files = [raw/"a.png", raw/"models/b.blend", raw/"models/c.qc"]
+    for file in files: file.write_text("data")
+
+    iterator = FilesInDirIterator(raw, tmp_path, backend="sqlite")
+    with iterator.files_registry.batch():
+        for file in iterator.iterate_changed_files():
+            iterator.update_file_info(file)
+    assert list(iterator.iterate_changed_files()) == []
+
+    under_models = iterator.files_registry.iterate_file_infos_under(raw/"models")
+    assert sorted(info.filepath.name for info in under_models) == ["b.blend", "c.qc"]
+    iterator.files_registry.close()
+
+    loaded = SQLiteFilesRegistry(_storage_file=tmp_path/"files_registry.sqlite", _root=raw).load()
+    assert loaded.get_file_info(files[0]) is not None
+    loaded.close()
+
+def test_sqlite_migrates_json_registry(tmp_path):
+    file = tmp_path/"a.png"
+    file.write_text("png")
+    json_registry = FilesRegistry(_storage_file=tmp_path/"files_registry.json")
+    json_registry.update_file_info(file)
+    json_registry.save()
+
+    registry = SQLiteFilesRegistry(_storage_file=tmp_path/"files_registry.sqlite").load()
+    assert registry.get_file_info(file).mtime == json_registry.get_file_info(file).mtime
+    assert registry.is_file_changed(file) == False
+    registry.close()
+
+def test_registries_load_concurrently(tmp_path):
+    import threading
+    storage_files = []
+    for i in range(4):
+        project = tmp_path/f"project_{i}"
+        (project/"raw").mkdir(parents=True)
+        file = project/"raw"/"a.png"
+        file.write_text("png")
+        registry = FilesRegistry(_storage_file=project/"files_registry.json")
+        registry.update_file_info(file)
+        registry.save()
+        storage_files.append(project/"files_registry.json")
+
+    loaded = {}
+    def load(storage_file):
+        for _ in range(20):
+            loaded[storage_file] = FilesRegistry(_storage_file=storage_file).load()
+    threads = [threading.Thread(target=load, args=(f,)) for f in storage_files]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+
+    for storage_file in storage_files:
+        info = loaded[storage_file].get_file_info(storage_file.parent/"raw"/"a.png")
+        assert info.filepath == (storage_file.parent/"raw"/"a.png").resolve()
+
+def test_moved_project_keeps_registry(tmp_path):
+    import shutil
+    project = tmp_path/"project"
+    (project/"raw"/"models").mkdir(parents=True)
+    file = project/"raw"/"models"/"a.blend"
+    file.write_text("blend")
+    iterator = FilesInDirIterator(project/"raw", project)
+    iterator.update_file_info(file)
+    iterator.save()
+
+    moved = tmp_path/"moved"
+    shutil.copytree(project, moved)
+    shutil.rmtree(project)
+    iterator = FilesInDirIterator(moved/"raw", moved)
+    assert list(iterator.iterate_changed_files()) == []
+
+def test_import_registry_of_another_machine(tmp_path):
+    raw = tmp_path/"raw"
+    raw.mkdir()
+    file = raw/"a.png"
+    file.write_text("png")
+    old_registry = FilesRegistry(_storage_file=tmp_path/"old_registry.json")
+    old_registry.put_file_info("D:/work/raw/a.png", FileInfo.from_file(file))
+
+    registry = FilesRegistry(_storage_file=tmp_path/"files_registry.json", _root=raw)
+    assert registry.import_from(old_registry, "D:\\work\\raw") == 1
+    assert registry.is_file_changed(file) == False
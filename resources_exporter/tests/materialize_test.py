@@ -0,0 +1,26 @@
+import os
+from pathlib import Path
+
+from resources_exporter import utils
+
+def test_materialized_file_is_not_written_again(tmp_path:Path):
+    src, dst = tmp_path/"raw/music.ogg", tmp_path/"out/sounds/music.ogg"
+    src.parent.mkdir()
+    src.write_bytes(b"ogg"*1000)
+
+    assert utils.materialize_file(src, dst) in ("reflink", "hardlink", "copy")
+    assert dst.read_bytes() == src.read_bytes()
+    assert dst.stat().st_mtime == src.stat().st_mtime
+    assert utils.materialize_file(src, dst) == "unchanged"
+
+    # copy with other mtime is compared by content once, then it gets the raw file mtime
+    dst.unlink()
+    dst.write_bytes(src.read_bytes())
+    assert utils.materialize_file(src, dst, allow_hardlink=False) == "unchanged"
+    assert dst.stat().st_mtime == src.stat().st_mtime
+
+    src.write_bytes(b"wave"*1000)
+    assert utils.materialize_file(src, dst, allow_hardlink=False) in ("reflink", "copy")
+    assert dst.read_bytes() == b"wave"*1000
+    assert not os.path.samefile(src, dst)
+    assert [path.name for path in dst.parent.iterdir()] == ["music.ogg"]
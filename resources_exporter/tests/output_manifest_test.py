@@ -0,0 +1,34 @@
+import os
+from pathlib import Path
+
+from resources_exporter.output_manifest import OutputManifest
+
+def test_changed_outputs_and_orphans(tmp_path:Path):
+    raw, out = tmp_path/"raw", tmp_path/"out"
+    (raw/"models").mkdir(parents=True)
+    (out/"models").mkdir(parents=True)
+    blend, psd = raw/"models/car.blend", raw/"models/car.psd"
+    blend.write_bytes(b"blend")
+    psd.write_bytes(b"psd")
+    glb, tscn, png = out/"models/car.glb", out/"models/car.tscn", out/"models/car.png"
+    for output in [glb, tscn, png]: output.write_bytes(output.suffix.encode())
+
+    manifest = OutputManifest(tmp_path/"outputs_manifest.json", raw, out)
+    manifest.set_outputs(blend, [glb, tscn])
+    manifest.set_outputs(psd, [png])
+    manifest.save()
+    manifest = OutputManifest(tmp_path/"outputs_manifest.json", raw, out).load()
+    assert manifest.get_outputs(blend) == [glb.resolve(), tscn.resolve()]
+    assert manifest.get_changed_outputs(blend) == []
+
+    # touched with the same content is not a change
+    os.utime(glb, (1000, 1000))
+    assert manifest.get_changed_outputs(blend) == []
+    tscn.write_bytes(b"edited")
+    os.utime(tscn, (1000, 1000))
+    assert manifest.get_changed_outputs(blend) == [tscn.resolve()]
+    png.unlink()
+    assert manifest.get_changed_outputs(psd) == [png.resolve()]
+
+    blend.unlink()
+    assert manifest.find_orphans() == {blend.resolve(): [glb.resolve(), tscn.resolve()]}
@@ -0,0 +1,37 @@
+import os
+from pathlib import Path
+
+from resources_exporter import utils
+from resources_exporter.resource_types.core.blender_export import output_writer
+from resources_exporter.resource_types.core.blender_export.output_writer import OutputWriter
+
+def test_unchanged_file_is_not_rewritten(tmp_path:Path):
+    writer = OutputWriter()
+    filepath = tmp_path/"materials/wall.tres"
+    assert writer.write_text(filepath, "[gd_resource]\n", "utf-8")
+    os.utime(filepath, (1000, 1000))
+
+    assert not writer.write_text(filepath, "[gd_resource]\n", "utf-8")
+    assert filepath.stat().st_mtime == 1000
+    # same size, other content
+    assert writer.write_text(filepath, "[gd_resourcf]\n", "utf-8")
+    assert filepath.stat().st_mtime != 1000
+    assert writer.write_bytes(filepath, b"longer content")
+    assert filepath.read_bytes() == b"longer content"
+    assert writer.take_counts() == (3, 1)
+    assert writer.take_counts() == (0, 0)
+    assert [path.name for path in filepath.parent.iterdir()] == ["wall.tres"]
+
+def test_written_files_keep_mode(tmp_path:Path):
+    writer = OutputWriter()
+    new_file, existing_file = tmp_path/"new.tres", tmp_path/"existing.qc"
+    writer.write_text(new_file, "new")
+    utils.atomic_write_text(tmp_path/"new.json", "{}")
+    existing_file.write_text("old")
+    os.chmod(existing_file, 0o640)
+    writer.write_text(existing_file, "changed")
+    if os.name == "nt": return
+    # not 0600 of temporary files
+    assert new_file.stat().st_mode & 0o777 == 0o666 & ~output_writer._UMASK
+    assert (tmp_path/"new.json").stat().st_mode & 0o777 == 0o666 & ~output_writer._UMASK
+    assert existing_file.stat().st_mode & 0o777 == 0o640
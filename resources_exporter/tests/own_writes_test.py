@@ -0,0 +1,36 @@
+from pathlib import Path
+
+from resources_exporter.own_writes import OwnWrites, parse_derived_files
+
+def test_own_write_echo_is_recognized(tmp_path):
+    own_writes = OwnWrites()
+    qc = tmp_path/"model.qc"
+    qc.write_text("$modelname model")
+    own_writes.record(qc)
+    assert own_writes.is_own_write(qc)
+    # observer may report the same write several times
+    assert own_writes.is_own_write(qc)
+
+    qc.write_text("$modelname model edited by user")
+    assert not own_writes.is_own_write(qc)
+    assert not own_writes.is_own_write(tmp_path/"other.qc")
+
+def test_changes_while_writing_are_own_writes(tmp_path):
+    own_writes = OwnWrites()
+    qc = tmp_path/"model.qc"
+    qc.write_text("$modelname model")
+    with own_writes.writing(qc):
+        qc.write_text("$modelname model\n$cdmaterials models")
+        # observer event can come before the write is recorded
+        assert own_writes.is_own_write(qc)
+    assert own_writes.is_own_write(qc)
+    qc.write_text("$modelname model edited by user")
+    assert not own_writes.is_own_write(qc)
+
+def test_parse_derived_files():
+    output = "\n".join([
+        "exporting collection...",
+        'resources_exporter: derived file "/raw/models/box.smd"',
+        'resources_exporter: derived file "/raw/models/box.qc"',
+    ])
+    assert parse_derived_files(output) == [Path("/raw/models/box.smd"), Path("/raw/models/box.qc")]
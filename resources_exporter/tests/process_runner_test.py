@@ -0,0 +1,45 @@
+import asyncio
+import sys
+import threading
+import time
+
+import pytest
+
+from resources_exporter.process_runner import CancelToken, CancelledError, ProcessTimeoutError, current_cancel_token, run_process, run_process_async
+
+# fills stderr pipe before writing stdout, reading pipes one by one would block
+CHATTY_PROGRAM = "import sys; sys.stderr.write('e'*1000000); print('done')"
+
+def test_both_pipes_are_drained():
+    lines = []
+    result = run_process([sys.executable, "-c", CHATTY_PROGRAM], timeout=30, on_out_line=lines.append)
+    assert result.returncode == 0
+    assert len(result.err) == 1000000
+    assert lines == ["done"]
+
+def test_timeout_kills_program():
+    with pytest.raises(ProcessTimeoutError) as error:
+        run_process([sys.executable, "-c", "import time; time.sleep(30)"], timeout=0.5)
+    assert error.value.result.killed
+    assert error.value.result.duration < 10
+
+def test_async_run():
+    result = asyncio.run(run_process_async([sys.executable, "-c", CHATTY_PROGRAM], timeout=30))
+    assert result.out == "done\n"
+    assert len(result.err) == 1000000
+
+def test_cancel_kills_program_with_children():
+    # child keeps the pipes open, they are closed only if the whole tree is killed
+    program = "import subprocess, sys, time; subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)']); time.sleep(30)"
+    cancel_token = CancelToken()
+    threading.Timer(0.5, cancel_token.cancel, args=("superseded",)).start()
+    token_context = current_cancel_token.set(cancel_token)
+    try:
+        start = time.perf_counter()
+        with pytest.raises(CancelledError):
+            run_process([sys.executable, "-c", program])
+        assert time.perf_counter() - start < 5
+        with pytest.raises(CancelledError):
+            run_process([sys.executable, "-c", "print()"])
+    finally:
+        current_cancel_token.reset(token_context)
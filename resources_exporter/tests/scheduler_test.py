@@ -0,0 +1,106 @@
+from pathlib import Path
+import threading
+import time
+
+from resources_exporter.resources_registry import ResourcesRegistry
+from resources_exporter.resource_types.plugin import Plugin
+from resources_exporter.resource_types.resource_base import Resource
+from resources_exporter.process_runner import get_thread_budget
+from resources_exporter.scheduler import AdmissionControl, ExportJob, ExportScheduler
+
+class SmdRes(Resource):
+    @staticmethod
+    def get_extensions():
+        return ["smd"]
+
+class QcRes(Resource):
+    @staticmethod
+    def get_extensions():
+        return ["qc"]
+    @staticmethod
+    def get_dependencies():
+        return ["smd"]
+
+class PngRes(Resource):
+    @staticmethod
+    def get_extensions():
+        return ["png"]
+
+def make_registry():
+    plugin = Plugin("test")
+    for res_class in [SmdRes, QcRes, PngRes]:
+        plugin.add_resource(res_class)
+    registry = ResourcesRegistry()
+    registry.add_plugin(plugin)
+    return registry
+
+def test_jobs_graph():
+    scheduler = ExportScheduler(make_registry(), lambda f: f, 4)
+    jobs = scheduler.build_jobs([Path("a.smd"), Path("b.smd"), Path("a.qc"), Path("a.png")])
+    smd_a, smd_b, qc, png = jobs
+    assert qc.dependencies == {smd_a, smd_b}
+    assert len(png.dependencies) == 0
+    assert len(smd_a.dependencies) == 0
+
+def test_dependent_waits_and_results_order():
+    finished = []
+    lock = threading.Lock()
+    def export(filepath:Path):
+        if filepath.suffix == ".smd": time.sleep(0.05)
+        with lock: finished.append(filepath.name)
+        return filepath.name
+
+    scheduler = ExportScheduler(make_registry(), export, 4)
+    files = [Path("a.smd"), Path("b.smd"), Path("a.qc"), Path("a.png")]
+    results = scheduler.run(scheduler.build_jobs(files))
+
+    assert results == ["a.smd", "b.smd", "a.qc", "a.png"]
+    # png does not wait for smd bucket, qc waits for both smd files
+    assert finished.index("a.png") < finished.index("a.smd")
+    assert finished.index("a.qc") > finished.index("b.smd")
+
+def test_admission_limits_and_memory():
+    class HeavyRes(PngRes):
+        EXPORT_LIMIT = 1
+        EXPORT_MEMORY_MB = 100
+    class HeavierRes(HeavyRes):
+        pass
+    available = [10**12]
+    admission = AdmissionControl({"QcRes": {"weight": 3}}, min_free_memory_mb=0, available_memory=lambda: available[0])
+    heavy, heavier, qc, smd = (ExportJob(Path(name), res_class) for name, res_class in
+        [("a.png", HeavyRes), ("b.png", HeavierRes), ("a.qc", QcRes), ("a.smd", SmdRes)])
+
+    # limit of base class counts its subclasses
+    assert not admission.can_start(heavier, [heavy], 4)
+    assert admission.can_start(smd, [heavy], 4)
+    # weights of running jobs are up to workers count
+    assert not admission.can_start(qc, [heavy, smd], 4)
+    assert admission.can_start(qc, [heavy], 4)
+    # one job always can run
+    assert admission.can_start(qc, [], 2)
+
+    # memory still needed by running job is reserved
+    available[0] = 150*1024*1024
+    assert not admission.can_start(heavier, [smd, heavy], 8)
+    heavy.peak_memory = 80*1024*1024
+    admission.on_finished(heavy)
+    assert admission.get_memory_estimate(heavier) == 80*1024*1024
+    assert admission.can_start(heavier, [smd], 8)
+
+def test_thread_budgets_add_up_to_cores(mocker):
+    mocker.patch("os.cpu_count", return_value=8)
+    budgets = {}
+    def export(filepath:Path):
+        budgets[filepath.name] = get_thread_budget()
+    admission = AdmissionControl({"QcRes": {"weight": 2}}, available_memory=lambda: None)
+    scheduler = ExportScheduler(make_registry(), export, 4, admission)
+    scheduler.run(scheduler.build_jobs([Path("a.png"), Path("a.qc")]))
+    # png gets its weight share while qc is ready, the last ready job gets the free cores
+    assert budgets == {"a.png": 2, "a.qc": 6}
+    assert get_thread_budget() == 8
+
+    # a lone job uses all cores
+    budgets.clear()
+    scheduler = ExportScheduler(make_registry(), export, 0)
+    scheduler.run(scheduler.build_jobs([Path("a.qc")]))
+    assert budgets == {"a.qc": 8}
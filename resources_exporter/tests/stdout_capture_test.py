@@ -0,0 +1,31 @@
+from io import StringIO
+import sys
+import threading
+
+from resources_exporter import utils
+from resources_exporter.process_runner import run_process
+
+def test_parallel_tasks_capture_own_prints(monkeypatch):
+    monkeypatch.setattr(sys, "stdout", StringIO())
+    logs = {}
+    barrier = threading.Barrier(2)
+    def task(name:str):
+        with utils.StdoutSplitter.context() as splitter:
+            barrier.wait()
+            for i in range(100): print(name, i)
+            # output of programs is printed by reader threads
+            run_process([sys.executable, "-c", f"print('child of {name}')"], on_out_line=print)
+            logs[name] = splitter.read()
+
+    threads = [threading.Thread(target=task, args=(name,)) for name in ["a", "b"]]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    print("not captured")
+
+    for name in ["a", "b"]:
+        lines = logs[name].splitlines()
+        assert len(lines) == 101
+        assert all(line.startswith(name) or line == f"child of {name}" for line in lines)
+    # read text goes on to the default stream
+    default = utils.StdoutRouter.install().default.getvalue()
+    assert "child of a" in default and default.endswith("not captured\n")
@@ -1,12 +1,17 @@
 from contextlib import contextmanager
+import contextvars
 from dataclasses import replace
 from io import StringIO
 import os
 from pathlib import Path
+import hashlib
 import importlib
 import inspect
 import re
+import shutil
 import sys
+import tempfile
+import threading
 import traceback
 import typing
 import subprocess
@@ -14,19 +19,103 @@ import subprocess
 CFD = Path(__file__).parent.resolve()
 CWD = Path(os.getcwd()).resolve()
 
-class StdoutSplitter():
+# stream capturing prints of the current task, threads and asyncio tasks with copied context write into it too
+current_stdout_target:contextvars.ContextVar = contextvars.ContextVar("current_stdout_target", default=None)
+
+class StdoutRouter():
+    """
+    `sys.stdout` replacement, is installed once. Writes into a stream captured by the current task,
+    or into the `default` stream if task captured nothing.
+    """
+    def __init__(self, default) -> None:
+        self.default = default
+
+    @property
+    def target(self):
+        return current_stdout_target.get() or self.default
+
+    def write(self, text):
+        return self.target.write(text)
+
+    def flush(self):
+        return self.target.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.target, name)
+
+    @staticmethod
+    def install() -> "StdoutRouter":
+        if not isinstance(sys.stdout, StdoutRouter):
+            sys.stdout = StdoutRouter(sys.stdout)
+        return sys.stdout
+
+class CapturedStream():
+    """text stream, which can be written by many threads while it is read"""
     def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._stream = StringIO()
+
+    def write(self, text:str):
+        with self._lock:
+            self._stream.seek(0, os.SEEK_END)
+            return self._stream.write(text)
+
+    def flush(self):
+        pass
+
+    def read_from(self, index:int) -> str:
+        with self._lock:
+            self._stream.seek(index)
+            return self._stream.read()
+
+    def getvalue(self) -> str:
+        with self._lock:
+            return self._stream.getvalue()
+
+    def setvalue(self, text:str):
+        with self._lock:
+            self._stream = StringIO(text)
+
+class StdoutSplitter():
+    """
+    Captures stdout into its own stream, `read` passes captured text further.
+    With *task_only* captures only prints of the current task: its thread or asyncio task,
+    else becomes the default stream for prints of all tasks which captured nothing.
+    """
+    def __init__(self, task_only=False) -> None:
         self.old_stdout=None
-        self.stream = StringIO()
+        self.task_only = task_only
+        self.stream = CapturedStream()
         self.stdout_read_indx = 0
+        self._context_token = None
         self.capture_stdout()
 
     def capture_stdout(self):
-        self.old_stdout = sys.stdout
-        sys.stdout = self.stream
+        router = StdoutRouter.install()
+        if self.task_only:
+            self.old_stdout = current_stdout_target.get()
+            self._context_token = current_stdout_target.set(self.stream)
+        else:
+            self.old_stdout = router.default
+            router.default = self.stream
 
     def release_stdout(self):
-        sys.stdout = self.old_stdout
+        router = StdoutRouter.install()
+        if self.task_only:
+            if self._context_token is None: return
+            try:
+                current_stdout_target.reset(self._context_token)
+            except ValueError:
+                # released from another context, the task is gone already
+                pass
+            self._context_token = None
+        elif router.default is self.stream:
+            router.default = self.old_stdout
+
+    @property
+    def next_stdout(self):
+        """where captured text goes after `read`"""
+        return self.old_stdout or StdoutRouter.install().default
 
     def __del__(self):
         self.release_stdout()
@@ -34,6 +123,7 @@ class StdoutSplitter():
     def process_caret_return(self):
         text = self.stream.getvalue()
         cr_pos = text.rfind("\r")
+        if cr_pos==-1: return
         if cr_pos==0: return
         if cr_pos==len(text)-1: return
         if text[cr_pos+1] == "\n": return
@@ -42,16 +132,12 @@ class StdoutSplitter():
             text = text[cr_pos:].replace("\r","")
         else:
             text = text[:nl_pos]+"\n"+text[cr_pos:].replace("\r","")
-            
-        self.stream = StringIO(text)
-        self.release_stdout()
-        self.capture_stdout()
+        self.stream.setvalue(text)
 
     def read(self):
-        self.stream.seek(self.stdout_read_indx)
-        text = self.stream.read()
+        text = self.stream.read_from(self.stdout_read_indx)
         self.stdout_read_indx += len(text)
-        self.old_stdout.write(text)
+        self.next_stdout.write(text)
         return text
 
     def read_all(self):
@@ -62,9 +148,12 @@ class StdoutSplitter():
     @staticmethod
     @contextmanager
     def context():
-        splitter = StdoutSplitter()
-        yield splitter
-        del splitter
+        """captures prints of the current task"""
+        splitter = StdoutSplitter(task_only=True)
+        try:
+            yield splitter
+        finally:
+            splitter.release_stdout()
 
 def find_classes_in_dir(directory:Path, base_class=object):
     directory = Path(directory)
@@ -106,6 +195,195 @@ def strfdelta(tdelta):
 def make_dirs_to_file(filepath:Path):
     filepath.parent.mkdir(parents=True, exist_ok=True)
 
+# `output_writer` is shared with scripts running in blender, it is imported when used,
+# importing it with utils would import resource types, which import utils
+
+def set_replacing_file_mode(tmp_path, filepath):
+    """*tmp_path* gets mode of *filepath* it replaces, see `output_writer.set_replacing_file_mode`"""
+    from .resource_types.core.blender_export import output_writer
+    output_writer.set_replacing_file_mode(tmp_path, filepath)
+
+def atomic_write_bytes(filepath:Path, data:bytes):
+    """writes *data* into a temporary file nearby and replaces *filepath* with it, so *filepath* is never half-written"""
+    from .resource_types.core.blender_export import output_writer
+    output_writer.atomic_write_bytes(filepath, data)
+
+def atomic_write_text(filepath:Path, text:str, encoding="utf-8"):
+    atomic_write_bytes(filepath, text.encode(encoding))
+
+def file_fingerprint(filepath:Path) -> typing.Tuple[int, float]:
+    """(size, mtime) of file, `None` if it does not exist"""
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime
+
+def file_hash(filepath:Path, chunk_size:int=1024*1024) -> str:
+    """blake2b hex digest of file content"""
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(filepath, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def get_program_fingerprint(program:str) -> str:
+    """
+    identifies installed version of *program* by name and content hash of its executable without running it,
+    so it is the same on other machines with the same version. `""` if it is not found.
+    hash is cached while size and modification time of the executable are the same
+    """
+    path = shutil.which(program) or (program if os.path.isfile(program) else None)
+    if path is None: return ""
+    path = Path(path).resolve()
+    fingerprint = file_fingerprint(path)
+    if fingerprint is None: return ""
+    cached = _program_fingerprints.get(path, None)
+    if cached is None or cached[0] != fingerprint:
+        cached = (fingerprint, f"{path.name}:{fingerprint[0]}:{file_hash(path)}")
+        _program_fingerprints[path] = cached
+    return cached[1]
+# resolved executable -> ((size, mtime), fingerprint)
+_program_fingerprints:typing.Dict[Path, tuple] = {}
+
+def is_same_file_content(src:Path, dst:Path) -> bool:
+    """
+    compares size, then identity and modification time, content is hashed only when they differ.
+    *dst* with the same content gets modification time of *src*, so next time it is not hashed
+    """
+    try:
+        src_stat, dst_stat = os.stat(src), os.stat(dst)
+    except OSError:
+        return False
+    if src_stat.st_size != dst_stat.st_size: return False
+    if os.path.samestat(src_stat, dst_stat) or src_stat.st_mtime == dst_stat.st_mtime: return True
+    if file_hash(src) != file_hash(dst): return False
+    try: os.utime(dst, (dst_stat.st_atime, src_stat.st_mtime))
+    except OSError: pass
+    return True
+
+# FICLONE ioctl of linux, makes a copy-on-write clone on btrfs, xfs and other file systems supporting it
+_FICLONE = 0x40049409
+
+def _reflink_file(src:Path, dst:Path) -> bool:
+    if not sys.platform.startswith("linux"): return False
+    import fcntl
+    try:
+        with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+            fcntl.ioctl(dst_file.fileno(), _FICLONE, src_file.fileno())
+        return True
+    except OSError:
+        return False
+
+def _copy_file_in_kernel(src:Path, dst:Path):
+    """`copy_file_range` where it is, else `shutil.copyfile`, which uses `sendfile` or system copy calls"""
+    if hasattr(os, "copy_file_range"):
+        try:
+            with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+                left = os.fstat(src_file.fileno()).st_size
+                while left > 0:
+                    copied = os.copy_file_range(src_file.fileno(), dst_file.fileno(), left)
+                    if copied == 0: break
+                    left -= copied
+            return
+        except OSError:
+            pass
+    shutil.copyfile(src, dst)
+
+def materialize_file(src:Path, dst:Path, allow_hardlink=True) -> str:
+    """
+    makes *dst* a copy of *src* and returns how: `"unchanged"` when *dst* already has the same content,
+    else `"reflink"`, `"hardlink"` if *allow_hardlink* and both are on one drive, or `"copy"`.
+    *dst* is replaced with a rename, so it is never half-written, and keeps modification time of *src*
+    """
+    src, dst = Path(src), Path(dst)
+    if is_same_file_content(src, dst): return "unchanged"
+    make_dirs_to_file(dst)
+    fd, tmp_path = tempfile.mkstemp(prefix="."+dst.name+".", suffix=".tmp", dir=dst.parent)
+    os.close(fd)
+    try:
+        method = None
+        if _reflink_file(src, tmp_path): method = "reflink"
+        elif allow_hardlink:
+            os.remove(tmp_path)
+            try:
+                os.link(src, tmp_path)
+                method = "hardlink"
+            except OSError:
+                pass
+        if method is None:
+            _copy_file_in_kernel(src, tmp_path)
+            method = "copy"
+        if method != "hardlink": shutil.copystat(src, tmp_path)
+        os.replace(tmp_path, dst)
+    except:
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+        raise
+    return method
+
+def get_available_memory() -> int:
+    """bytes of memory available for new processes, `None` if unknown"""
+    try:
+        import psutil
+        return psutil.virtual_memory().available
+    except ImportError:
+        pass
+    if sys.platform.startswith("linux"):
+        try:
+            with open("/proc/meminfo") as meminfo:
+                for line in meminfo:
+                    if line.startswith("MemAvailable:"): return int(line.split()[1])*1024
+        except OSError:
+            pass
+    elif os.name == "nt":
+        import ctypes
+        class MEMORYSTATUSEX(ctypes.Structure):
+            _fields_ = [("dwLength", ctypes.c_ulong), ("dwMemoryLoad", ctypes.c_ulong),
+                ("ullTotalPhys", ctypes.c_ulonglong), ("ullAvailPhys", ctypes.c_ulonglong),
+                ("ullTotalPageFile", ctypes.c_ulonglong), ("ullAvailPageFile", ctypes.c_ulonglong),
+                ("ullTotalVirtual", ctypes.c_ulonglong), ("ullAvailVirtual", ctypes.c_ulonglong),
+                ("ullAvailExtendedVirtual", ctypes.c_ulonglong)]
+        status = MEMORYSTATUSEX()
+        status.dwLength = ctypes.sizeof(status)
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return status.ullAvailPhys
+    return None
+
+def get_process_memory(pid:int) -> int:
+    """resident memory of process in bytes, `None` if unknown"""
+    try:
+        import psutil
+        try: return psutil.Process(pid).memory_info().rss
+        except psutil.Error: return None
+    except ImportError:
+        pass
+    if sys.platform.startswith("linux"):
+        try:
+            with open(f"/proc/{pid}/statm") as statm:
+                return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            return None
+    elif os.name == "nt":
+        import ctypes
+        from ctypes import wintypes
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+        PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+        handle = ctypes.windll.kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not handle: return None
+        try:
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+                return counters.WorkingSetSize
+        finally:
+            ctypes.windll.kernel32.CloseHandle(handle)
+    return None
+
 def cut_path(path, max_size=5):
     if not path:
         return path